@@ -4,8 +4,11 @@ from .config.config import Config, config
 from .routes import register_routes
 from .models import init_db
 from .extensions import init_extensions
+from .services.job_service import ensure_workers
+from .services import tokenizer_registry
+from .services.usage_service import usage_recorder
 
-def create_app(config_class=Config):
+def create_app(config_class=Config, start_workers=True):
     app = Flask(__name__)
     
     # 直接设置数据库配置
@@ -31,4 +34,17 @@ def create_app(config_class=Config):
     # Register all routes
     register_routes(app)
     
+    # Load tokenizers now, so the first request that counts tokens does not wait for them
+    tokenizer_registry.preload(settings.model for settings in config.llm.values())
+    
+    # Usage rows are written through this app by a writer thread in each process
+    usage_recorder.init_app(app)
+    
+    # Start background job workers now, so queued jobs resume right after a restart
+    # (scripts that only need the app pass start_workers=False)
+    if start_workers:
+        ensure_workers(app)
+        # A process forked after creation starts its own workers on its first request
+        app.before_request(lambda: ensure_workers(app))
+    
     return app 
\ No newline at end of file
@@ -0,0 +1,284 @@
+"""
+ASGI application
+
+Serves the async execution endpoints directly on the event loop and mounts the
+existing Flask app for every other route, so one ASGI server (e.g. uvicorn)
+serves the whole API:
+
+    POST /api/async/execute          same contract as POST /api/execute
+    POST /api/async/generate-prompt  same contract as POST /api/generate-prompt
+
+If the client disconnects while a request is waiting on the provider, or
+while a response is being streamed to it, the provider call is cancelled,
+which closes its upstream connection. A call shared by coalesced identical
+requests keeps running until none of them is waiting for it.
+"""
+
+import asyncio
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+from . import create_app
+from .exceptions import ContextWindowExceeded
+from .logger import logger
+from .routes.streaming import sse_event
+from .services.circuit_breaker import CircuitOpenError
+from .services.llm_service import plan_tokens
+from .services.usage_service import usage_scope
+from .services.request_deadline import is_timeout_error
+from .services.async_llm_service import (
+    execute_prompt_async,
+    generate_prompt_async,
+    run_in_app_context,
+    stream_prompt_async,
+)
+
+# 检查客户端是否已断开的间隔（秒）
+DISCONNECT_POLL_SECONDS = 0.5
+
+class ClientDisconnected(Exception):
+    """Raised when the client went away before the response was ready"""
+
+def create_asgi_app(flask_app=None):
+    """Build the ASGI app around a Flask app"""
+    flask_app = flask_app or create_app()
+
+    async def execute(request: Request):
+        """Execute a prompt with a LLM"""
+        data = await _json_body(request)
+
+        if not data or not data.get('prompt'):
+            return JSONResponse({'error': 'Prompt is required'}, status_code=400)
+
+        prompt = data.get('prompt')
+        model_id = data.get('model_id')
+        temperature = data.get('temperature')
+        max_tokens = data.get('max_tokens')
+
+        if data.get('stream'):
+            return await stream_execution(data, prompt, model_id, temperature, max_tokens)
+
+        try:
+            with usage_scope('/api/execute', data.get('prompt_id')):
+                # 发送前计算输入token，超出上下文窗口时直接拒绝
+                budget = await run_in_app_context(flask_app, plan_tokens, prompt, model_id, max_tokens)
+                result = await _cancel_on_disconnect(request, execute_prompt_async(
+                    flask_app, prompt, model_id, temperature, budget.max_tokens, input_tokens=budget.input_tokens
+                ))
+
+            # If prompt_id is provided, save this execution as a shot
+            prompt_id = data.get('prompt_id')
+            if prompt_id:
+                await run_in_app_context(flask_app, _save_shot, prompt_id, prompt, result)
+
+            return JSONResponse({
+                'result': result,
+                'model_id': model_id,
+                'temperature': temperature,
+                'max_tokens': budget.max_tokens,
+                'input_tokens': budget.input_tokens
+            })
+        except ClientDisconnected:
+            return _disconnected_response()
+        except ContextWindowExceeded as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+        except CircuitOpenError as e:
+            return JSONResponse({'error': str(e)}, status_code=503)
+        except Exception as e:
+            logger.error(f"Async execution error: {e}")
+            return JSONResponse({'error': str(e)}, status_code=504 if is_timeout_error(e) else 500)
+
+    async def stream_execution(data, prompt, model_id, temperature, max_tokens):
+        """Stream the execution as Server-Sent Events, saving the shot once it completes"""
+        try:
+            budget = await run_in_app_context(flask_app, plan_tokens, prompt, model_id, max_tokens)
+        except ContextWindowExceeded as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+        except CircuitOpenError as e:
+            return JSONResponse({'error': str(e)}, status_code=503)
+        except Exception as e:
+            return JSONResponse({'error': str(e)}, status_code=500)
+
+        async def generate():
+            chunks = []
+            finish_reason = None
+            try:
+                with usage_scope('/api/execute', data.get('prompt_id')):
+                    async for event in stream_prompt_async(
+                        flask_app, prompt, model_id, temperature, budget.max_tokens, input_tokens=budget.input_tokens
+                    ):
+                        if event['type'] == 'delta':
+                            chunks.append(event['content'])
+                            yield sse_event(event['content'])
+                            continue
+                        if event['type'] == 'finish':
+                            finish_reason = event['finish_reason']
+                            continue
+
+                        # If prompt_id is provided, save this execution as a shot
+                        prompt_id = data.get('prompt_id')
+                        if prompt_id:
+                            shot_id = await run_in_app_context(
+                                flask_app, _save_shot, prompt_id, prompt, "".join(chunks), event['model_id']
+                            )
+                            yield sse_event(str(shot_id), event='saved')
+
+                        yield sse_event({
+                            'model_id': event['model_id'],
+                            'temperature': temperature,
+                            'max_tokens': budget.max_tokens,
+                            'usage': event['usage'],
+                            'input_tokens': budget.input_tokens,
+                            'latency_ms': event['latency_ms'],
+                            'ttft_ms': event['ttft_ms'],
+                            'finish_reason': finish_reason
+                        }, event='done')
+            except Exception as e:
+                logger.error(f"Async streaming execution error: {e}")
+                yield sse_event({'error': str(e)}, event='error')
+
+        # 客户端断开时Starlette取消该生成器，同时关闭上游连接
+        return StreamingResponse(
+            generate(),
+            media_type='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+
+    async def generate_prompt(request: Request):
+        """Generate a prompt using LLM"""
+        data = await _json_body(request)
+
+        if not data or not data.get('user_description'):
+            return JSONResponse({'error': 'User description is required'}, status_code=400)
+
+        try:
+            with usage_scope('/api/generate-prompt'):
+                generation = await _cancel_on_disconnect(request, generate_prompt_async(
+                    flask_app,
+                    user_description=data.get('user_description'),
+                    template_id=data.get('template_id'),
+                    temperature=data.get('temperature', 0.7),
+                    language=data.get('language', 'chinese'),
+                    regenerate=data.get('regenerate', False)
+                ))
+
+            generated_prompt = generation['generated_prompt']
+            response = {'generated_prompt': generated_prompt, 'cached': generation['cached']}
+            if generation['cached']:
+                response['similarity'] = generation['similarity']
+                response['cached_description'] = generation['cached_description']
+
+            # Save the prompt if requested
+            if data.get('save_prompt', False):
+                response['saved_prompt'] = await run_in_app_context(
+                    flask_app,
+                    _save_generated_prompt,
+                    data.get('prompt_name', 'Generated Prompt'),
+                    generated_prompt
+                )
+
+            return JSONResponse(response)
+        except ClientDisconnected:
+            return _disconnected_response()
+        except CircuitOpenError as e:
+            logger.error(f"Model unavailable for async prompt generation: {e}")
+            return JSONResponse({'error': str(e), 'error_type': 'model_unavailable'}, status_code=503)
+        except ValueError as e:
+            if is_timeout_error(e):
+                return _timeout_response(e)
+            logger.error(f"Value error in async prompt generation: {e}")
+            return JSONResponse({'error': str(e), 'error_type': 'value_error'}, status_code=400)
+        except Exception as e:
+            if is_timeout_error(e):
+                return _timeout_response(e)
+            logger.error(f"Error in async prompt generation: {e}")
+            return JSONResponse({
+                'error': f'An error occurred during prompt generation: {str(e)}',
+                'error_type': 'system_error'
+            }, status_code=500)
+
+    async_api = Starlette(
+        routes=[
+            Route('/execute', execute, methods=['POST']),
+            Route('/generate-prompt', generate_prompt, methods=['POST']),
+        ],
+        middleware=[
+            Middleware(
+                CORSMiddleware,
+                allow_origins=['*'],
+                allow_methods=['POST', 'OPTIONS'],
+                allow_headers=['Content-Type', 'Authorization']
+            )
+        ]
+    )
+
+    return Starlette(routes=[
+        Mount('/api/async', app=async_api),
+        # All remaining routes are served by the Flask app in a thread pool
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ])
+
+async def _cancel_on_disconnect(request: Request, call):
+    """
+    Await a coroutine, cancelling it if the client disconnects first.
+
+    Raises:
+        ClientDisconnected: If the client went away and the call was cancelled
+    """
+    task = asyncio.ensure_future(call)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info(f"Client disconnected from {request.url.path}, cancelling the LLM call")
+                raise ClientDisconnected()
+    finally:
+        # 取消仍在进行的调用，同时关闭其上游连接
+        task.cancel()
+
+def _disconnected_response():
+    """Response for a client that is gone; it is never read, but ASGI needs one"""
+    return Response(status_code=499)
+
+def _timeout_response(error):
+    """Response for a generation that ran out of time"""
+    logger.error(f"Async prompt generation timed out: {error}")
+    return JSONResponse({'error': str(error), 'error_type': 'timeout'}, status_code=504)
+
+async def _json_body(request: Request):
+    """Parse the JSON request body, returning None when it is missing or invalid"""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+def _save_shot(prompt_id, prompt, result, model_id=None):
+    """Save an execution as a shot and return its id (needs app context)"""
+    from .models import db
+    from .models.prompt_shots import PromptShots
+
+    shot = PromptShots(
+        prompt_id=prompt_id,
+        content=f"Input:\n{prompt}\n\nOutput:\n{result}",
+        model_id=model_id
+    )
+    db.session.add(shot)
+    db.session.commit()
+    return shot.id
+
+def _save_generated_prompt(name, content):
+    """Save a generated prompt and return it as a dict (needs app context)"""
+    from .services.prompt_service import create_prompt
+
+    return create_prompt(name=name, content=content, source='generated').to_dict()
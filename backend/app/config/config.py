@@ -8,6 +8,274 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+class LLMSettings:
+    """Settings for one LLM endpoint, from a [llm] config section or a ModelConfig row"""
+
+    def __init__(self, model, base_url, api_key, max_tokens=4096, temperature=0.7,
+                 api_type="openai", api_version="", max_input_tokens=None):
+        self.model = model
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.api_type = api_type
+        self.api_version = api_version
+        self.max_input_tokens = max_input_tokens
+
+    def __eq__(self, other):
+        return isinstance(other, LLMSettings) and self.__dict__ == other.__dict__
+
+
+LLM_SETTING_FIELDS = (
+    "model", "base_url", "api_key", "max_tokens", "temperature",
+    "api_type", "api_version", "max_input_tokens",
+)
+
+
+def _llm_fields(section: dict) -> dict:
+    """Pick the LLMSettings fields out of a [llm] section (it also holds unrelated keys)"""
+    return {k: v for k, v in section.items() if k in LLM_SETTING_FIELDS}
+
+
+class LLMClientSettings:
+    """Connection pool defaults for the pooled provider clients"""
+
+    def __init__(self, raw: dict):
+        self.max_connections = raw.get("max_connections", 100)
+        self.max_keepalive_connections = raw.get("max_keepalive_connections", 20)
+        self.keepalive_expiry = raw.get("keepalive_expiry", 30.0)
+        # 以下超时（秒）在模型未单独配置时使用
+        # 读超时：流式时为等待首个token及两个chunk之间的时间上限
+        self.timeout = raw.get("timeout", 60.0)
+        self.connect_timeout = raw.get("connect_timeout", 10.0)
+        # 单次调用从开始到结束的时间上限
+        self.total_timeout = raw.get("total_timeout", 300.0)
+        # 一次请求（含所有重试、对冲与备用模型）的总时长上限
+        self.request_timeout = raw.get("request_timeout", 600.0)
+
+
+class ResponseCacheSettings:
+    """Settings for the LLM response cache"""
+
+    def __init__(self, raw: dict):
+        self.enabled = raw.get("enabled", True)
+        # 为true时temperature>0且未指定seed的请求也会被缓存
+        self.cache_nondeterministic = raw.get("cache_nondeterministic", False)
+        self.ttl_seconds = raw.get("ttl_seconds", 86400)
+        self.memory_max_entries = raw.get("memory_max_entries", 512)
+        self.disk_max_entries = raw.get("disk_max_entries", 20000)
+
+
+class BatchSettings:
+    """Settings for batch execution"""
+
+    def __init__(self, raw: dict):
+        # 每个模型的默认并发上限，可由ModelConfig.max_concurrency覆盖
+        self.max_concurrency = raw.get("max_concurrency", 8)
+        self.max_items = raw.get("max_items", 1000)
+
+
+class JobsSettings:
+    """Settings for the background job workers"""
+
+    def __init__(self, raw: dict):
+        # 每个进程的worker线程数，0表示该进程不处理任务
+        self.workers = raw.get("workers", 2)
+        self.poll_interval = raw.get("poll_interval", 1.0)
+        self.max_attempts = raw.get("max_attempts", 3)
+        self.retry_backoff_seconds = raw.get("retry_backoff_seconds", 5)
+        self.lease_seconds = raw.get("lease_seconds", 900)
+
+
+class RateLimitSettings:
+    """Settings for the per-model rate limiter"""
+
+    def __init__(self, raw: dict):
+        self.enabled = raw.get("enabled", True)
+        # 排队等待的轮询间隔（秒）
+        self.poll_interval = raw.get("poll_interval", 0.05)
+        # 超过该时间仍未轮到则放弃请求
+        self.max_wait_seconds = raw.get("max_wait_seconds", 300)
+        # 清理已退出进程遗留租约的检查间隔（秒）
+        self.stale_check_interval = raw.get("stale_check_interval", 5)
+
+
+class CircuitBreakerSettings:
+    """Settings for the per-model circuit breaker"""
+
+    def __init__(self, raw: dict):
+        self.enabled = raw.get("enabled", True)
+        # 统计错误率和延迟的滚动窗口（秒）
+        self.window_seconds = raw.get("window_seconds", 60)
+        # 窗口内请求数达到该值才会判断是否熔断
+        self.min_requests = raw.get("min_requests", 5)
+        self.error_rate_threshold = raw.get("error_rate_threshold", 0.5)
+        # p95延迟超过该值（毫秒）也会熔断，0表示不按延迟熔断
+        self.latency_threshold_ms = raw.get("latency_threshold_ms", 0)
+        # 熔断后等待多久放行一个探测请求（秒）
+        self.open_seconds = raw.get("open_seconds", 30)
+        self.probe_timeout_seconds = raw.get("probe_timeout_seconds", 120)
+
+
+class CoalescingSettings:
+    """Settings for coalescing identical in-flight requests"""
+
+    def __init__(self, raw: dict):
+        self.enabled = raw.get("enabled", True)
+        # 其他进程等待领头请求结果的轮询间隔（秒）
+        self.poll_interval = raw.get("poll_interval", 0.1)
+        # 等待超过该时间后不再等待，自行请求
+        self.max_wait_seconds = raw.get("max_wait_seconds", 600)
+        # 已完成的记录保留多久，供轮询中的进程读取结果
+        self.result_ttl_seconds = raw.get("result_ttl_seconds", 30)
+
+
+class HedgingSettings:
+    """Settings for hedging slow LLM requests"""
+
+    def __init__(self, raw: dict):
+        self.enabled = raw.get("enabled", False)
+        # 主请求超过首token延迟分位数仍未收到token，或超过总延迟分位数仍未完成时（基于熔断器窗口内的成功请求）发出备份请求
+        self.percentile = raw.get("percentile", 0.95)
+        # 窗口内成功请求数不足时不对冲
+        self.min_samples = raw.get("min_samples", 20)
+        # 对冲等待时间下限（毫秒）
+        self.min_delay_ms = raw.get("min_delay_ms", 500)
+        # 备份请求发往同一模型(same)或其备用模型(fallback，未配置时用同一模型)
+        self.target = raw.get("target", "same")
+        # 统计窗口内对冲请求数不超过请求数的该比例
+        self.max_hedge_rate = raw.get("max_hedge_rate", 0.1)
+        # 统计窗口内被取消请求浪费的token不超过有效token的该比例
+        self.max_overhead_ratio = raw.get("max_overhead_ratio", 0.1)
+        self.window_seconds = raw.get("window_seconds", 300)
+
+
+class ModelCacheSettings:
+    """Settings for the in-process model configuration cache"""
+
+    def __init__(self, raw: dict):
+        self.enabled = raw.get("enabled", True)
+        # 检查共享配置版本号的最小间隔（秒），即其他worker的修改最多延迟多久生效
+        self.check_interval = raw.get("check_interval", 1.0)
+
+
+class TokenizerSettings:
+    """Settings for loading tiktoken encodings"""
+
+    def __init__(self, raw: dict):
+        # tiktoken BPE文件所在目录，为空时使用backend/tiktoken_cache（环境变量TIKTOKEN_CACHE_DIR优先）
+        self.cache_dir = raw.get("cache_dir", "")
+        # 应用启动时预加载的编码
+        self.preload = raw.get("preload", ["cl100k_base", "o200k_base"])
+        # 未匹配任何规则且tiktoken不认识的模型使用的编码
+        self.default_encoding = raw.get("default_encoding", "cl100k_base")
+        # 模型名通配规则 -> 编码名称，优先于tiktoken内置的模型表
+        self.model_encodings = raw.get("model_encodings", {})
+
+
+class TokenBudgetSettings:
+    """Settings for checking prompts against the model's context window before sending"""
+
+    def __init__(self, raw: dict):
+        self.enabled = raw.get("enabled", True)
+        # 上下文窗口留给回复的token少于该值时直接拒绝请求
+        self.min_output_tokens = raw.get("min_output_tokens", 16)
+        # 请求未指定max_tokens时使用该值（不超过剩余窗口），避免提供方默认值超出窗口
+        self.default_max_tokens = raw.get("default_max_tokens", 4096)
+
+
+class TokenCountSettings:
+    """Settings for the batched token counting API"""
+
+    def __init__(self, raw: dict):
+        # 批量编码使用的线程数
+        self.num_threads = raw.get("num_threads", 8)
+        # 未缓存的文本少于该数量时在当前线程编码
+        self.batch_threshold = raw.get("batch_threshold", 16)
+        # 按内容哈希缓存的计数条数上限
+        self.cache_size = raw.get("cache_size", 50000)
+        # 单次请求最多可计数的文本与消息列表数
+        self.max_items = raw.get("max_items", 5000)
+
+
+class UsageSettings:
+    """Settings for recording LLM usage"""
+
+    def __init__(self, raw: dict):
+        self.enabled = raw.get("enabled", True)
+        # 后台线程每批最多写入的行数
+        self.batch_size = raw.get("batch_size", 200)
+        # 后台线程等待新记录的最长时间（秒），即记录最多延迟多久写入数据库
+        self.flush_interval = raw.get("flush_interval", 2.0)
+        # 内存队列上限，数据库写入跟不上时丢弃新记录
+        self.max_queue = raw.get("max_queue", 10000)
+
+
+class RetrySettings:
+    """Settings for retrying failed LLM calls"""
+
+    def __init__(self, raw: dict):
+        # 可重试错误（超时、连接错误、429、5xx）的重试次数，在请求截止时间内进行
+        self.max_retries = raw.get("max_retries", 2)
+        # 指数退避的初始与最大等待时间（秒）
+        self.base_delay = raw.get("base_delay", 0.5)
+        self.max_delay = raw.get("max_delay", 8.0)
+        # 提供方Retry-After要求等待更久时不再重试
+        self.max_retry_after = raw.get("max_retry_after", 30.0)
+        # 重试预算：budget_window秒内的重试次数不超过调用次数 * budget_ratio + budget_min_retries
+        self.budget_ratio = raw.get("budget_ratio", 0.2)
+        self.budget_min_retries = raw.get("budget_min_retries", 10)
+        self.budget_window = raw.get("budget_window", 10.0)
+
+
+class PromptAssemblySettings:
+    """Settings for the compiled prompt prefix cache"""
+
+    def __init__(self, raw: dict):
+        self.enabled = raw.get("enabled", True)
+        # 检查共享模板版本号的最小间隔（秒），即其他worker对模板的修改最多延迟多久生效
+        self.check_interval = raw.get("check_interval", 1.0)
+
+
+class TemplateSettings:
+    """Settings for compiling and rendering prompt templates"""
+
+    def __init__(self, raw: dict):
+        # 按内容哈希缓存的已编译模板数量上限
+        self.cache_size = raw.get("cache_size", 1000)
+        # 将编译结果写入workspace下的字节码缓存，供其他worker与重启后复用
+        self.bytecode_cache = raw.get("bytecode_cache", True)
+        # 单次渲染请求最多的变量组数
+        self.max_render_items = raw.get("max_render_items", 10000)
+
+
+class BulkSettings:
+    """Settings for bulk prompt generation from uploaded files"""
+
+    def __init__(self, raw: dict):
+        # 单次上传最多的行数
+        self.max_rows = raw.get("max_rows", 5000)
+        # 生成结果每凑满多少行写入一次数据库
+        self.save_batch_size = raw.get("save_batch_size", 50)
+
+
+class SemanticCacheSettings:
+    """Settings for the near-duplicate cache of generated prompts"""
+
+    def __init__(self, raw: dict):
+        # 只差一个关键词的描述也可能相似度很高，默认关闭
+        self.enabled = raw.get("enabled", False)
+        # 描述向量的余弦相似度不低于该值时直接返回缓存的生成结果
+        self.threshold = raw.get("threshold", 0.97)
+        # 哈希向量维度，每个条目在每个worker内存中占dimensions*4字节
+        self.dimensions = raw.get("dimensions", 256)
+        self.ngram_min = raw.get("ngram_min", 2)
+        self.ngram_max = raw.get("ngram_max", 4)
+        self.max_entries = raw.get("max_entries", 200000)
+        # 检查其他worker新增条目的间隔（秒）
+        self.check_interval = raw.get("check_interval", 1.0)
+
+
 class Config:
     _instance = None
     _lock = threading.Lock()
@@ -53,6 +321,68 @@ class Config:
         self._track_modifications = db_config.get("track_modifications", False)
         self._echo = db_config.get("echo", False)
 
+        # LLM配置：[llm]为default，[llm.<name>]覆盖default中的字段
+        llm_config = raw_config.get("llm", {})
+        base_llm = _llm_fields(llm_config)
+        self._llm = {"default": LLMSettings(**base_llm)} if "model" in base_llm else {}
+        for name, overrides in llm_config.items():
+            if isinstance(overrides, dict):
+                self._llm[name] = LLMSettings(**{**base_llm, **_llm_fields(overrides)})
+
+        # LLM客户端连接池配置
+        self._llm_client = LLMClientSettings(raw_config.get("llm_client", {}))
+
+        # LLM响应缓存配置
+        self._response_cache = ResponseCacheSettings(raw_config.get("response_cache", {}))
+
+        # 批量执行配置
+        self._batch = BatchSettings(raw_config.get("batch", {}))
+
+        # 后台任务配置
+        self._jobs = JobsSettings(raw_config.get("jobs", {}))
+
+        # 限流配置
+        self._rate_limit = RateLimitSettings(raw_config.get("rate_limit", {}))
+
+        # 熔断配置
+        self._circuit_breaker = CircuitBreakerSettings(raw_config.get("circuit_breaker", {}))
+
+        # 相同请求合并配置
+        self._coalescing = CoalescingSettings(raw_config.get("coalescing", {}))
+
+        # 请求对冲配置
+        self._hedging = HedgingSettings(raw_config.get("hedging", {}))
+
+        # 模型配置缓存
+        self._model_cache = ModelCacheSettings(raw_config.get("model_cache", {}))
+
+        # 分词器配置
+        self._tokenizer = TokenizerSettings(raw_config.get("tokenizer", {}))
+
+        # 上下文窗口预检配置
+        self._token_budget = TokenBudgetSettings(raw_config.get("token_budget", {}))
+
+        # token计数接口配置
+        self._token_count = TokenCountSettings(raw_config.get("token_count", {}))
+
+        # 用量记录配置
+        self._usage = UsageSettings(raw_config.get("usage", {}))
+
+        # 重试策略配置
+        self._retry = RetrySettings(raw_config.get("retry", {}))
+
+        # 提示词前缀缓存配置
+        self._prompt_assembly = PromptAssemblySettings(raw_config.get("prompt_assembly", {}))
+
+        # 模板编译与渲染配置
+        self._templates = TemplateSettings(raw_config.get("templates", {}))
+
+        # 批量生成配置
+        self._bulk = BulkSettings(raw_config.get("bulk", {}))
+
+        # 语义缓存配置
+        self._semantic_cache = SemanticCacheSettings(raw_config.get("semantic_cache", {}))
+
     @property
     def database(self):
         class DatabaseSettings:
@@ -67,6 +397,101 @@ class Config:
             self._echo
         )
 
+    @property
+    def llm(self) -> Dict[str, LLMSettings]:
+        """Get the LLM settings from config.toml keyed by config name"""
+        return self._llm
+
+    @property
+    def llm_client(self) -> "LLMClientSettings":
+        """Get the shared LLM client connection pool settings"""
+        return self._llm_client
+
+    @property
+    def response_cache(self) -> "ResponseCacheSettings":
+        """Get the LLM response cache settings"""
+        return self._response_cache
+
+    @property
+    def batch(self) -> "BatchSettings":
+        """Get the batch execution settings"""
+        return self._batch
+
+    @property
+    def jobs(self) -> "JobsSettings":
+        """Get the background job settings"""
+        return self._jobs
+
+    @property
+    def rate_limit(self) -> "RateLimitSettings":
+        """Get the rate limiter settings"""
+        return self._rate_limit
+
+    @property
+    def circuit_breaker(self) -> "CircuitBreakerSettings":
+        """Get the circuit breaker settings"""
+        return self._circuit_breaker
+
+    @property
+    def coalescing(self) -> "CoalescingSettings":
+        """Get the request coalescing settings"""
+        return self._coalescing
+
+    @property
+    def hedging(self) -> "HedgingSettings":
+        """Get the request hedging settings"""
+        return self._hedging
+
+    @property
+    def model_cache(self) -> "ModelCacheSettings":
+        """Get the model configuration cache settings"""
+        return self._model_cache
+
+    @property
+    def tokenizer(self) -> "TokenizerSettings":
+        """Get the tokenizer settings"""
+        return self._tokenizer
+
+    @property
+    def token_budget(self) -> "TokenBudgetSettings":
+        """Get the context window pre-flight settings"""
+        return self._token_budget
+
+    @property
+    def token_count(self) -> "TokenCountSettings":
+        """Get the token counting API settings"""
+        return self._token_count
+
+    @property
+    def usage(self) -> "UsageSettings":
+        """Get the LLM usage recording settings"""
+        return self._usage
+
+    @property
+    def retry(self) -> "RetrySettings":
+        """Get the LLM call retry policy settings"""
+        return self._retry
+
+    @property
+    def prompt_assembly(self) -> "PromptAssemblySettings":
+        """Get the compiled prompt prefix cache settings"""
+        return self._prompt_assembly
+
+    @property
+    def templates(self) -> "TemplateSettings":
+        """Get the template compilation and rendering settings"""
+        return self._templates
+
+    @property
+    def bulk(self) -> "BulkSettings":
+        """Get the bulk prompt generation settings"""
+        return self._bulk
+
+    @property
+    def semantic_cache(self) -> "SemanticCacheSettings":
+        """Get the semantic cache settings for generated prompts"""
+        return self._semantic_cache
+
     @property
     def workspace_root(self) -> Path:
         """Get the workspace root directory"""
@@ -0,0 +1,6 @@
+class TokenLimitExceeded(Exception):
+    """Exception raised when the token limit is exceeded"""
+
+
+class ContextWindowExceeded(TokenLimitExceeded, ValueError):
+    """Exception raised when a prompt cannot fit in the model's context window"""
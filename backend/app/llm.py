@@ -1,7 +1,9 @@
+import asyncio
 import math
-from typing import Dict, List, Optional, Union
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
 
-import tiktoken
+from anthropic import AsyncAnthropic
 from openai import (
     APIError,
     AsyncAzureOpenAI,
@@ -10,17 +12,22 @@ from openai import (
     OpenAIError,
     RateLimitError,
 )
+from openai.types.chat import ChatCompletion
 from openai.types.chat.chat_completion_message import ChatCompletionMessage
-from tenacity import (
-    retry,
-    retry_if_exception_type,
-    stop_after_attempt,
-    wait_random_exponential,
-)
 
 # Use relative imports
 from .config.config import Config, LLMSettings  # 直接从config模块导入LLMSettings
+from .exceptions import TokenLimitExceeded
 from .logger import logger  # Assuming a logger is set up in your app
+from .services.rate_limiter import limits_for, rate_limiter
+from .services.retry_policy import retry_policy
+from .services.tokenizer_registry import encoding_for_model
+from .services.request_deadline import (
+    DeadlineExceeded,
+    call_deadline,
+    http_timeout,
+    timeouts_for,
+)
 from .schema import (
     ROLE_VALUES,
     TOOL_CHOICE_TYPE,
@@ -61,7 +68,8 @@ class TokenCounter:
 
     def count_text(self, text: str) -> int:
         """Calculate tokens for a text string"""
-        return 0 if not text else len(self.tokenizer.encode(text))
+        # 用户文本中的特殊token（如<|endoftext|>）按普通文本计数，encode()会直接报错
+        return 0 if not text else len(self.tokenizer.encode_ordinary(text))
 
     def count_image(self, image_item: dict) -> int:
         """
@@ -184,20 +192,27 @@ class LLM:
     _instances: Dict[str, "LLM"] = {}
 
     def __new__(
-        cls, config_name: str = "default", llm_config: Optional[LLMSettings] = None
+        cls,
+        config_name: str = "default",
+        llm_config: Optional[Dict[str, LLMSettings]] = None,
+        client=None,
     ):
         if config_name not in cls._instances:
             instance = super().__new__(cls)
-            instance.__init__(config_name, llm_config)
+            instance.__init__(config_name, llm_config, client)
             cls._instances[config_name] = instance
         return cls._instances[config_name]
 
     def __init__(
-        self, config_name: str = "default", llm_config: Optional[LLMSettings] = None
+        self,
+        config_name: str = "default",
+        llm_config: Optional[Dict[str, LLMSettings]] = None,
+        client=None,
     ):
         if not hasattr(self, "client"):  # Only initialize if not already initialized
             llm_config = llm_config or config.llm
-            llm_config = llm_config.get(config_name, llm_config["default"])
+            llm_config = llm_config.get(config_name) or llm_config["default"]
+            self.settings = llm_config
             self.model = llm_config.model
             self.max_tokens = llm_config.max_tokens
             self.temperature = llm_config.temperature
@@ -205,6 +220,10 @@ class LLM:
             self.api_key = llm_config.api_key
             self.api_version = llm_config.api_version
             self.base_url = llm_config.base_url
+            # Per-model rate limits, timeouts and health tracking, set by for_model()
+            self.limits = None
+            self.timeouts = timeouts_for()
+            self.model_config_id = None
 
             # Add token counting related attributes
             self.total_input_tokens = 0
@@ -215,29 +234,71 @@ class LLM:
                 else None
             )
 
-            # Initialize tokenizer
-            try:
-                self.tokenizer = tiktoken.encoding_for_model(self.model)
-            except KeyError:
-                # If the model is not in tiktoken's presets, use cl100k_base as default
-                self.tokenizer = tiktoken.get_encoding("cl100k_base")
+            # Shared tokenizer, loaded once per process from the local tiktoken cache
+            self.tokenizer = encoding_for_model(self.model)
 
-            if self.api_type == "azure":
+            if client is not None:
+                # Pooled client shared through the client registry
+                self.client = client
+            elif self.api_type == "anthropic":
+                self.client = AsyncAnthropic(
+                    api_key=self.api_key, base_url=self.base_url, max_retries=0
+                )
+            elif self.api_type == "azure":
                 self.client = AsyncAzureOpenAI(
                     base_url=self.base_url,
                     api_key=self.api_key,
                     api_version=self.api_version,
+                    max_retries=0,
                 )
             else:
-                self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+                self.client = AsyncOpenAI(
+                    api_key=self.api_key, base_url=self.base_url, max_retries=0
+                )
 
             self.token_counter = TokenCounter(self.tokenizer)
 
+    @classmethod
+    def for_model(cls, model_config) -> "LLM":
+        """
+        Get the LLM instance for a ModelConfig row.
+
+        The instance is cached per model id and rebuilt when the row's settings
+        change. Must be called inside a Flask app context, since the async client
+        comes from the shared client registry.
+        """
+        from .services.llm_client_registry import get_client
+
+        default_llm = config.llm.get("default")
+        settings = LLMSettings(
+            model=model_config.model_id,
+            base_url=model_config.base_url,
+            api_key=model_config.api_key,
+            max_tokens=default_llm.max_tokens if default_llm else 4096,
+            temperature=default_llm.temperature if default_llm else 0.7,
+            api_type=(model_config.api_type or "openai").lower(),
+            api_version=model_config.api_version or "",
+        )
+
+        config_name = f"model:{model_config.id}"
+        instance = cls._instances.get(config_name)
+        if instance is None or instance.settings != settings:
+            cls._instances.pop(config_name, None)
+            instance = cls(
+                config_name,
+                {config_name: settings},
+                client=get_client(model_config, is_async=True),
+            )
+        instance.limits = limits_for(model_config)
+        instance.timeouts = timeouts_for(model_config)
+        instance.model_config_id = model_config.id
+        return instance
+
     def count_tokens(self, text: str) -> int:
         """Calculate the number of tokens in a text"""
         if not text:
             return 0
-        return len(self.tokenizer.encode(text))
+        return len(self.tokenizer.encode_ordinary(text))
 
     def count_message_tokens(self, messages: List[dict]) -> int:
         return self.token_counter.count_message_tokens(messages)
@@ -363,19 +424,14 @@ class LLM:
 
         return formatted_messages
 
-    @retry(
-        wait=wait_random_exponential(min=1, max=60),
-        stop=stop_after_attempt(6),
-        retry=retry_if_exception_type(
-            (OpenAIError, Exception, ValueError)
-        ),  # Don't retry TokenLimitExceeded
-    )
+    @retry_policy.retrying
     async def ask(
         self,
         messages: List[Union[dict, Message]],
         system_msgs: Optional[List[Union[dict, Message]]] = None,
         stream: bool = True,
         temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
     ) -> str:
         """
         Send a prompt to the LLM and get the response.
@@ -385,6 +441,7 @@ class LLM:
             system_msgs: Optional system messages to prepend
             stream (bool): Whether to stream the response
             temperature (float): Sampling temperature for the response
+            max_tokens (int): Maximum tokens to generate, defaults to the configured value
 
         Returns:
             str: The generated response
@@ -396,80 +453,43 @@ class LLM:
             Exception: For unexpected errors
         """
         try:
-            # Check if the model supports images
-            supports_images = self.model in MULTIMODAL_MODELS
-
-            # Format system and user messages with image support check
-            if system_msgs:
-                system_msgs = self.format_messages(system_msgs, supports_images)
-                messages = system_msgs + self.format_messages(messages, supports_images)
-            else:
-                messages = self.format_messages(messages, supports_images)
-
-            # Calculate input token count
-            input_tokens = self.count_message_tokens(messages)
-
-            # Check if token limits are exceeded
-            if not self.check_token_limit(input_tokens):
-                error_message = self.get_limit_error_message(input_tokens)
-                # Raise a special exception that won't be retried
-                raise TokenLimitExceeded(error_message)
-
-            params = {
-                "model": self.model,
-                "messages": messages,
-            }
-
-            if self.model in REASONING_MODELS:
-                params["max_completion_tokens"] = self.max_tokens
-            else:
-                params["max_tokens"] = self.max_tokens
-                params["temperature"] = (
-                    temperature if temperature is not None else self.temperature
-                )
-
-            if not stream:
-                # Non-streaming request
-                response = await self.client.chat.completions.create(
-                    **params, stream=False
+            if stream:
+                # Join the text chunks of the streamed response
+                return await self._collect_text(
+                    self.ask_stream(messages, system_msgs, temperature, max_tokens)
                 )
 
-                if not response.choices or not response.choices[0].message.content:
-                    raise ValueError("Empty or invalid response from LLM")
-
-                # Update token counts
-                self.update_token_count(
-                    response.usage.prompt_tokens, response.usage.completion_tokens
-                )
-
-                return response.choices[0].message.content
-
-            # Streaming request, For streaming, update estimated token count before making the request
-            self.update_token_count(input_tokens)
+            messages, input_tokens = self._prepare_messages(messages, system_msgs)
 
-            response = await self.client.chat.completions.create(**params, stream=True)
+            max_tokens = max_tokens or self.max_tokens
+            temperature = temperature if temperature is not None else self.temperature
 
-            collected_messages = []
-            completion_text = ""
-            async for chunk in response:
-                chunk_message = chunk.choices[0].delta.content or ""
-                collected_messages.append(chunk_message)
-                completion_text += chunk_message
-                print(chunk_message, end="", flush=True)
-
-            print()  # Newline after streaming
-            full_response = "".join(collected_messages).strip()
-            if not full_response:
-                raise ValueError("Empty response from streaming LLM")
-
-            # estimate completion tokens for streaming response
-            completion_tokens = self.count_tokens(completion_text)
-            logger.info(
-                f"Estimated completion tokens for streaming response: {completion_tokens}"
+            # Wait for the model's rate limit before calling the provider
+            lease = await rate_limiter.acquire_async(
+                self.limits, input_tokens + max_tokens
             )
-            self.total_completion_tokens += completion_tokens
+            started = time.monotonic()
+            usage: Dict[str, int] = {}
+            try:
+                deadline = call_deadline(self.timeouts)
+                timeout = http_timeout(self.timeouts, deadline)
+                if self.api_type == "anthropic":
+                    call = self._ask_anthropic(
+                        messages, temperature, max_tokens, timeout, usage
+                    )
+                else:
+                    call = self._ask_openai(
+                        messages, temperature, max_tokens, timeout, usage
+                    )
+                response = await self._within(deadline, call)
+            except Exception as e:
+                await self._record_call(started, e)
+                raise
+            finally:
+                await rate_limiter.release_async(lease)
 
-            return full_response
+            await self._record_call(started, usage=usage)
+            return response
 
         except TokenLimitExceeded:
             # Re-raise token limit errors without logging
@@ -490,13 +510,317 @@ class LLM:
             logger.exception(f"Unexpected error in ask")
             raise
 
-    @retry(
-        wait=wait_random_exponential(min=1, max=60),
-        stop=stop_after_attempt(6),
-        retry=retry_if_exception_type(
-            (OpenAIError, Exception, ValueError)
-        ),  # Don't retry TokenLimitExceeded
-    )
+    async def ask_stream(
+        self,
+        messages: List[Union[dict, Message]],
+        system_msgs: Optional[List[Union[dict, Message]]] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Send a prompt to the LLM and stream the response as it is generated.
+
+        Unlike ask(), a failed stream is not retried, since the consumer may
+        already have used part of the response.
+
+        Args:
+            messages: List of conversation messages
+            system_msgs: Optional system messages to prepend
+            temperature (float): Sampling temperature for the response
+            max_tokens (int): Maximum tokens to generate, defaults to the configured value
+
+        Yields:
+            Dict[str, Any]: Stream events, in order:
+                {"type": "delta", "content", "completion_tokens"} for every text chunk,
+                with the completion tokens counted so far;
+                {"type": "finish", "finish_reason"} when the model stops generating;
+                {"type": "usage", "usage", "latency_ms", "ttft_ms"} last, with the
+                provider's token usage (or the local counts if it reports none)
+
+        Raises:
+            TokenLimitExceeded: If token limits are exceeded
+            DeadlineExceeded: If the call runs past its deadline
+            OpenAIError: If the API call fails
+        """
+        messages, input_tokens = self._prepare_messages(messages, system_msgs)
+        max_tokens = max_tokens or self.max_tokens
+        temperature = temperature if temperature is not None else self.temperature
+
+        lease = await rate_limiter.acquire_async(self.limits, input_tokens + max_tokens)
+        started = time.monotonic()
+        first_token_at = None
+        completion_tokens = 0
+        usage: Dict[str, int] = {}
+        try:
+            deadline = call_deadline(self.timeouts)
+            timeout = http_timeout(self.timeouts, deadline, stream=True)
+            if self.api_type == "anthropic":
+                events = self._stream_anthropic(
+                    self._anthropic_params(messages, temperature, max_tokens, timeout), usage
+                )
+            else:
+                events = self._stream_openai(
+                    self._openai_params(messages, temperature, max_tokens, timeout), usage
+                )
+
+            try:
+                while True:
+                    try:
+                        event = await self._within(deadline, events.__anext__())
+                    except StopAsyncIteration:
+                        break
+
+                    if event["type"] == "delta":
+                        if first_token_at is None:
+                            first_token_at = time.monotonic()
+                        # Count as the chunks arrive instead of re-encoding the full text at the end
+                        completion_tokens += self.count_tokens(event["content"])
+                        event["completion_tokens"] = completion_tokens
+                    yield event
+            finally:
+                # Closes the upstream response when the consumer stops early
+                await events.aclose()
+
+            if not usage:
+                usage.update(
+                    prompt_tokens=input_tokens,
+                    completion_tokens=completion_tokens,
+                    total_tokens=input_tokens + completion_tokens,
+                    cached_tokens=0,
+                )
+        except Exception as e:
+            await self._record_call(started, e)
+            raise
+        finally:
+            await rate_limiter.release_async(lease, usage.get("total_tokens"))
+
+        self.update_token_count(usage["prompt_tokens"], usage["completion_tokens"])
+        await self._record_call(started, usage=usage, first_token_at=first_token_at)
+        yield {
+            "type": "usage",
+            "usage": usage,
+            "latency_ms": round((time.monotonic() - started) * 1000, 1),
+            "ttft_ms": round((first_token_at - started) * 1000, 1) if first_token_at else None,
+        }
+
+    def _prepare_messages(
+        self,
+        messages: List[Union[dict, Message]],
+        system_msgs: Optional[List[Union[dict, Message]]] = None,
+    ) -> Tuple[List[dict], int]:
+        """
+        Format the messages and count their tokens.
+
+        Raises:
+            TokenLimitExceeded: If token limits are exceeded
+        """
+        # Check if the model supports images
+        supports_images = self.model in MULTIMODAL_MODELS
+
+        # Format system and user messages with image support check
+        if system_msgs:
+            system_msgs = self.format_messages(system_msgs, supports_images)
+            messages = system_msgs + self.format_messages(messages, supports_images)
+        else:
+            messages = self.format_messages(messages, supports_images)
+
+        # Calculate input token count
+        input_tokens = self.count_message_tokens(messages)
+
+        # Check if token limits are exceeded
+        if not self.check_token_limit(input_tokens):
+            error_message = self.get_limit_error_message(input_tokens)
+            # Raise a special exception that won't be retried
+            raise TokenLimitExceeded(error_message)
+
+        return messages, input_tokens
+
+    @staticmethod
+    async def _collect_text(events: AsyncIterator[Dict[str, Any]]) -> str:
+        """Join the text chunks of a stream into the full response"""
+        chunks = [event["content"] async for event in events if event["type"] == "delta"]
+        full_response = "".join(chunks).strip()
+        if not full_response:
+            raise ValueError("Empty response from streaming LLM")
+        return full_response
+
+    @staticmethod
+    async def _within(deadline, call):
+        """Await a provider call, cancelling it (and closing its connection) when the deadline passes"""
+        try:
+            return await asyncio.wait_for(call, max(deadline.remaining(), 0))
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"Request timed out after {deadline.seconds:g}s") from None
+
+    def _collect_usage(self, collected: Optional[Dict[str, int]], usage) -> None:
+        """Add a response's token usage, including prompt cache hits, to the call's usage record"""
+        from .services.llm_service import anthropic_usage, openai_usage
+
+        if collected is None:
+            return
+
+        if self.api_type == "anthropic":
+            collected.update(anthropic_usage(usage))
+        else:
+            collected.update(openai_usage(usage))
+
+    async def _record_call(
+        self,
+        started: float,
+        error: Optional[Exception] = None,
+        usage: Optional[Dict[str, int]] = None,
+        first_token_at: Optional[float] = None,
+    ) -> None:
+        """Report a call's outcome to the circuit breaker and usage records (instances from for_model() only)"""
+        if self.model_config_id is None:
+            return
+
+        from .services.llm_service import record_call_outcome
+
+        # 熔断器的SQLite事务可能等待其他worker的写锁，在线程中执行；调用方被取消时也要记录
+        await asyncio.shield(asyncio.to_thread(
+            record_call_outcome, self.model_config_id, started, error, usage, first_token_at, time.monotonic()
+        ))
+
+    def _openai_params(
+        self,
+        messages: List[dict],
+        temperature: float,
+        max_tokens: int,
+        timeout=None,
+    ) -> dict:
+        """Build the chat completions request parameters"""
+        params = {
+            "model": self.model,
+            "messages": messages,
+        }
+        if timeout is not None:
+            params["timeout"] = timeout
+
+        if self.model in REASONING_MODELS:
+            params["max_completion_tokens"] = max_tokens
+        else:
+            params["max_tokens"] = max_tokens
+            params["temperature"] = temperature
+        return params
+
+    def _anthropic_params(
+        self,
+        messages: List[dict],
+        temperature: float,
+        max_tokens: int,
+        timeout=None,
+    ) -> dict:
+        """Build the Anthropic messages request parameters"""
+        # Anthropic takes system prompts as a separate parameter
+        system = "\n\n".join(
+            message["content"] for message in messages if message["role"] == "system"
+        )
+        params = {
+            "model": self.model,
+            "messages": [message for message in messages if message["role"] != "system"],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+        }
+        if timeout is not None:
+            params["timeout"] = timeout
+        if system:
+            # Mark the system prompt as a prompt cache breakpoint
+            params["system"] = [
+                {"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}
+            ]
+        return params
+
+    async def _ask_openai(
+        self,
+        messages: List[dict],
+        temperature: float,
+        max_tokens: int,
+        timeout=None,
+        usage: Optional[Dict[str, int]] = None,
+    ) -> str:
+        """Send formatted messages to the OpenAI chat completions API"""
+        response = await self.client.chat.completions.create(
+            **self._openai_params(messages, temperature, max_tokens, timeout), stream=False
+        )
+
+        if not response.choices or not response.choices[0].message.content:
+            raise ValueError("Empty or invalid response from LLM")
+
+        # Update token counts
+        self.update_token_count(
+            response.usage.prompt_tokens, response.usage.completion_tokens
+        )
+        self._collect_usage(usage, response.usage)
+
+        return response.choices[0].message.content
+
+    async def _ask_anthropic(
+        self,
+        messages: List[dict],
+        temperature: float,
+        max_tokens: int,
+        timeout=None,
+        usage: Optional[Dict[str, int]] = None,
+    ) -> str:
+        """Send formatted messages to the Anthropic messages API"""
+        response = await self.client.messages.create(
+            **self._anthropic_params(messages, temperature, max_tokens, timeout)
+        )
+
+        content = "".join(
+            block.text for block in response.content if block.type == "text"
+        )
+        if not content:
+            raise ValueError("Empty or invalid response from LLM")
+
+        self.update_token_count(
+            response.usage.input_tokens, response.usage.output_tokens
+        )
+        self._collect_usage(usage, response.usage)
+        return content
+
+    async def _stream_openai(
+        self, params: dict, usage: Dict[str, int]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a chat completion as delta and finish events, collecting its token usage"""
+        response = await self.client.chat.completions.create(
+            **params,
+            stream=True,
+            # The last chunk carries the token usage
+            stream_options={"include_usage": True},
+        )
+        try:
+            async for chunk in response:
+                if chunk.usage:
+                    self._collect_usage(usage, chunk.usage)
+
+                if not chunk.choices:
+                    continue
+
+                choice = chunk.choices[0]
+                if choice.delta and choice.delta.content:
+                    yield {"type": "delta", "content": choice.delta.content}
+                if choice.finish_reason:
+                    yield {"type": "finish", "finish_reason": choice.finish_reason}
+        finally:
+            await response.close()
+
+    async def _stream_anthropic(
+        self, params: dict, usage: Dict[str, int]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream an Anthropic message as delta and finish events, collecting its token usage"""
+        async with self.client.messages.stream(**params) as response:
+            async for text in response.text_stream:
+                if text:
+                    yield {"type": "delta", "content": text}
+
+            final_message = await response.get_final_message()
+
+        self._collect_usage(usage, final_message.usage)
+        yield {"type": "finish", "finish_reason": final_message.stop_reason}
+
+    @retry_policy.retrying
     async def ask_with_images(
         self,
         messages: List[Union[dict, Message]],
@@ -525,6 +849,9 @@ class LLM:
             Exception: For unexpected errors
         """
         try:
+            if self.api_type == "anthropic":
+                raise ValueError("ask_with_images is not supported for Anthropic models")
+
             # For ask_with_images, we always set supports_images to True because
             # this method should only be called with models that support images
             if self.model not in MULTIMODAL_MODELS:
@@ -588,7 +915,9 @@ class LLM:
             params = {
                 "model": self.model,
                 "messages": all_messages,
-                "stream": stream,
+                "timeout": http_timeout(
+                    self.timeouts, call_deadline(self.timeouts), stream
+                ),
             }
 
             # Add model-specific parameters
@@ -602,7 +931,9 @@ class LLM:
 
             # Handle non-streaming request
             if not stream:
-                response = await self.client.chat.completions.create(**params)
+                response = await self.client.chat.completions.create(
+                    **params, stream=False
+                )
 
                 if not response.choices or not response.choices[0].message.content:
                     raise ValueError("Empty or invalid response from LLM")
@@ -612,21 +943,7 @@ class LLM:
 
             # Handle streaming request
             self.update_token_count(input_tokens)
-            response = await self.client.chat.completions.create(**params)
-
-            collected_messages = []
-            async for chunk in response:
-                chunk_message = chunk.choices[0].delta.content or ""
-                collected_messages.append(chunk_message)
-                print(chunk_message, end="", flush=True)
-
-            print()  # Newline after streaming
-            full_response = "".join(collected_messages).strip()
-
-            if not full_response:
-                raise ValueError("Empty response from streaming LLM")
-
-            return full_response
+            return await self._collect_text(self._stream_openai(params, {}))
 
         except TokenLimitExceeded:
             raise
@@ -646,18 +963,12 @@ class LLM:
             logger.error(f"Unexpected error in ask_with_images: {e}")
             raise
 
-    @retry(
-        wait=wait_random_exponential(min=1, max=60),
-        stop=stop_after_attempt(6),
-        retry=retry_if_exception_type(
-            (OpenAIError, Exception, ValueError)
-        ),  # Don't retry TokenLimitExceeded
-    )
+    @retry_policy.retrying
     async def ask_tool(
         self,
         messages: List[Union[dict, Message]],
         system_msgs: Optional[List[Union[dict, Message]]] = None,
-        timeout: int = 300,
+        timeout: Optional[float] = None,
         tools: Optional[List[dict]] = None,
         tool_choice: TOOL_CHOICE_TYPE = ToolChoice.AUTO,  # type: ignore
         temperature: Optional[float] = None,
@@ -669,7 +980,7 @@ class LLM:
         Args:
             messages: List of conversation messages
             system_msgs: Optional system messages to prepend
-            timeout: Request timeout in seconds
+            timeout: Request timeout in seconds, defaults to the model's timeouts
             tools: List of tools to use
             tool_choice: Tool choice strategy
             temperature: Sampling temperature for the response
@@ -685,6 +996,9 @@ class LLM:
             Exception: For unexpected errors
         """
         try:
+            if self.api_type == "anthropic":
+                raise ValueError("ask_tool is not supported for Anthropic models")
+
             # Validate tool_choice
             if tool_choice not in TOOL_CHOICE_VALUES:
                 raise ValueError(f"Invalid tool_choice: {tool_choice}")
@@ -728,7 +1042,8 @@ class LLM:
                 "messages": messages,
                 "tools": tools,
                 "tool_choice": tool_choice,
-                "timeout": timeout,
+                "timeout": timeout
+                or http_timeout(self.timeouts, call_deadline(self.timeouts)),
                 **kwargs,
             }
 
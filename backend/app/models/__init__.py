@@ -1,16 +1,41 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
 
 db = SQLAlchemy()
 
 def init_db(app):
     db.init_app(app)
-    
+
     with app.app_context():
-        db.create_all()
-        
         # Import models to ensure they're registered with SQLAlchemy
         from .prompt_template import PromptTemplate
         from .prompt import Prompt
         from .prompt_version import PromptVersion
         from .prompt_shots import PromptShots
-        from .model_config import ModelConfig 
\ No newline at end of file
+        from .model_config import ModelConfig
+        from .generation_job import GenerationJob
+        from .config_version import ConfigVersion
+        from .llm_usage import LLMUsage
+        from .bulk_generation_row import BulkGenerationRow
+
+        db.create_all()
+        _add_missing_columns()
+
+def _add_missing_columns():
+    """Add columns introduced after a table was created (create_all never alters tables)"""
+    inspector = inspect(db.engine)
+
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+
+            # 新增列必须可为空，已有数据行才能保持有效
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+    db.session.commit()
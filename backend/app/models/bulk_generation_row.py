@@ -0,0 +1,34 @@
+from datetime import datetime
+from . import db
+
+class BulkGenerationRow(db.Model):
+    __tablename__ = 'bulk_generation_row'
+    __table_args__ = (
+        db.UniqueConstraint('run_id', 'row_id', name='uq_bulk_generation_row_run_row'),
+    )
+
+    # 批量生成中每个已完成的行记录一条，重新提交同一run_id时跳过已成功的行
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.String(64), nullable=False, index=True)
+    # 上传文件中的行ID（id列，缺省为行号）
+    row_id = db.Column(db.String(255), nullable=False)
+    # succeeded / failed
+    status = db.Column(db.String(20), nullable=False)
+    generated_prompt = db.Column(db.Text, nullable=True)
+    saved_prompt_id = db.Column(db.Integer, db.ForeignKey('prompt.id'), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_time = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_time = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'run_id': self.run_id,
+            'row_id': self.row_id,
+            'status': self.status,
+            'generated_prompt': self.generated_prompt,
+            'saved_prompt_id': self.saved_prompt_id,
+            'error': self.error,
+            'created_time': self.created_time.isoformat() if self.created_time else None,
+            'updated_time': self.updated_time.isoformat() if self.updated_time else None
+        }
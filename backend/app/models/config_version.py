@@ -0,0 +1,17 @@
+from datetime import datetime
+from . import db
+
+class ConfigVersion(db.Model):
+    __tablename__ = 'config_version'
+
+    # 配置名称（如models），每次修改对应配置时版本号加一，供各worker判断本地缓存是否过期
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_time = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'version': self.version,
+            'updated_time': self.updated_time.isoformat() if self.updated_time else None
+        }
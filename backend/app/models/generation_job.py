@@ -0,0 +1,46 @@
+import json
+from datetime import datetime
+from . import db
+
+class GenerationJob(db.Model):
+    __tablename__ = 'generation_job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False, default='generate_prompt')
+    # queued / running / succeeded / failed / cancelled
+    status = db.Column(db.String(50), nullable=False, default='queued', index=True)
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    payload = db.Column(db.Text, nullable=False)
+    result = db.Column(db.Text, nullable=True)
+    saved_prompt_id = db.Column(db.Integer, db.ForeignKey('prompt.id'), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    # 重试退避：在此时间之前不会被领取
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)
+    # 领取该任务的worker及租约时间，租约过期的任务会被重新入队
+    locked_by = db.Column(db.String(255), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    created_time = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_time = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_time = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'priority': self.priority,
+            'payload': json.loads(self.payload) if self.payload else None,
+            'result': self.result,
+            'saved_prompt_id': self.saved_prompt_id,
+            'error': self.error,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'cancel_requested': self.cancel_requested,
+            'run_after': self.run_after.isoformat() if self.run_after else None,
+            'created_time': self.created_time.isoformat() if self.created_time else None,
+            'updated_time': self.updated_time.isoformat() if self.updated_time else None,
+            'finished_time': self.finished_time.isoformat() if self.finished_time else None
+        }
@@ -0,0 +1,39 @@
+from datetime import datetime
+from . import db
+
+class LLMUsage(db.Model):
+    __tablename__ = 'llm_usage'
+    __table_args__ = (
+        db.Index('ix_llm_usage_model_time', 'model_id', 'created_time'),
+        db.Index('ix_llm_usage_prompt_time', 'prompt_id', 'created_time'),
+    )
+
+    # 每次调用模型记录一行，由后台线程批量写入；不加外键，保持写入开销最小
+    id = db.Column(db.Integer, primary_key=True)
+    model_id = db.Column(db.Integer, nullable=True)
+    # 发起调用的接口（如/api/execute、job）
+    route = db.Column(db.String(100), nullable=True)
+    prompt_id = db.Column(db.Integer, nullable=True)
+    prompt_tokens = db.Column(db.Integer, nullable=False, default=0)
+    completion_tokens = db.Column(db.Integer, nullable=False, default=0)
+    cached_tokens = db.Column(db.Integer, nullable=False, default=0)
+    latency_ms = db.Column(db.Float, nullable=True)
+    ttft_ms = db.Column(db.Float, nullable=True)
+    # ok / error / timeout
+    status = db.Column(db.String(20), nullable=False, default='ok')
+    created_time = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'model_id': self.model_id,
+            'route': self.route,
+            'prompt_id': self.prompt_id,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'cached_tokens': self.cached_tokens,
+            'latency_ms': self.latency_ms,
+            'ttft_ms': self.ttft_ms,
+            'status': self.status,
+            'created_time': self.created_time.isoformat() if self.created_time else None
+        }
@@ -15,6 +15,21 @@ class ModelConfig(db.Model):
     created_time = db.Column(db.DateTime, default=datetime.utcnow)
     updated_time = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     status = db.Column(db.String(50), default='active')
+    # 连接池上限，为空时使用config.toml中[llm_client]的默认值
+    max_connections = db.Column(db.Integer, nullable=True)
+    # 最大并发请求数（所有worker合计），批量执行为空时使用config.toml中[batch]的默认值
+    max_concurrency = db.Column(db.Integer, nullable=True)
+    # 每分钟请求数和token数上限，为空表示不限制
+    rpm_limit = db.Column(db.Integer, nullable=True)
+    tpm_limit = db.Column(db.Integer, nullable=True)
+    # 熔断时改用的备用模型
+    fallback_model_id = db.Column(db.Integer, db.ForeignKey('model_config.id'), nullable=True)
+    # 超时（秒）：建立连接、等待首个token、单次调用总时长，为空时使用config.toml中[llm_client]的默认值
+    connect_timeout = db.Column(db.Float, nullable=True)
+    first_token_timeout = db.Column(db.Float, nullable=True)
+    total_timeout = db.Column(db.Float, nullable=True)
+    # 上下文窗口（token数），发送前据此拒绝过长的提示词并收紧max_tokens，为空表示不检查
+    context_window = db.Column(db.Integer, nullable=True)
     
     def to_dict(self):
         return {
@@ -28,5 +43,14 @@ class ModelConfig(db.Model):
             'is_default': self.is_default,
             'created_time': self.created_time.isoformat() if self.created_time else None,
             'updated_time': self.updated_time.isoformat() if self.updated_time else None,
-            'status': self.status
+            'status': self.status,
+            'max_connections': self.max_connections,
+            'max_concurrency': self.max_concurrency,
+            'rpm_limit': self.rpm_limit,
+            'tpm_limit': self.tpm_limit,
+            'fallback_model_id': self.fallback_model_id,
+            'connect_timeout': self.connect_timeout,
+            'first_token_timeout': self.first_token_timeout,
+            'total_timeout': self.total_timeout,
+            'context_window': self.context_window
         } 
\ No newline at end of file
@@ -7,6 +7,7 @@ class PromptShots(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     prompt_id = db.Column(db.Integer, db.ForeignKey('prompt.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    model_id = db.Column(db.Integer, db.ForeignKey('model_config.id'), nullable=True)
     created_time = db.Column(db.DateTime, default=datetime.utcnow)
     
     def to_dict(self):
@@ -14,5 +15,6 @@ class PromptShots(db.Model):
             'id': self.id,
             'prompt_id': self.prompt_id,
             'content': self.content,
+            'model_id': self.model_id,
             'created_time': self.created_time.isoformat() if self.created_time else None
         } 
\ No newline at end of file
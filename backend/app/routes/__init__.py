@@ -9,6 +9,9 @@ from .template_routes import *
 from .execution_routes import *
 from .prompt_generation_routes import *
 from .model_routes import *
+from .job_routes import *
+from .token_routes import *
+from .usage_routes import *
 
 def register_routes(app):
     # Register API blueprint
@@ -1,6 +1,24 @@
-from flask import request, jsonify
+from flask import request, jsonify, current_app
 from . import api_bp
-from ..services.llm_service import execute_prompt
+from .streaming import sse_event, sse_response, ndjson_line, ndjson_response
+from ..services.llm_service import execute_prompt, stream_prompt, plan_tokens, usage_stats
+from ..services.batch_execution_service import build_batch_prompts, get_concurrency_limit, execute_batch
+from ..services.model_comparison_service import compare_models
+from ..services.response_cache import response_cache
+from ..services.rate_limiter import rate_limiter
+from ..services.circuit_breaker import CircuitOpenError
+from ..services.request_coalescer import request_coalescer
+from ..services.request_hedger import request_hedger
+from ..services.retry_policy import retry_policy
+from ..services.prompt_assembly import prompt_assembler
+from ..services.template_service import template_cache_stats
+from ..services.semantic_cache import semantic_cache
+from ..services.request_deadline import is_timeout_error
+from ..exceptions import ContextWindowExceeded
+from ..services.model_cache import model_cache
+from ..services import tokenizer_registry
+from ..services.token_count_service import token_counter
+from ..services.usage_service import usage_recorder, usage_scope
 from ..models.prompt_shots import PromptShots
 from ..models import db
 
@@ -18,9 +36,20 @@ def execute():
     temperature = data.get('temperature')
     max_tokens = data.get('max_tokens')
     
+    if data.get('stream'):
+        return _stream_execution(data, prompt, model_id, temperature, max_tokens)
+    
     # Execute the prompt
     try:
-        result = execute_prompt(prompt, model_id, temperature, max_tokens)
+        with usage_scope(prompt_id=data.get('prompt_id')):
+            # 发送前计算输入token，超出上下文窗口时直接拒绝
+            budget = plan_tokens(prompt, model_id, max_tokens)
+            result = execute_prompt(
+                prompt, model_id, temperature, budget.max_tokens,
+                seed=data.get('seed'),
+                cache=data.get('cache'),
+                input_tokens=budget.input_tokens
+            )
         
         # If prompt_id is provided, save this execution as a shot
         prompt_id = data.get('prompt_id')
@@ -36,10 +65,194 @@ def execute():
             'result': result,
             'model_id': model_id,
             'temperature': temperature,
-            'max_tokens': max_tokens
+            'max_tokens': budget.max_tokens,
+            'input_tokens': budget.input_tokens
         })
+    except ContextWindowExceeded as e:
+        return jsonify({'error': str(e)}), 400
+    except CircuitOpenError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 504 if is_timeout_error(e) else 500
+
+def _stream_execution(data, prompt, model_id, temperature, max_tokens):
+    """Stream the execution as Server-Sent Events, saving the shot once it completes"""
+    try:
+        events = stream_prompt(prompt, model_id, temperature, max_tokens)
+    except ContextWindowExceeded as e:
+        return jsonify({'error': str(e)}), 400
+    except CircuitOpenError as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        try:
+            with usage_scope(prompt_id=data.get('prompt_id')):
+                for event in events:
+                    if event['type'] == 'delta':
+                        yield sse_event(event['content'])
+                        continue
+                    
+                    # If prompt_id is provided, save this execution as a shot
+                    prompt_id = data.get('prompt_id')
+                    if prompt_id:
+                        shot = PromptShots(
+                            prompt_id=prompt_id,
+                            content=f"Input:\n{prompt}\n\nOutput:\n{event['content']}",
+                            model_id=event['model_id']
+                        )
+                        db.session.add(shot)
+                        db.session.commit()
+                        yield sse_event(str(shot.id), event='saved')
+                    
+                    yield sse_event({
+                        'model_id': event['model_id'],
+                        'temperature': temperature,
+                        'max_tokens': max_tokens,
+                        'usage': event['usage'],
+                        'input_tokens': event['input_tokens'],
+                        'latency_ms': event['latency_ms'],
+                        'ttft_ms': event['ttft_ms']
+                    }, event='done')
+        except Exception as e:
+            current_app.logger.error(f"Streaming execution error: {str(e)}")
+            yield sse_event({'error': str(e)}, event='error')
+        finally:
+            # 客户端断开时同时取消上游生成
+            events.close()
+    
+    return sse_response(generate())
+
+@api_bp.route('/execute/batch', methods=['POST'])
+def execute_batch_route():
+    """Execute many prompts concurrently, streaming results as NDJSON in completion order"""
+    data = request.json
+    
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+    
+    model_id = data.get('model_id')
+    temperature = data.get('temperature')
+    max_tokens = data.get('max_tokens')
+    prompt_id = data.get('prompt_id')
+    
+    try:
+        prompts = build_batch_prompts(
+            prompts=data.get('prompts'),
+            template_id=data.get('template_id'),
+            template=data.get('template'),
+            variables=data.get('variables')
+        )
+        max_concurrency = get_concurrency_limit(model_id, data.get('max_concurrency'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    results = execute_batch(
+        current_app._get_current_object(),
+        prompts,
+        model_id=model_id,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        max_concurrency=max_concurrency,
+        seed=data.get('seed'),
+        cache=data.get('cache')
+    )
+    
+    def generate():
+        shots = []
+        failed = 0
+        try:
+            with usage_scope(prompt_id=prompt_id):
+                for item in results:
+                    if 'error' in item:
+                        failed += 1
+                    elif prompt_id:
+                        shots.append(PromptShots(
+                            prompt_id=prompt_id,
+                            content=f"Input:\n{item['prompt']}\n\nOutput:\n{item['result']}"
+                        ))
+                    yield ndjson_line(item)
+        finally:
+            results.close()
+        
+        # 所有结果完成后一次性批量写入shots
+        if shots:
+            db.session.add_all(shots)
+            db.session.commit()
+        
+        yield ndjson_line({
+            'done': True,
+            'total': len(prompts),
+            'succeeded': len(prompts) - failed,
+            'failed': failed,
+            'shots_saved': len(shots)
+        })
+    
+    return ndjson_response(generate())
+
+@api_bp.route('/execute/compare', methods=['POST'])
+def execute_compare_route():
+    """Execute one prompt on several models in parallel and compare the results"""
+    data = request.json
+    
+    if not data or not data.get('prompt'):
+        return jsonify({'error': 'Prompt is required'}), 400
+    
+    prompt = data.get('prompt')
+    
+    try:
+        with usage_scope(prompt_id=data.get('prompt_id')):
+            comparison = compare_models(
+                current_app._get_current_object(),
+                prompt,
+                data.get('model_ids') or [],
+                temperature=data.get('temperature'),
+                max_tokens=data.get('max_tokens')
+            )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # If prompt_id is provided, save each model's output as a shot tagged with the model
+    prompt_id = data.get('prompt_id')
+    if prompt_id:
+        db.session.add_all([
+            PromptShots(
+                prompt_id=prompt_id,
+                content=f"Input:\n{prompt}\n\nOutput:\n{result['output']}",
+                model_id=result['model_id']
+            )
+            for result in comparison['results'] if 'output' in result
+        ])
+        db.session.commit()
+    
+    comparison['prompt'] = prompt
+    return jsonify(comparison)
+
+@api_bp.route('/execute/stats', methods=['GET'])
+def get_execution_stats():
+    """Get execution statistics for this worker process"""
+    return jsonify({
+        'cache': response_cache.stats(),
+        'rate_limit': rate_limiter.stats(),
+        'coalescing': request_coalescer.stats(),
+        'hedging': request_hedger.stats(),
+        'usage': usage_stats(),
+        'model_cache': model_cache.stats(),
+        'tokenizer': tokenizer_registry.stats(),
+        'token_count': token_counter.stats(),
+        'usage_records': usage_recorder.stats(),
+        'retry': retry_policy.stats(),
+        'prompt_assembly': prompt_assembler.stats(),
+        'templates': template_cache_stats(),
+        'semantic_cache': semantic_cache.stats()
+    })
+
+@api_bp.route('/execute/cache', methods=['DELETE'])
+def clear_execution_cache():
+    """Clear the LLM response cache"""
+    response_cache.clear()
+    return jsonify({'message': 'Response cache cleared successfully'})
 
 @api_bp.route('/prompts/<int:prompt_id>/shots', methods=['GET'])
 def get_prompt_shots(prompt_id):
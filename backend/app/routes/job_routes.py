@@ -0,0 +1,96 @@
+"""
+Job Routes Module
+
+This module defines API routes for background prompt generation jobs.
+A job is submitted and its id returned immediately; clients then poll the
+job or subscribe to its status events until it finishes.
+"""
+
+import time
+from flask import request, jsonify, current_app
+from . import api_bp
+from .streaming import sse_event, sse_response
+from ..models import db
+from ..services.job_service import submit_job, get_job, get_jobs, cancel_job, TERMINAL_STATUSES
+
+# 事件流轮询任务状态的间隔（秒）
+_EVENTS_POLL_INTERVAL = 1.0
+
+@api_bp.route('/jobs', methods=['POST'])
+def create_job():
+    """Submit a prompt generation job"""
+    data = request.json
+
+    if not data or not data.get('user_description'):
+        return jsonify({'error': 'User description is required'}), 400
+
+    payload = {
+        'user_description': data.get('user_description'),
+        'template_id': data.get('template_id'),
+        'temperature': data.get('temperature', 0.7),
+        'language': data.get('language', 'chinese'),
+        'regenerate': data.get('regenerate', False),
+        'save_prompt': data.get('save_prompt', False),
+        'prompt_name': data.get('prompt_name', 'Generated Prompt')
+    }
+
+    try:
+        job = submit_job(payload, priority=data.get('priority', 0), max_attempts=data.get('max_attempts'))
+        return jsonify(job.to_dict()), 202
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error submitting job: {str(e)}")
+        return jsonify({'error': f'Failed to submit job: {str(e)}'}), 500
+
+@api_bp.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Get recent jobs, optionally filtered by status"""
+    status = request.args.get('status')
+    limit = request.args.get('limit', 100, type=int)
+
+    jobs = get_jobs(status, limit)
+    return jsonify([job.to_dict() for job in jobs])
+
+@api_bp.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job_route(job_id):
+    """Get a job's status and result"""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify(job.to_dict())
+
+@api_bp.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_job_route(job_id):
+    """Cancel a queued or running job"""
+    job = cancel_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify(job.to_dict())
+
+@api_bp.route('/jobs/<int:job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Stream a job's status changes as Server-Sent Events until it finishes"""
+    if not get_job(job_id):
+        return jsonify({'error': 'Job not found'}), 404
+
+    def generate():
+        last_state = None
+        while True:
+            job = get_job(job_id)
+            state = (job.status, job.attempts, job.cancel_requested)
+            if state != last_state:
+                last_state = state
+                yield sse_event(job.to_dict(), event='status')
+
+            if job.status in TERMINAL_STATUSES:
+                yield sse_event(job.to_dict(), event='done')
+                return
+
+            # 结束本次读事务，下次轮询才能看到worker提交的更新
+            db.session.remove()
+            time.sleep(_EVENTS_POLL_INTERVAL)
+
+    return sse_response(generate())
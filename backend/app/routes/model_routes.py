@@ -4,8 +4,10 @@ from ..models import db
 from ..models.model_config import ModelConfig
 from ..services.model_service import (
     get_models, get_model, get_default_model, 
-    create_model, update_model, delete_model, set_default_model
+    create_model, update_model, delete_model, set_default_model,
+    unset_default_model, UNSET
 )
+from ..services.circuit_breaker import circuit_breaker
 
 @api_bp.route('/models', methods=['GET'])
 def get_models_route():
@@ -47,15 +49,27 @@ def create_model_route():
     if missing_fields:
         return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
     
-    model = create_model(
-        name=data.get('name'),
-        model_id=data.get('model_id'),
-        base_url=data.get('base_url'),
-        api_key=data.get('api_key', ''),
-        api_type=data.get('api_type', 'openai'),
-        api_version=data.get('api_version', ''),
-        is_default=data.get('is_default', False)
-    )
+    try:
+        model = create_model(
+            name=data.get('name'),
+            model_id=data.get('model_id'),
+            base_url=data.get('base_url'),
+            api_key=data.get('api_key', ''),
+            api_type=data.get('api_type', 'openai'),
+            api_version=data.get('api_version', ''),
+            is_default=data.get('is_default', False),
+            max_connections=data.get('max_connections'),
+            max_concurrency=data.get('max_concurrency'),
+            rpm_limit=data.get('rpm_limit'),
+            tpm_limit=data.get('tpm_limit'),
+            fallback_model_id=data.get('fallback_model_id'),
+            connect_timeout=data.get('connect_timeout'),
+            first_token_timeout=data.get('first_token_timeout'),
+            total_timeout=data.get('total_timeout'),
+            context_window=data.get('context_window')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify(model.to_dict()), 201
 
@@ -67,16 +81,28 @@ def update_model_route(model_id):
     if not data:
         return jsonify({'error': 'No data provided'}), 400
     
-    model = update_model(
-        model_id=model_id,
-        name=data.get('name'),
-        model_id_new=data.get('model_id'),
-        base_url=data.get('base_url'),
-        api_key=data.get('api_key'),
-        api_type=data.get('api_type'),
-        api_version=data.get('api_version'),
-        is_default=data.get('is_default')
-    )
+    try:
+        model = update_model(
+            model_id=model_id,
+            name=data.get('name'),
+            model_id_new=data.get('model_id'),
+            base_url=data.get('base_url'),
+            api_key=data.get('api_key'),
+            api_type=data.get('api_type'),
+            api_version=data.get('api_version'),
+            is_default=data.get('is_default'),
+            max_connections=data.get('max_connections', UNSET),
+            max_concurrency=data.get('max_concurrency', UNSET),
+            rpm_limit=data.get('rpm_limit', UNSET),
+            tpm_limit=data.get('tpm_limit', UNSET),
+            fallback_model_id=data.get('fallback_model_id', UNSET),
+            connect_timeout=data.get('connect_timeout', UNSET),
+            first_token_timeout=data.get('first_token_timeout', UNSET),
+            total_timeout=data.get('total_timeout', UNSET),
+            context_window=data.get('context_window', UNSET)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     if not model:
         return jsonify({'error': 'Model not found'}), 404
@@ -101,4 +127,46 @@ def set_default_model_route(model_id):
     if not result:
         return jsonify({'error': 'Model not found'}), 404
     
-    return jsonify({'message': 'Default model set successfully'}) 
\ No newline at end of file
+    return jsonify({'message': 'Default model set successfully'})
+
+@api_bp.route('/models/<int:model_id>/default', methods=['DELETE'])
+def unset_default_model_route(model_id):
+    """Clear the default flag of a model"""
+    result = unset_default_model(model_id)
+    
+    if not result:
+        return jsonify({'error': 'Model not found'}), 404
+    
+    return jsonify({'message': 'Default model unset successfully'})
+
+@api_bp.route('/models/health', methods=['GET'])
+def get_models_health_route():
+    """Get circuit breaker state and recent error rate and latency of all models"""
+    models = get_models()
+    return jsonify([
+        {'id': model.id, 'name': model.name, 'fallback_model_id': model.fallback_model_id,
+         **circuit_breaker.health(model.id)}
+        for model in models
+    ])
+
+@api_bp.route('/models/<int:model_id>/health', methods=['GET'])
+def get_model_health_route(model_id):
+    """Get circuit breaker state and recent error rate and latency of a model"""
+    model = get_model(model_id)
+    
+    if not model:
+        return jsonify({'error': 'Model not found'}), 404
+    
+    return jsonify({'id': model.id, 'name': model.name, 'fallback_model_id': model.fallback_model_id,
+                    **circuit_breaker.health(model.id)})
+
+@api_bp.route('/models/<int:model_id>/health/reset', methods=['POST'])
+def reset_model_health_route(model_id):
+    """Close a model's circuit manually"""
+    model = get_model(model_id)
+    
+    if not model:
+        return jsonify({'error': 'Model not found'}), 404
+    
+    circuit_breaker.reset(model.id)
+    return jsonify({'message': 'Circuit closed successfully'})
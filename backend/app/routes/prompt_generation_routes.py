@@ -8,8 +8,16 @@ format the prompt. The generated prompts can also be saved to the database.
 
 from flask import request, jsonify, current_app
 from . import api_bp
-from ..services.prompt_generator_service import generate_prompt_with_llm
+from .streaming import ndjson_line, ndjson_response, sse_event, sse_response
+from ..services.prompt_generator_service import generate_prompt_cached, stream_prompt_with_llm
 from ..services.prompt_service import create_prompt
+from ..services.semantic_cache import semantic_cache
+from ..services.batch_execution_service import get_concurrency_limit
+from ..services.bulk_generation_service import (
+    generate_bulk, get_run_rows, new_run_id, normalize_rows, parse_rows, pending_rows
+)
+from ..services.circuit_breaker import CircuitOpenError
+from ..services.request_deadline import is_timeout_error
 
 @api_bp.route('/generate-prompt', methods=['POST'])
 def generate_prompt_route():
@@ -25,15 +33,23 @@ def generate_prompt_route():
     save_prompt = data.get('save_prompt', False)
     prompt_name = data.get('prompt_name', 'Generated Prompt')
     language = data.get('language', 'chinese')  # Default to Chinese if not specified
+    # 为true时不使用语义缓存中近似描述的结果，重新生成
+    regenerate = data.get('regenerate', False)
+    
+    if data.get('stream'):
+        return _stream_generation(user_description, template_id, temperature, language, save_prompt, prompt_name,
+                                  regenerate)
     
     try:
-        # Generate the prompt
-        generated_prompt = generate_prompt_with_llm(
+        # Generate the prompt, or reuse the generation of a near-duplicate description
+        generation = generate_prompt_cached(
             user_description=user_description,
             template_id=template_id,
             temperature=temperature,
-            language=language
+            language=language,
+            regenerate=regenerate
         )
+        generated_prompt = generation['generated_prompt']
         
         # Save the prompt if requested
         saved_prompt = None
@@ -46,14 +62,33 @@ def generate_prompt_route():
             
         response = {
             'generated_prompt': generated_prompt,
+            'cached': generation['cached'],
         }
         
+        if generation['cached']:
+            # 前端据此提示结果来自缓存，并可以选择重新生成
+            response['similarity'] = generation['similarity']
+            response['cached_description'] = generation['cached_description']
+        
         if saved_prompt:
             response['saved_prompt'] = saved_prompt.to_dict()
             
         return jsonify(response)
         
+    except CircuitOpenError as e:
+        current_app.logger.error(f"Model unavailable for prompt generation: {str(e)}")
+        return jsonify({
+            'error': str(e),
+            'error_type': 'model_unavailable',
+            'suggestions': [
+                '稍后重试',
+                '为该模型配置备用模型',
+                '尝试使用不同的模型'
+            ]
+        }), 503
     except ValueError as e:
+        if is_timeout_error(e):
+            return _timeout_response(e)
         current_app.logger.error(f"Value error in prompt generation: {str(e)}")
         return jsonify({
             'error': str(e),
@@ -65,6 +100,8 @@ def generate_prompt_route():
             ]
         }), 400
     except Exception as e:
+        if is_timeout_error(e):
+            return _timeout_response(e)
         current_app.logger.error(f"Error in prompt generation: {str(e)}")
         return jsonify({
             'error': f'An error occurred during prompt generation: {str(e)}',
@@ -74,4 +111,209 @@ def generate_prompt_route():
                 '确保API密钥已正确配置',
                 '稍后重试'
             ]
-        }), 500 
\ No newline at end of file
+        }), 500
+
+def _timeout_response(error):
+    """Response for a generation that ran out of time"""
+    current_app.logger.error(f"Prompt generation timed out: {str(error)}")
+    return jsonify({
+        'error': str(error),
+        'error_type': 'timeout',
+        'suggestions': [
+            '稍后重试',
+            '尝试降低生成的token数量',
+            '为该模型调整超时配置'
+        ]
+    }), 504
+
+@api_bp.route('/generate-prompt/stream/direct', methods=['GET'])
+def generate_prompt_stream_route():
+    """Generate a prompt using LLM and stream it as Server-Sent Events (EventSource friendly)"""
+    user_description = request.args.get('user_description')
+    
+    if not user_description:
+        return jsonify({'error': 'User description is required'}), 400
+    
+    return _stream_generation(
+        user_description=user_description,
+        template_id=request.args.get('template_id', type=int),
+        temperature=request.args.get('temperature', 0.7, type=float),
+        language=request.args.get('language', 'chinese'),
+        save_prompt=request.args.get('save_prompt', 'false').lower() == 'true',
+        prompt_name=request.args.get('prompt_name', 'Generated Prompt'),
+        regenerate=request.args.get('regenerate', 'false').lower() == 'true'
+    )
+
+@api_bp.route('/generate-prompt/bulk', methods=['POST'])
+def generate_prompt_bulk_route():
+    """Generate prompts for every row of a CSV/JSONL upload, streaming results as NDJSON in completion order"""
+    if request.files:
+        # multipart上传：file字段为文件，其余参数在表单中
+        data = request.form
+        upload = request.files.get('file')
+        if not upload:
+            return jsonify({'error': 'File is required'}), 400
+        content = upload.read().decode('utf-8-sig')
+        format = data.get('format') or _upload_format(upload.filename)
+    else:
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        content = data.get('content')
+        format = data.get('format')
+    
+    run_id = (data.get('run_id') or '').strip() or new_run_id()
+    if len(run_id) > 64:
+        return jsonify({'error': 'run_id must be at most 64 characters'}), 400
+    
+    try:
+        if isinstance(data.get('rows'), list):
+            rows = normalize_rows(enumerate(data['rows'], start=1))
+        elif content:
+            rows = parse_rows(content, format)
+        else:
+            return jsonify({'error': 'A file, content or rows are required'}), 400
+        temperature = float(data.get('temperature', 0.7))
+        max_concurrency = get_concurrency_limit(None, data.get('max_concurrency'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    save_prompt = data.get('save_prompt', False)
+    if isinstance(save_prompt, str):
+        save_prompt = save_prompt.lower() in ('true', '1')
+    prompt_name = data.get('prompt_name') or 'Generated Prompt'
+    
+    # 同一run_id重新提交时跳过已成功的行
+    rows, skipped = pending_rows(run_id, rows)
+    
+    results = generate_bulk(
+        current_app._get_current_object(),
+        run_id,
+        rows,
+        temperature=temperature,
+        max_concurrency=max_concurrency,
+        save_prompt=save_prompt,
+        prompt_name=prompt_name
+    )
+    
+    def generate():
+        failed = 0
+        saved = 0
+        try:
+            for item in results:
+                if 'saved' in item:
+                    saved += len(item['saved'])
+                elif 'error' in item:
+                    failed += 1
+                yield ndjson_line(item)
+        finally:
+            results.close()
+        
+        yield ndjson_line({
+            'done': True,
+            'run_id': run_id,
+            'total': len(rows) + skipped,
+            'skipped': skipped,
+            'succeeded': len(rows) - failed,
+            'failed': failed,
+            'prompts_saved': saved if save_prompt else 0
+        })
+    
+    response = ndjson_response(generate())
+    # 在结果开始前告知run_id，中断后可用它续跑
+    response.headers['X-Run-Id'] = run_id
+    return response
+
+@api_bp.route('/generate-prompt/bulk/<run_id>', methods=['GET'])
+def get_bulk_run(run_id):
+    """Get the recorded rows of a bulk generation run"""
+    rows = get_run_rows(run_id)
+    if not rows:
+        return jsonify({'error': 'Run not found'}), 404
+    
+    return jsonify({
+        'run_id': run_id,
+        'succeeded': sum(1 for row in rows if row.status == 'succeeded'),
+        'failed': sum(1 for row in rows if row.status == 'failed'),
+        'rows': [row.to_dict() for row in rows]
+    })
+
+@api_bp.route('/generate-prompt/cache', methods=['DELETE'])
+def clear_generation_cache():
+    """Clear the semantic cache of generated prompts"""
+    semantic_cache.clear()
+    return jsonify({'message': 'Semantic cache cleared successfully'})
+
+def _upload_format(filename):
+    """Guess an upload's format from its file extension"""
+    extension = (filename or '').rsplit('.', 1)[-1].lower()
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension == 'csv':
+        return 'csv'
+    return None
+
+def _stream_generation(user_description, template_id, temperature, language, save_prompt, prompt_name,
+                       regenerate=False):
+    """Stream the generated prompt as Server-Sent Events, saving it once it completes"""
+    try:
+        events = stream_prompt_with_llm(
+            user_description=user_description,
+            template_id=template_id,
+            temperature=temperature,
+            language=language,
+            regenerate=regenerate
+        )
+    except CircuitOpenError as e:
+        current_app.logger.error(f"Model unavailable for prompt generation: {str(e)}")
+        return jsonify({'error': str(e), 'error_type': 'model_unavailable'}), 503
+    except ValueError as e:
+        current_app.logger.error(f"Value error in prompt generation: {str(e)}")
+        return jsonify({'error': str(e), 'error_type': 'value_error'}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error in prompt generation: {str(e)}")
+        return jsonify({
+            'error': f'An error occurred during prompt generation: {str(e)}',
+            'error_type': 'system_error'
+        }), 500
+    
+    def generate():
+        try:
+            for event in events:
+                if event['type'] == 'delta':
+                    yield sse_event(event['content'])
+                    continue
+                
+                generated_prompt = event['content']
+                if not generated_prompt.strip():
+                    raise ValueError("生成的提示词为空，请重试")
+                
+                if save_prompt:
+                    saved_prompt = create_prompt(
+                        name=prompt_name,
+                        content=generated_prompt,
+                        source='generated'
+                    )
+                    yield sse_event(str(saved_prompt.id), event='saved')
+                
+                done = {
+                    'model_id': event['model_id'],
+                    'usage': event['usage'],
+                    'latency_ms': event['latency_ms'],
+                    'ttft_ms': event['ttft_ms'],
+                    'cached': event['cached']
+                }
+                if event['cached']:
+                    done['similarity'] = event['similarity']
+                    done['cached_description'] = event['cached_description']
+                yield sse_event(done, event='done')
+        except Exception as e:
+            current_app.logger.error(f"Error in streaming prompt generation: {str(e)}")
+            yield sse_event({
+                'error': str(e),
+                'error_type': 'value_error' if isinstance(e, ValueError) else 'system_error'
+            }, event='error')
+        finally:
+            events.close()
+    
+    return sse_response(generate())
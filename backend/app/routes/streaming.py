@@ -0,0 +1,48 @@
+"""
+Streaming response helpers shared by the API routes.
+"""
+
+import json
+from flask import Response, stream_with_context
+
+def sse_event(data, event=None) -> str:
+    """
+    Format one Server-Sent Event.
+
+    Strings are sent as-is (split over several data lines when they contain
+    newlines, which EventSource joins back together); anything else is sent
+    as JSON.
+    """
+    if not isinstance(data, str):
+        data = json.dumps(data, ensure_ascii=False)
+
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in data.split('\n'))
+    return '\n'.join(lines) + '\n\n'
+
+def sse_response(events) -> Response:
+    """Wrap a generator of formatted events in a streaming text/event-stream response"""
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # 禁止nginx缓冲，保证chunk立即下发
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+def ndjson_line(data) -> str:
+    """Format one newline-delimited JSON record"""
+    return json.dumps(data, ensure_ascii=False) + '\n'
+
+def ndjson_response(lines) -> Response:
+    """Wrap a generator of NDJSON lines in a streaming application/x-ndjson response"""
+    return Response(
+        stream_with_context(lines),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
@@ -1,6 +1,8 @@
 from flask import request, jsonify
 from ..models import db
 from ..models.prompt_template import PromptTemplate
+from ..services.prompt_assembly import prompt_assembler
+from ..services.template_service import get_template_variables, render_many
 from . import api_bp
 
 @api_bp.route('/templates', methods=['GET'])
@@ -57,6 +59,8 @@ def update_template(template_id):
         template.content = data['content']
     
     db.session.commit()
+    # 模板内容已编译进提示词前缀，通知各worker重新编译
+    prompt_assembler.invalidate()
     
     return jsonify(template.to_dict())
 
@@ -70,5 +74,36 @@ def delete_template(template_id):
     
     template.status = 'deleted'
     db.session.commit()
+    prompt_assembler.invalidate()
     
-    return jsonify({'message': 'Template deleted successfully'}) 
\ No newline at end of file
+    return jsonify({'message': 'Template deleted successfully'}) 
+
+@api_bp.route('/templates/<int:template_id>/render', methods=['POST'])
+def render_template_route(template_id):
+    """Render a template with many variable sets in one call"""
+    template = PromptTemplate.query.get(template_id)
+    
+    if not template:
+        return jsonify({'error': 'Template not found'}), 404
+    
+    data = request.json
+    variable_sets = data.get('variables') if data else None
+    
+    if isinstance(variable_sets, dict):
+        variable_sets = [variable_sets]
+    if not isinstance(variable_sets, list) or not variable_sets:
+        return jsonify({'error': 'variables must be a non-empty list of variable sets'}), 400
+    
+    try:
+        results = render_many(template.content, variable_sets, allow_missing=bool(data.get('allow_missing')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    failed = sum(1 for result in results if 'error' in result)
+    return jsonify({
+        'template_id': template.id,
+        'variables': sorted(get_template_variables(template.content)),
+        'rendered': len(results) - failed,
+        'failed': failed,
+        'results': results
+    })
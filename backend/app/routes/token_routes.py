@@ -0,0 +1,37 @@
+"""
+Token Routes Module
+
+This module defines the API route for counting tokens. One request can count
+many texts, message lists, all versions of a prompt and a template catalog
+with a model's tokenizer, for live token counts in the editor.
+"""
+
+from flask import request, jsonify
+from . import api_bp
+from ..services.model_cache import model_cache
+from ..services.token_count_service import count_tokens
+
+@api_bp.route('/tokens/count', methods=['POST'])
+def count_tokens_route():
+    """Count tokens for texts, message lists, prompt versions or templates"""
+    data = request.json
+
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+
+    if not any(data.get(field) is not None for field in ('texts', 'messages', 'prompt_id', 'template_ids')):
+        return jsonify({'error': 'One of texts, messages, prompt_id or template_ids is required'}), 400
+
+    try:
+        model_config = model_cache.resolve(data.get('model_id'))
+        result = count_tokens(
+            model_config,
+            texts=data.get('texts'),
+            messages=data.get('messages'),
+            prompt_id=data.get('prompt_id'),
+            template_ids=data.get('template_ids')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(result)
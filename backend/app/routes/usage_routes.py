@@ -0,0 +1,48 @@
+"""
+Usage Routes Module
+
+This module defines the API route for aggregated LLM usage: requests, errors,
+tokens and latency per model, prompt, route and time bucket.
+"""
+
+from datetime import datetime
+from flask import request, jsonify
+from . import api_bp
+from ..services.usage_service import aggregate_usage
+
+@api_bp.route('/usage', methods=['GET'])
+def get_usage():
+    """Aggregate recorded LLM usage (calls of the last [usage] flush_interval may not be written yet)"""
+    group_by = [field for field in request.args.get('group_by', 'model').split(',') if field]
+
+    try:
+        since = _parse_time(request.args.get('since'))
+        until = _parse_time(request.args.get('until'))
+
+        groups = aggregate_usage(
+            group_by,
+            bucket=request.args.get('bucket', 'hour'),
+            since=since,
+            until=until,
+            model_id=request.args.get('model_id', type=int),
+            prompt_id=request.args.get('prompt_id', type=int),
+            route=request.args.get('route'),
+            order_by=request.args.get('order_by', 'total_tokens'),
+            limit=min(request.args.get('limit', 100, type=int), 1000)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'group_by': group_by,
+        'groups': groups
+    })
+
+def _parse_time(value):
+    """Parse an ISO 8601 time parameter (UTC)"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError(f"Invalid time: {value} (expected ISO 8601)")
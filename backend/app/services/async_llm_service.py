@@ -0,0 +1,162 @@
+"""
+Async LLM Service Module
+
+This module provides the coroutine-based execution path used by the ASGI
+server. Provider calls go through the async LLM class, so a single process can
+keep many generations in flight while waiting on the network. Database work
+(model lookup, template lookup, saving results) is short and runs in a worker
+thread inside the Flask app context.
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Sequence, Tuple
+
+from ..llm import LLM
+from ..schema import Message
+from .request_coalescer import request_coalescer
+from .request_deadline import request_deadline
+from .token_budget import plan as plan_budget
+
+async def run_in_app_context(app, func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking function (e.g. database access) in a thread inside the Flask app context"""
+    def call():
+        with app.app_context():
+            return func(*args, **kwargs)
+
+    return await asyncio.to_thread(call)
+
+async def execute_prompt_async(
+    app,
+    prompt: str,
+    model_id: Optional[int] = None,
+    temperature: float = 0.7,
+    max_tokens: int = 2000,
+    system: Optional[Sequence[str]] = None,
+    input_tokens: Optional[int] = None,
+    prefix=None
+) -> str:
+    """
+    Execute a prompt using the specified LLM or the default model without blocking the event loop.
+
+    Args:
+        app: The Flask application, used for database access
+        prompt: The prompt text to send to the LLM
+        model_id: Optional model ID to use (if not provided, will use default)
+        temperature: Temperature parameter for generation
+        max_tokens: Maximum tokens to generate
+        system: Optional static instructions sent before the prompt as system messages
+        input_tokens: Input tokens already counted by plan_tokens, to skip counting again
+        prefix: Compiled prefix the system segments come from (see token_budget.plan)
+
+    Returns:
+        str: The generated response
+
+    Raises:
+        ContextWindowExceeded: If the prompt cannot fit in the model's context window
+    """
+    model_config, llm = await run_in_app_context(app, _get_llm, model_id)
+    # 计数要对整个提示词编码，在线程中执行
+    budget = await run_in_app_context(app, plan_budget, model_config, prompt, max_tokens, system, input_tokens, prefix)
+    max_tokens = budget.max_tokens
+
+    # 相同的请求正在进行时等待其结果，不重复调用模型；重试共用一个截止时间
+    with request_deadline():
+        return await request_coalescer.do_async(
+            request_coalescer.make_key(model_config, prompt, temperature, max_tokens, system=system),
+            lambda: llm.ask(
+                [Message.user_message(prompt)],
+                # 合并为一条系统消息：format_messages会重排多条消息
+                system_msgs=[Message.system_message("\n\n".join(system))] if system else None,
+                stream=False,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+        )
+
+async def stream_prompt_async(
+    app,
+    prompt: str,
+    model_id: Optional[int] = None,
+    temperature: float = 0.7,
+    max_tokens: int = 2000,
+    system: Optional[Sequence[str]] = None,
+    input_tokens: Optional[int] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream a prompt execution without blocking the event loop.
+
+    Args:
+        app: The Flask application, used for database access
+        prompt: The prompt text to send to the LLM
+        model_id: Optional model ID to use (if not provided, will use default)
+        temperature: Temperature parameter for generation
+        max_tokens: Maximum tokens to generate
+        system: Optional static instructions sent before the prompt as system messages
+        input_tokens: Input tokens already counted by plan_tokens, to skip counting again
+
+    Yields:
+        The events of LLM.ask_stream: 'delta' for every chunk, 'finish' and
+        finally 'usage', which also carries the model_id that was used
+
+    Raises:
+        ContextWindowExceeded: If the prompt cannot fit in the model's context window
+    """
+    model_config, llm = await run_in_app_context(app, _get_llm, model_id)
+    # 计数要对整个提示词编码，在线程中执行
+    budget = await run_in_app_context(app, plan_budget, model_config, prompt, max_tokens, system, input_tokens)
+    max_tokens = budget.max_tokens
+
+    with request_deadline():
+        async for event in llm.ask_stream(
+            [Message.user_message(prompt)],
+            system_msgs=[Message.system_message("\n\n".join(system))] if system else None,
+            temperature=temperature,
+            max_tokens=max_tokens
+        ):
+            if event['type'] == 'usage':
+                event['model_id'] = model_config.id
+            yield event
+
+async def generate_prompt_async(
+    app,
+    user_description: str,
+    template_id: Optional[int] = None,
+    temperature: float = 0.7,
+    language: str = 'chinese',
+    regenerate: bool = False
+) -> Dict[str, Any]:
+    """
+    Generate a prompt based on user description and optionally a template, or
+    return the generation of a near-duplicate earlier description.
+
+    Returns:
+        Dict[str, Any]: As prompt_generator_service.generate_prompt_cached
+
+    Raises:
+        ValueError: If the template is not found or the generated prompt is empty
+    """
+    from .prompt_generator_service import _build_prompt
+    from .semantic_cache import semantic_cache
+
+    if not regenerate:
+        hit = await run_in_app_context(app, semantic_cache.lookup, user_description, template_id, language)
+        if hit:
+            return {**hit, 'cached': True}
+
+    request = await run_in_app_context(app, _build_prompt, user_description, template_id, language)
+
+    generated_prompt = await execute_prompt_async(app, temperature=temperature, **request)
+
+    # 确保得到的结果不为空
+    if not generated_prompt or len(generated_prompt.strip()) == 0:
+        raise ValueError("生成的提示词为空，请重试")
+
+    await run_in_app_context(app, semantic_cache.store, user_description, generated_prompt, template_id, language)
+    return {'generated_prompt': generated_prompt, 'cached': False}
+
+def _get_llm(model_id: Optional[int] = None) -> Tuple[Any, LLM]:
+    """Resolve the model configuration, routing around open circuits, and get its LLM instance (needs app context)"""
+    from .llm_service import _select_model
+
+    model_config = _select_model(model_id)
+    return model_config, LLM.for_model(model_config)
@@ -0,0 +1,113 @@
+"""
+Batch Execution Service Module
+
+This module runs one prompt over many inputs. Prompts are executed
+concurrently through execute_prompt, bounded by the model's concurrency limit,
+and results are yielded in completion order tagged with their input index.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional
+
+from ..config.config import config
+from ..models.prompt_template import PromptTemplate
+from .llm_service import execute_prompt, _resolve_model_config
+from .template_service import render_template
+from .usage_service import current_usage_scope, usage_scope
+
+def build_batch_prompts(
+    prompts: Optional[List[str]] = None,
+    template_id: Optional[int] = None,
+    template: Optional[str] = None,
+    variables: Optional[List[Dict[str, Any]]] = None
+) -> List[str]:
+    """
+    Build the list of prompts for a batch, either given directly or rendered from a template.
+
+    Args:
+        prompts: Explicit list of prompt texts
+        template_id: ID of a stored template to render with each variable set
+        template: Inline template content to render with each variable set
+        variables: List of variable sets for the template
+
+    Returns:
+        List[str]: The prompts to execute
+
+    Raises:
+        ValueError: If the input is empty, too large, or the template is not found
+    """
+    if prompts:
+        result = [str(prompt) for prompt in prompts]
+    else:
+        if template_id:
+            stored = PromptTemplate.query.get(template_id)
+            if not stored:
+                raise ValueError(f"Template with ID {template_id} not found")
+            template = stored.content
+
+        if not template or not variables:
+            raise ValueError("Either prompts or a template with variables is required")
+
+        result = [render_template(template, variable_set) for variable_set in variables]
+
+    if len(result) > config.batch.max_items:
+        raise ValueError(f"Batch is limited to {config.batch.max_items} items")
+
+    return result
+
+def get_concurrency_limit(model_id: Optional[int] = None, requested: Optional[int] = None) -> int:
+    """Get the concurrency for a batch, capped by the model's limit"""
+    model_config = _resolve_model_config(model_id)
+    limit = model_config.max_concurrency or config.batch.max_concurrency
+
+    if requested:
+        limit = min(limit, int(requested))
+
+    return max(limit, 1)
+
+def execute_batch(
+    app,
+    prompts: List[str],
+    model_id: Optional[int] = None,
+    temperature: float = 0.7,
+    max_tokens: int = 2000,
+    max_concurrency: int = 1,
+    seed: Optional[int] = None,
+    cache: Optional[bool] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Execute prompts concurrently and yield results as they complete.
+
+    Args:
+        app: The Flask application, used to give each worker thread an app context
+        prompts: The prompts to execute
+        model_id: Optional model ID to use (if not provided, will use default)
+        temperature: Temperature parameter for generation
+        max_tokens: Maximum tokens to generate
+        max_concurrency: Maximum number of prompts in flight at once
+        seed: Optional sampling seed
+        cache: Response cache override passed to execute_prompt
+
+    Returns:
+        Iterator of {'index', 'prompt', 'result'} or {'index', 'prompt', 'error'} dicts
+    """
+    # 工作线程中的调用记入发起批量执行的接口和提示词
+    scope = current_usage_scope()
+
+    def run(prompt):
+        with app.app_context(), usage_scope(*scope):
+            return execute_prompt(prompt, model_id, temperature, max_tokens, seed=seed, cache=cache)
+
+    executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='batch-execute')
+    try:
+        futures = {executor.submit(run, prompt): index for index, prompt in enumerate(prompts)}
+
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                yield {'index': index, 'prompt': prompts[index], 'result': future.result()}
+            except Exception as e:
+                yield {'index': index, 'prompt': prompts[index], 'error': str(e)}
+    finally:
+        # 客户端断开时取消尚未开始的请求
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,255 @@
+"""
+Bulk Generation Service Module
+
+This module generates prompts for every row of an uploaded CSV or JSONL file.
+Rows run through generate_prompt_with_llm concurrently, bounded by the default
+model's concurrency limit, and results are yielded in completion order.
+
+Finished rows are saved in batches of save_batch_size: the generated prompts
+(when requested) and one bulk_generation_row record per row are written in a
+single transaction. Submitting the same file again with the same run_id skips
+the rows that already succeeded, so an interrupted run resumes where it
+stopped, losing at most the rows of its last unsaved batch.
+"""
+
+import csv
+import io
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from flask import current_app
+
+from ..config.config import config
+from ..models import db
+from ..models.bulk_generation_row import BulkGenerationRow
+from .prompt_generator_service import generate_prompt_with_llm
+from .prompt_service import create_prompts
+from .usage_service import current_usage_scope, usage_scope
+
+FORMATS = ('csv', 'jsonl')
+
+LANGUAGES = ('chinese', 'english')
+
+def parse_rows(content: str, format: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Parse an uploaded file into generation rows.
+
+    Args:
+        content: The file content
+        format: 'csv' or 'jsonl'; detected from the content when not given
+
+    Returns:
+        List of rows with 'row_id', 'user_description', 'template_id', 'language' and 'name'
+
+    Raises:
+        ValueError: If the format is unknown or a row is invalid
+    """
+    if not format:
+        format = 'jsonl' if content.lstrip().startswith('{') else 'csv'
+    if format not in FORMATS:
+        raise ValueError(f"Unsupported format: {format} (supported: {', '.join(FORMATS)})")
+
+    if format == 'csv':
+        # 表头占第1行，数据行从第2行开始
+        records = enumerate(csv.DictReader(io.StringIO(content)), start=2)
+    else:
+        records = []
+        for line_number, line in enumerate(content.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                records.append((line_number, json.loads(line)))
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Line {line_number}: invalid JSON ({e.msg})")
+
+    return normalize_rows(records)
+
+def normalize_rows(records) -> List[Dict[str, Any]]:
+    """
+    Validate rows given as (line number, record) pairs.
+
+    Raises:
+        ValueError: If there are no rows, too many rows, duplicate row IDs or an invalid row
+    """
+    rows = []
+    seen = set()
+    for line_number, record in records:
+        if not isinstance(record, dict):
+            raise ValueError(f"Row {line_number}: expected an object")
+
+        row_id = record.get('id') or record.get('row_id') or line_number
+        row_id = str(row_id).strip()
+        if row_id in seen:
+            raise ValueError(f"Row {line_number}: duplicate row id {row_id}")
+        seen.add(row_id)
+
+        user_description = _text_field(record, 'user_description', row_id)
+        if not user_description:
+            raise ValueError(f"Row {row_id}: user_description is required")
+
+        template_id = record.get('template_id')
+        if template_id in ('', None):
+            template_id = None
+        else:
+            try:
+                template_id = int(template_id)
+            except (TypeError, ValueError):
+                raise ValueError(f"Row {row_id}: template_id must be an integer")
+
+        language = (_text_field(record, 'language', row_id) or 'chinese').lower()
+        if language not in LANGUAGES:
+            raise ValueError(f"Row {row_id}: language must be one of {', '.join(LANGUAGES)}")
+
+        rows.append({
+            'row_id': row_id,
+            'user_description': user_description,
+            'template_id': template_id,
+            'language': language,
+            'name': _text_field(record, 'name', row_id) or None
+        })
+
+        if len(rows) > config.bulk.max_rows:
+            raise ValueError(f"At most {config.bulk.max_rows} rows can be generated per request")
+
+    if not rows:
+        raise ValueError("No rows to generate")
+
+    return rows
+
+def _text_field(record: Dict[str, Any], field: str, row_id: str) -> str:
+    """Get a stripped text field of a row ('' if missing)"""
+    value = record.get(field)
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise ValueError(f"Row {row_id}: {field} must be a string")
+    return value.strip()
+
+def new_run_id() -> str:
+    """Generate an ID for a new bulk run"""
+    return uuid.uuid4().hex
+
+def pending_rows(run_id: str, rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Drop the rows that already succeeded in an earlier attempt of the run.
+
+    Returns:
+        The rows still to generate, and the number of rows skipped
+    """
+    succeeded = {
+        row_id for row_id, in db.session.query(BulkGenerationRow.row_id).filter_by(run_id=run_id, status='succeeded')
+    }
+    pending = [row for row in rows if row['row_id'] not in succeeded]
+    return pending, len(rows) - len(pending)
+
+def generate_bulk(
+    app,
+    run_id: str,
+    rows: List[Dict[str, Any]],
+    temperature: float = 0.7,
+    max_concurrency: int = 1,
+    save_prompt: bool = False,
+    prompt_name: str = 'Generated Prompt'
+) -> Iterator[Dict[str, Any]]:
+    """
+    Generate a prompt for each row and yield results as they complete.
+
+    Args:
+        app: The Flask application, used to give each worker thread an app context
+        run_id: The run the rows belong to
+        rows: Rows from parse_rows, without those already done (see pending_rows)
+        temperature: Temperature setting for LLM generation
+        max_concurrency: Maximum number of rows in flight at once
+        save_prompt: Save each generated prompt as a new prompt
+        prompt_name: Name of saved prompts for rows without a name, followed by the row ID
+
+    Returns:
+        Iterator of {'row_id', 'result'} or {'row_id', 'error'} dicts, interleaved with a
+        {'saved': [{'row_id', 'prompt_id'}, ...]} dict after each batch is written
+    """
+    # 工作线程中的调用记入发起批量生成的接口
+    scope = current_usage_scope()
+
+    def run(row):
+        with app.app_context(), usage_scope(*scope):
+            return generate_prompt_with_llm(
+                user_description=row['user_description'],
+                template_id=row['template_id'],
+                temperature=temperature,
+                language=row['language']
+            )
+
+    finished = []
+    executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='bulk-generate')
+    try:
+        futures = {executor.submit(run, row): row for row in rows}
+
+        for future in as_completed(futures):
+            row = futures[future]
+            try:
+                item = {'row_id': row['row_id'], 'result': future.result()}
+            except Exception as e:
+                item = {'row_id': row['row_id'], 'error': str(e)}
+            finished.append((row, item))
+            yield item
+
+            if len(finished) >= config.bulk.save_batch_size:
+                batch, finished = finished, []
+                yield {'saved': _save_rows(run_id, batch, save_prompt, prompt_name)}
+
+        if finished:
+            batch, finished = finished, []
+            yield {'saved': _save_rows(run_id, batch, save_prompt, prompt_name)}
+    finally:
+        # 客户端断开时取消尚未开始的行
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        # 保存已完成但尚未写入的行，续跑时无需重新生成
+        if finished:
+            try:
+                _save_rows(run_id, finished, save_prompt, prompt_name)
+            except Exception as e:
+                current_app.logger.error(f"Failed to save {len(finished)} rows of bulk run {run_id}: {str(e)}")
+
+def get_run_rows(run_id: str) -> List[BulkGenerationRow]:
+    """Get the recorded rows of a bulk run"""
+    return BulkGenerationRow.query.filter_by(run_id=run_id).order_by(BulkGenerationRow.id).all()
+
+def _save_rows(run_id: str, finished: List[Tuple[Dict[str, Any], Dict[str, Any]]],
+               save_prompt: bool, prompt_name: str) -> List[Dict[str, Any]]:
+    """Write the prompts and row records of finished rows in one transaction"""
+    succeeded = [(row, item) for row, item in finished if 'result' in item]
+    prompt_ids = {}
+    try:
+        if save_prompt and succeeded:
+            prompts = create_prompts(
+                [(row['name'] or f"{prompt_name} {row['row_id']}", item['result']) for row, item in succeeded],
+                source='generated',
+                commit=False
+            )
+            prompt_ids = {row['row_id']: prompt.id for (row, _), prompt in zip(succeeded, prompts)}
+
+        # 之前失败的行重新生成后更新原记录
+        existing = {
+            record.row_id: record
+            for record in BulkGenerationRow.query.filter(
+                BulkGenerationRow.run_id == run_id,
+                BulkGenerationRow.row_id.in_([row['row_id'] for row, _ in finished])
+            )
+        }
+        for row, item in finished:
+            record = existing.get(row['row_id']) or BulkGenerationRow(run_id=run_id, row_id=row['row_id'])
+            record.status = 'succeeded' if 'result' in item else 'failed'
+            record.generated_prompt = item.get('result')
+            record.saved_prompt_id = prompt_ids.get(row['row_id'])
+            record.error = item.get('error')
+            db.session.add(record)
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return [{'row_id': row['row_id'], 'prompt_id': prompt_ids.get(row['row_id'])} for row, _ in succeeded]
@@ -0,0 +1,248 @@
+"""
+Circuit Breaker Module
+
+This module tracks the health of each model and stops sending requests to a
+model whose provider is failing.
+
+Every call records its outcome, latency and time to first token in a rolling
+window. When the error rate (or, if configured, the p95 latency) in the window
+crosses its threshold, the model's circuit opens and callers are routed
+elsewhere at once instead of waiting for timeouts. After open_seconds one probe
+request is let through: if it succeeds the circuit closes, otherwise it stays
+open for another period.
+"""
+
+import time
+from typing import Any, Dict, List, Optional
+
+from ..config.config import config
+from .workspace_db import get_connection
+
+BREAKER_DB = 'circuit_breaker.db'
+
+BREAKER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model_id INTEGER NOT NULL,
+    finished_at REAL NOT NULL,
+    ok INTEGER NOT NULL,
+    latency_ms REAL NOT NULL,
+    ttft_ms REAL
+);
+CREATE INDEX IF NOT EXISTS idx_calls_model ON calls (model_id, finished_at);
+CREATE TABLE IF NOT EXISTS breakers (
+    model_id INTEGER PRIMARY KEY,
+    state TEXT NOT NULL DEFAULT 'closed',
+    opened_at REAL,
+    probe_at REAL,
+    reason TEXT,
+    fallbacks INTEGER NOT NULL DEFAULT 0,
+    last_fallback_to INTEGER,
+    last_fallback_at REAL
+);
+"""
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+class CircuitOpenError(Exception):
+    """Raised when a model's circuit is open and no healthy fallback is available"""
+
+class CircuitBreaker:
+    """Rolling-window health tracking and circuit state per model"""
+
+    def __init__(self, settings):
+        self.settings = settings
+
+    def allow(self, model_id: int) -> bool:
+        """
+        Check whether a request may be sent to a model.
+
+        When an open circuit's wait is over, the first caller is let through
+        as the probe and the circuit becomes half-open until the probe finishes.
+        """
+        if not self.settings.enabled:
+            return True
+
+        connection = self._connection()
+        row = connection.execute(
+            'SELECT state, opened_at, probe_at FROM breakers WHERE model_id = ?', (model_id,)
+        ).fetchone()
+        if row is None or row[0] == CLOSED:
+            return True
+
+        state, opened_at, probe_at = row
+        now = time.time()
+        if state == OPEN:
+            if now - opened_at < self.settings.open_seconds:
+                return False
+            # 条件更新保证只有一个请求成为探测请求
+            claimed = connection.execute(
+                'UPDATE breakers SET state = ?, probe_at = ? WHERE model_id = ? AND state = ?',
+                (HALF_OPEN, now, model_id, OPEN)
+            ).rowcount
+            return claimed == 1
+
+        # 探测请求迟迟没有结果（例如进程退出），允许新的探测
+        if now - (probe_at or 0) > self.settings.probe_timeout_seconds:
+            claimed = connection.execute(
+                'UPDATE breakers SET probe_at = ? WHERE model_id = ? AND state = ? AND probe_at = ?',
+                (now, model_id, HALF_OPEN, probe_at)
+            ).rowcount
+            return claimed == 1
+        return False
+
+    def record(self, model_id: int, ok: bool, latency_ms: float, ttft_ms: Optional[float] = None) -> None:
+        """Record the outcome of a call (ttft_ms for streamed calls) and open or close the model's circuit accordingly"""
+        if not self.settings.enabled:
+            return
+
+        connection = self._connection()
+        now = time.time()
+
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'INSERT INTO calls (model_id, finished_at, ok, latency_ms, ttft_ms) VALUES (?, ?, ?, ?, ?)',
+                (model_id, now, int(ok), latency_ms, ttft_ms)
+            )
+            connection.execute(
+                'DELETE FROM calls WHERE model_id = ? AND finished_at < ?',
+                (model_id, now - self.settings.window_seconds)
+            )
+
+            row = connection.execute('SELECT state FROM breakers WHERE model_id = ?', (model_id,)).fetchone()
+            state = row[0] if row else CLOSED
+
+            if state == HALF_OPEN:
+                if ok:
+                    # 探测成功：关闭熔断并清空窗口，避免旧的失败再次触发
+                    self._set_state(connection, model_id, CLOSED, None, None)
+                    connection.execute('DELETE FROM calls WHERE model_id = ?', (model_id,))
+                else:
+                    self._set_state(connection, model_id, OPEN, now, 'probe request failed')
+            elif state == CLOSED and (not ok or self.settings.latency_threshold_ms):
+                reason = self._trip_reason(connection, model_id)
+                if reason:
+                    self._set_state(connection, model_id, OPEN, now, reason)
+
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def record_fallback(self, model_id: int, fallback_model_id: int) -> None:
+        """Count a request that was routed from a model to its fallback"""
+        self._connection().execute(
+            'UPDATE breakers SET fallbacks = fallbacks + 1, last_fallback_to = ?, last_fallback_at = ? '
+            'WHERE model_id = ?',
+            (fallback_model_id, time.time(), model_id)
+        )
+
+    def reset(self, model_id: int) -> None:
+        """Close a model's circuit and forget its recent calls"""
+        connection = self._connection()
+        connection.execute('DELETE FROM calls WHERE model_id = ?', (model_id,))
+        connection.execute(
+            "UPDATE breakers SET state = ?, opened_at = NULL, probe_at = NULL, reason = NULL WHERE model_id = ?",
+            (CLOSED, model_id)
+        )
+
+    def latency_percentile(self, model_id: int, percentile: float, min_samples: int = 1) -> Optional[float]:
+        """Get a latency percentile (0-1) of the model's successful calls in the window, in ms (None below min_samples)"""
+        latencies = self._window_latencies(self._connection(), model_id)
+        if len(latencies) < max(min_samples, 1):
+            return None
+        return _percentile(latencies, percentile)
+
+    def ttft_percentile(self, model_id: int, percentile: float, min_samples: int = 1) -> Optional[float]:
+        """Get a time-to-first-token percentile (0-1) of the model's successful streamed calls in the window, in ms"""
+        since = time.time() - self.settings.window_seconds
+        ttfts = [
+            ttft for (ttft,) in self._connection().execute(
+                'SELECT ttft_ms FROM calls WHERE model_id = ? AND ok = 1 AND finished_at >= ? AND ttft_ms IS NOT NULL '
+                'ORDER BY ttft_ms',
+                (model_id, since)
+            )
+        ]
+        if len(ttfts) < max(min_samples, 1):
+            return None
+        return _percentile(ttfts, percentile)
+
+    def health(self, model_id: int) -> Dict[str, Any]:
+        """Get the circuit state and rolling-window metrics of a model"""
+        connection = self._connection()
+        since = time.time() - self.settings.window_seconds
+
+        requests, errors = connection.execute(
+            'SELECT COUNT(*), COALESCE(SUM(1 - ok), 0) FROM calls WHERE model_id = ? AND finished_at >= ?',
+            (model_id, since)
+        ).fetchone()
+        latencies = self._window_latencies(connection, model_id)
+        row = connection.execute(
+            'SELECT state, opened_at, reason, fallbacks, last_fallback_to, last_fallback_at '
+            'FROM breakers WHERE model_id = ?', (model_id,)
+        ).fetchone()
+        state, opened_at, reason, fallbacks, last_fallback_to, last_fallback_at = row or (CLOSED, None, None, 0, None, None)
+
+        return {
+            'state': state,
+            'opened_at': opened_at,
+            'reason': reason,
+            'window_seconds': self.settings.window_seconds,
+            'requests': requests,
+            'errors': errors,
+            'error_rate': round(errors / requests, 3) if requests else 0.0,
+            'p50_latency_ms': _percentile(latencies, 0.5),
+            'p95_latency_ms': _percentile(latencies, 0.95),
+            'fallbacks': fallbacks,
+            'last_fallback_to': last_fallback_to,
+            'last_fallback_at': last_fallback_at
+        }
+
+    def _connection(self):
+        return get_connection(BREAKER_DB, BREAKER_SCHEMA)
+
+    def _window_latencies(self, connection, model_id: int) -> List[float]:
+        since = time.time() - self.settings.window_seconds
+        return [
+            latency for (latency,) in connection.execute(
+                'SELECT latency_ms FROM calls WHERE model_id = ? AND ok = 1 AND finished_at >= ? ORDER BY latency_ms',
+                (model_id, since)
+            )
+        ]
+
+    def _trip_reason(self, connection, model_id: int) -> Optional[str]:
+        """Get the reason to open the circuit, or None while the model is healthy"""
+        requests, errors = connection.execute(
+            'SELECT COUNT(*), COALESCE(SUM(1 - ok), 0) FROM calls WHERE model_id = ?', (model_id,)
+        ).fetchone()
+        if requests < self.settings.min_requests:
+            return None
+
+        error_rate = errors / requests
+        if error_rate >= self.settings.error_rate_threshold:
+            return f"error rate {error_rate:.0%} over the last {requests} requests"
+
+        if self.settings.latency_threshold_ms:
+            p95 = _percentile(self._window_latencies(connection, model_id), 0.95)
+            if p95 is not None and p95 >= self.settings.latency_threshold_ms:
+                return f"p95 latency {p95:.0f}ms over the last {requests} requests"
+
+        return None
+
+    def _set_state(self, connection, model_id: int, state: str, opened_at: Optional[float], reason: Optional[str]) -> None:
+        connection.execute(
+            'INSERT INTO breakers (model_id, state, opened_at, probe_at, reason) VALUES (?, ?, ?, NULL, ?) '
+            'ON CONFLICT(model_id) DO UPDATE SET state = excluded.state, opened_at = excluded.opened_at, '
+            'probe_at = NULL, reason = excluded.reason',
+            (model_id, state, opened_at, reason)
+        )
+
+def _percentile(sorted_values: List[float], percentile: float) -> Optional[float]:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    index = min(int(percentile * len(sorted_values)), len(sorted_values) - 1)
+    return round(sorted_values[index], 1)
+
+circuit_breaker = CircuitBreaker(config.circuit_breaker)
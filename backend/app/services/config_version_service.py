@@ -0,0 +1,36 @@
+"""
+Config Version Service Module
+
+This module maintains the shared version rows in the config_version table.
+In-process caches of database-backed configuration (models, prompt prefixes)
+compare the version they loaded with the row's current version to notice
+changes made through other worker processes.
+"""
+
+from sqlalchemy.exc import IntegrityError
+
+from ..models import db
+from ..models.config_version import ConfigVersion
+
+def read_version(name: str) -> int:
+    """Get the current version of a configuration (0 if it was never changed)"""
+    version = db.session.query(ConfigVersion.version).filter_by(name=name).scalar()
+    return version or 0
+
+def bump_version(name: str) -> None:
+    """Increment the version of a configuration and commit. Call after the change has been committed."""
+    if not _increment(name):
+        db.session.add(ConfigVersion(name=name, version=1))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # 其他worker同时插入了该行，改为递增
+        db.session.rollback()
+        _increment(name)
+        db.session.commit()
+
+def _increment(name: str) -> int:
+    """Increment the version row; returns the number of rows updated (0 if the row is missing)"""
+    return ConfigVersion.query.filter_by(name=name).update(
+        {ConfigVersion.version: ConfigVersion.version + 1}, synchronize_session=False
+    )
@@ -0,0 +1,356 @@
+"""
+Job Service Module
+
+This module runs long prompt generations in the background. A request submits
+a job and gets its id back immediately; worker threads in every serving process
+claim queued jobs from the database, run them and store the result.
+
+Jobs live in the generation_job table, so queued work survives a restart.
+A running job holds a lease, renewed by a heartbeat thread while it runs; if
+its worker dies, the lease expires and the job is queued again. Claims and
+every later write are conditional UPDATEs on the lease holder, so several
+processes can share the queue and a worker that lost its lease cannot
+overwrite the job.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from flask import current_app
+
+from ..config.config import config
+from ..models import db
+from ..models.generation_job import GenerationJob
+from .retry_policy import is_retryable
+from .prompt_generator_service import stream_prompt_with_llm
+from .prompt_service import create_prompts
+from .usage_service import usage_scope
+
+TERMINAL_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+# 运行中的任务每隔多少秒续租并检查一次取消请求
+_HEARTBEAT_INTERVAL = 2.0
+
+_workers_lock = threading.Lock()
+_workers_pid = None
+_last_lease_check = 0.0
+
+class JobCancelled(Exception):
+    """Raised inside a running job when cancellation was requested"""
+
+class JobLeaseLost(Exception):
+    """Raised inside a running job whose lease expired and was given to another worker"""
+
+class _Heartbeat:
+    """Renews a running job's lease and picks up cancellation on a timer, whether or not chunks arrive"""
+
+    def __init__(self, app, job: GenerationJob):
+        self.app = app
+        self.job_id = job.id
+        self.owner = job.locked_by
+        self.cancelled = threading.Event()
+        self.lost = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'job-heartbeat-{job.id}', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    def check(self) -> None:
+        """Raise if the job was cancelled or this worker no longer holds its lease"""
+        if self.lost.is_set():
+            raise JobLeaseLost()
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+    def _run(self) -> None:
+        interval = min(_HEARTBEAT_INTERVAL, config.jobs.lease_seconds / 3)
+        while not self._stopped.wait(interval):
+            try:
+                # 独立的应用上下文，使用与任务线程不同的数据库会话
+                with self.app.app_context():
+                    renewed = (
+                        GenerationJob.query
+                        .filter_by(id=self.job_id, status='running', locked_by=self.owner)
+                        .update({'locked_at': datetime.utcnow()}, synchronize_session=False)
+                    )
+                    cancel_requested = (
+                        db.session.query(GenerationJob.cancel_requested).filter_by(id=self.job_id).scalar()
+                    )
+                    db.session.commit()
+            except Exception as e:
+                self.app.logger.warning(f"Failed to renew the lease of job {self.job_id}: {str(e)}")
+                continue
+
+            if not renewed:
+                self.lost.set()
+                return
+            if cancel_requested:
+                self.cancelled.set()
+
+def submit_job(
+    payload: Dict[str, Any],
+    priority: int = 0,
+    max_attempts: Optional[int] = None,
+    job_type: str = 'generate_prompt'
+) -> GenerationJob:
+    """
+    Queue a prompt generation job.
+
+    Args:
+        payload: generate_prompt_with_llm arguments plus optional save_prompt / prompt_name
+        priority: Higher priorities are claimed first
+        max_attempts: Attempts allowed for transient provider errors
+
+    Returns:
+        GenerationJob: The queued job
+    """
+    if not payload.get('user_description'):
+        raise ValueError("User description is required")
+
+    job = GenerationJob(
+        job_type=job_type,
+        priority=priority or 0,
+        payload=json.dumps(payload, ensure_ascii=False),
+        max_attempts=max_attempts or config.jobs.max_attempts,
+        run_after=datetime.utcnow()
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    return job
+
+def get_job(job_id) -> Optional[GenerationJob]:
+    """Get a job by ID"""
+    return GenerationJob.query.get(job_id)
+
+def get_jobs(status: Optional[str] = None, limit: int = 100):
+    """Get the most recent jobs, optionally filtered by status"""
+    query = GenerationJob.query
+    if status:
+        query = query.filter_by(status=status)
+    return query.order_by(GenerationJob.id.desc()).limit(limit).all()
+
+def cancel_job(job_id) -> Optional[GenerationJob]:
+    """Cancel a job: queued jobs stop immediately, running jobs stop at their next check"""
+    job = GenerationJob.query.get(job_id)
+    if not job:
+        return None
+
+    if job.status == 'queued':
+        _finish(job, 'cancelled')
+    elif job.status == 'running':
+        job.cancel_requested = True
+        db.session.commit()
+
+    return job
+
+def ensure_workers(app) -> None:
+    """Start this process's worker threads once (safe to call on every request and after fork)"""
+    global _workers_pid
+
+    if config.jobs.workers <= 0 or _workers_pid == os.getpid():
+        return
+
+    with _workers_lock:
+        if _workers_pid == os.getpid():
+            return
+        _workers_pid = os.getpid()
+
+        for index in range(config.jobs.workers):
+            worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+            thread = threading.Thread(
+                target=_worker_loop,
+                args=(app, worker_id),
+                name=f'job-worker-{index}',
+                daemon=True
+            )
+            thread.start()
+
+def _worker_loop(app, worker_id: str) -> None:
+    """Claim and run jobs until the process exits"""
+    while True:
+        try:
+            with app.app_context():
+                _requeue_expired_leases()
+                job = _claim_next_job(worker_id)
+                if job:
+                    _run_job(app, job)
+                    continue
+        except Exception as e:
+            app.logger.error(f"Job worker {worker_id} error: {str(e)}")
+
+        time.sleep(config.jobs.poll_interval)
+
+def _claim_next_job(worker_id: str) -> Optional[GenerationJob]:
+    """Atomically claim the highest priority job that is due"""
+    now = datetime.utcnow()
+    candidates = (
+        GenerationJob.query
+        .filter(GenerationJob.status == 'queued', GenerationJob.run_after <= now)
+        .order_by(GenerationJob.priority.desc(), GenerationJob.id)
+        .limit(5)
+        .all()
+    )
+
+    for candidate in candidates:
+        # 条件更新保证同一任务只会被一个worker领取
+        claimed = (
+            GenerationJob.query
+            .filter_by(id=candidate.id, status='queued')
+            .update({
+                'status': 'running',
+                'locked_by': worker_id,
+                'locked_at': now,
+                'attempts': GenerationJob.attempts + 1
+            }, synchronize_session=False)
+        )
+        db.session.commit()
+
+        if claimed:
+            return GenerationJob.query.get(candidate.id)
+
+    return None
+
+def _requeue_expired_leases() -> None:
+    """Put running jobs whose worker stopped renewing the lease back in the queue"""
+    global _last_lease_check
+
+    # 租约检查无需每次轮询都执行
+    if time.monotonic() - _last_lease_check < config.jobs.lease_seconds / 10:
+        return
+    _last_lease_check = time.monotonic()
+
+    now = datetime.utcnow()
+    expired = (
+        GenerationJob.status == 'running',
+        GenerationJob.locked_at < now - timedelta(seconds=config.jobs.lease_seconds)
+    )
+    # 用完重试次数的任务（如每次都导致worker退出）标记为失败，不再重新入队
+    failed = (
+        GenerationJob.query
+        .filter(*expired, GenerationJob.attempts >= GenerationJob.max_attempts)
+        .update({
+            'status': 'failed',
+            'error': 'Worker stopped while running the job (lease expired) and no attempts are left',
+            'finished_time': now,
+            'locked_by': None,
+            'locked_at': None
+        }, synchronize_session=False)
+    )
+    requeued = (
+        GenerationJob.query
+        .filter(*expired)
+        .update({'status': 'queued', 'locked_by': None, 'locked_at': None}, synchronize_session=False)
+    )
+    db.session.commit()
+
+    if failed:
+        current_app.logger.warning(f"Failed {failed} job(s) with expired leases and no attempts left")
+    if requeued:
+        current_app.logger.warning(f"Requeued {requeued} job(s) with expired leases")
+
+def _run_job(app, job: GenerationJob) -> None:
+    """Run a claimed job and record its outcome, unless another worker took over its lease"""
+    job_id, owner, attempts, max_attempts = job.id, job.locked_by, job.attempts, job.max_attempts
+    payload = json.loads(job.payload)
+
+    try:
+        with _Heartbeat(app, job) as heartbeat:
+            with usage_scope('job'):
+                generated_prompt = _generate(heartbeat, payload)
+            heartbeat.check()
+
+        saved_prompt_id = None
+        if payload.get('save_prompt'):
+            # 与任务状态在同一事务中提交，失去租约时一并回滚
+            saved_prompt_id = create_prompts(
+                [(payload.get('prompt_name', 'Generated Prompt'), generated_prompt)],
+                source='generated',
+                commit=False
+            )[0].id
+
+        finished = _finish(job, 'succeeded', owner, result=generated_prompt, saved_prompt_id=saved_prompt_id, error=None)
+    except JobCancelled:
+        finished = _finish(job, 'cancelled', owner)
+    except JobLeaseLost:
+        finished = False
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Job {job_id} attempt {attempts} failed: {str(e)}")
+
+        if is_retryable(e) and attempts < max_attempts:
+            # 指数退避后重新入队
+            backoff = config.jobs.retry_backoff_seconds * (2 ** (attempts - 1))
+            finished = _update_job(job_id, {
+                'status': 'queued',
+                'error': str(e),
+                'run_after': datetime.utcnow() + timedelta(seconds=backoff),
+                'locked_by': None,
+                'locked_at': None
+            }, status='running', locked_by=owner)
+        else:
+            finished = _finish(job, 'failed', owner, error=str(e))
+
+    if not finished:
+        current_app.logger.warning(f"Job {job_id} lease was taken over by another worker, dropping this attempt's outcome")
+
+def _generate(heartbeat: _Heartbeat, payload: Dict[str, Any]) -> str:
+    """Stream the generation, stopping at the next chunk once the heartbeat sees a cancellation or a lost lease"""
+    events = stream_prompt_with_llm(
+        user_description=payload['user_description'],
+        template_id=payload.get('template_id'),
+        temperature=payload.get('temperature', 0.7),
+        language=payload.get('language', 'chinese'),
+        regenerate=payload.get('regenerate', False)
+    )
+
+    try:
+        for event in events:
+            heartbeat.check()
+            if event['type'] == 'done':
+                if not event['content'].strip():
+                    raise ValueError("生成的提示词为空，请重试")
+                return event['content']
+    finally:
+        # 取消时关闭上游流，停止继续生成
+        events.close()
+
+    raise ValueError("Generation stream ended without a result")
+
+def _finish(job: GenerationJob, status: str, owner: Optional[str] = None, **values) -> bool:
+    """
+    Move a job to a terminal status, committing the session's pending changes with it.
+
+    Args:
+        job: The job to finish
+        status: The terminal status
+        owner: Worker that holds the running job's lease (None for a queued job)
+        **values: Other columns to set, e.g. result or error
+
+    Returns:
+        bool: False if the job was no longer in that state and nothing was written
+    """
+    values.update(status=status, finished_time=datetime.utcnow(), locked_by=None, locked_at=None)
+    if owner is None:
+        return _update_job(job.id, values, status='queued')
+    return _update_job(job.id, values, status='running', locked_by=owner)
+
+def _update_job(job_id: int, values: Dict[str, Any], **state) -> bool:
+    """Update a job only while it is in the given state; rolls back and returns False otherwise"""
+    updated = GenerationJob.query.filter_by(id=job_id, **state).update(values, synchronize_session=False)
+    if not updated:
+        db.session.rollback()
+        return False
+    db.session.commit()
+    return True
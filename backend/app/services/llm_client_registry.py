@@ -0,0 +1,149 @@
+"""
+LLM Client Registry Module
+
+This module keeps one long-lived provider client per distinct connection
+(api_type, base_url, api_key, api_version and pool size). Reusing the client
+reuses its HTTP connection pool, so keep-alive connections, TLS sessions and
+DNS lookups are shared by every request that targets the same endpoint.
+
+Async clients are kept separately for the ASGI serving path; their pools are
+bound to the event loop that first uses them, so they must only be used from
+the long-lived loop of the ASGI server.
+"""
+
+import os
+import threading
+from typing import Dict, Tuple
+
+import anthropic
+import httpx
+import openai
+from flask import current_app
+
+from ..config.config import config
+
+_lock = threading.Lock()
+
+# 连接键 -> 客户端实例
+_clients: Dict[Tuple, object] = {}
+
+# (模型ID, 是否异步) -> 该模型当前使用的连接键，用于模型配置变更时回收旧客户端
+_model_keys: Dict[Tuple[int, bool], Tuple] = {}
+
+def get_client(model_config, is_async=False):
+    """Get the pooled client for a model configuration, building it on first use"""
+    key = _client_key(model_config, is_async)
+    binding = (model_config.id, is_async)
+
+    client = _clients.get(key)
+    if client is None or _model_keys.get(binding) != key:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _build_client(model_config, key)
+                _clients[key] = client
+
+            previous_key = _model_keys.get(binding)
+            _model_keys[binding] = key
+            if previous_key is not None and previous_key != key:
+                _release_key(previous_key)
+
+    return client
+
+def invalidate_model(model_id):
+    """Drop the clients bound to a model so the next call rebuilds them from the updated row"""
+    with _lock:
+        for is_async in (False, True):
+            key = _model_keys.pop((model_id, is_async), None)
+            if key is not None:
+                _release_key(key)
+
+def _release_key(key):
+    """Forget a client once no model uses its connection anymore (caller holds the lock)"""
+    if key in _model_keys.values():
+        return
+
+    # 不主动close：仍在进行中的请求持有旧客户端的引用，由其结束后回收
+    _clients.pop(key, None)
+
+def _client_key(model_config, is_async):
+    """Build the registry key for a model configuration"""
+    api_type = (model_config.api_type or 'openai').lower()
+    api_key, base_url = _resolve_credentials(model_config, api_type)
+    max_connections = model_config.max_connections or config.llm_client.max_connections
+
+    return (api_type, base_url, api_key, model_config.api_version or '', max_connections, is_async)
+
+def _resolve_credentials(model_config, api_type):
+    """Resolve api key and base url, falling back to environment variables"""
+    if api_type == 'anthropic':
+        api_key = model_config.api_key or os.environ.get('ANTHROPIC_API_KEY')
+        base_url = model_config.base_url or os.environ.get('ANTHROPIC_BASE_URL')
+    else:
+        api_key = model_config.api_key or os.environ.get('OPENAI_API_KEY')
+        base_url = model_config.base_url or os.environ.get('OPENAI_BASE_URL')
+
+    if not api_key:
+        raise ValueError(f"No API key found for model {model_config.name} in database or environment")
+
+    return api_key, base_url
+
+def _build_client(model_config, key):
+    """Create a provider client with its own bounded connection pool"""
+    api_type, base_url, api_key, api_version, max_connections, is_async = key
+    settings = config.llm_client
+    # 默认超时；调用时会按模型配置和请求截止时间传入更精确的超时
+    timeout = httpx.Timeout(settings.timeout, connect=settings.connect_timeout)
+    # SDK不重试：重试由调用方完成，才能与请求截止时间共用同一预算
+    max_retries = 0
+
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=min(settings.max_keepalive_connections, max_connections),
+        keepalive_expiry=settings.keepalive_expiry
+    )
+
+    current_app.logger.info(
+        f"Creating {'async ' if is_async else ''}{api_type} client for model {model_config.name} "
+        f"with base_url: {base_url} (max_connections: {max_connections})"
+    )
+
+    if api_type == 'anthropic':
+        client_kwargs = {
+            'api_key': api_key,
+            'timeout': timeout,
+            'max_retries': max_retries
+        }
+        if base_url:
+            client_kwargs['base_url'] = base_url
+        if is_async:
+            return anthropic.AsyncAnthropic(http_client=anthropic.DefaultAsyncHttpxClient(limits=limits), **client_kwargs)
+        return anthropic.Anthropic(http_client=anthropic.DefaultHttpxClient(limits=limits), **client_kwargs)
+
+    if is_async:
+        http_client = openai.DefaultAsyncHttpxClient(limits=limits)
+    else:
+        http_client = openai.DefaultHttpxClient(limits=limits)
+
+    if api_type == 'azure':
+        azure_class = openai.AsyncAzureOpenAI if is_async else openai.AzureOpenAI
+        return azure_class(
+            azure_endpoint=base_url,
+            api_key=api_key,
+            api_version=api_version,
+            timeout=timeout,
+            max_retries=max_retries,
+            http_client=http_client
+        )
+
+    client_kwargs = {
+        'api_key': api_key,
+        'timeout': timeout,
+        'max_retries': max_retries,
+        'http_client': http_client
+    }
+    if base_url:
+        client_kwargs['base_url'] = base_url
+    if is_async:
+        return openai.AsyncOpenAI(**client_kwargs)
+    return openai.OpenAI(**client_kwargs)
@@ -1,169 +1,575 @@
-import os
-import openai
+import threading
+import time
 from flask import current_app
-from .model_service import get_model, get_default_model
-from typing import Optional, Dict, Any
-import anthropic
+from .model_cache import model_cache
+from .llm_client_registry import get_client
+from .response_cache import response_cache
+from .rate_limiter import rate_limiter, limits_for
+from .circuit_breaker import circuit_breaker, CircuitOpenError
+from .request_coalescer import request_coalescer
+from .retry_policy import retry_policy, is_retryable
+from .request_hedger import request_hedger, HedgeCancelled
+from .usage_service import usage_recorder
+from .token_budget import TokenBudget, plan as plan_budget
+from .request_deadline import request_deadline, timeouts_for, call_deadline, http_timeout, is_timeout_error
+from typing import Optional, Dict, Any, Iterator, Sequence
+
+# 本进程的token用量与提供方前缀缓存命中统计
+_usage_lock = threading.Lock()
+_usage_totals = {'requests': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'cache_write_tokens': 0, 'completion_tokens': 0}
 
 def execute_prompt(
     prompt: str,
     model_id: Optional[str] = None,
     temperature: float = 0.7,
-    max_tokens: int = 2000
+    max_tokens: int = 2000,
+    seed: Optional[int] = None,
+    cache: Optional[bool] = None,
+    system: Optional[Sequence[str]] = None,
+    input_tokens: Optional[int] = None,
+    prefix=None
 ) -> str:
     """
     Execute a prompt using the specified LLM or the default model.
-    
+
     Args:
         prompt: The prompt text to send to the LLM
         model_id: Optional model ID to use (if not provided, will use default)
         temperature: Temperature parameter for generation
         max_tokens: Maximum tokens to generate
-        
+        seed: Optional sampling seed (OpenAI-compatible providers only)
+        cache: True/False to force or bypass the response cache; None caches
+            deterministic requests (temperature 0 or an explicit seed)
+        system: Optional static instructions sent before the prompt as the system
+            message, most stable segment first, so providers can cache the prefix
+        input_tokens: Input tokens already counted by plan_tokens, to skip counting again
+        prefix: Compiled prefix the system segments come from (see token_budget.plan)
+
     Returns:
         str: The generated response
+
+    Raises:
+        ContextWindowExceeded: If the prompt cannot fit in the model's context window
     """
-    from ..models.model_config import ModelConfig
-    
     # 尝试从数据库获取或使用环境变量
     try:
-        # If no model_id is provided, use the default model
-        if not model_id:
-            default_model = ModelConfig.query.filter_by(is_default=True).first()
-            if default_model:
-                model_id = default_model.id
-            else:
-                # If no default model, use the first available model
-                first_model = ModelConfig.query.first()
-                if first_model:
-                    model_id = first_model.id
-                else:
-                    raise ValueError("No models available")
-        
-        # Get model configuration
-        model_config = ModelConfig.query.get(model_id)
-        if not model_config:
-            raise ValueError(f"Model with ID {model_id} not found")
-        
-        # Execute based on model provider
-        if model_config.api_type.lower() == 'openai':
-            return _execute_openai(model_config.model_id, prompt, temperature, max_tokens)
-        elif model_config.api_type.lower() == 'anthropic':
-            return _execute_anthropic(model_config.model_id, prompt, temperature, max_tokens)
-        else:
-            raise ValueError(f"Unsupported provider: {model_config.api_type}")
-            
+        model_config = _select_model(model_id)
+        # 发送前检查上下文窗口，max_tokens收紧到剩余窗口
+        max_tokens = plan_budget(model_config, prompt, max_tokens, system, input_tokens, prefix).max_tokens
+
+        cache_key = None
+        if response_cache.should_use(temperature, seed, cache):
+            messages = [*system, prompt] if system else prompt
+            cache_key = response_cache.make_key(model_config, messages, temperature, max_tokens, seed)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        # 相同的请求正在进行时等待其结果，不重复调用模型；整个过程共用一个截止时间
+        with request_deadline():
+            result = request_coalescer.do(
+                request_coalescer.make_key(model_config, prompt, temperature, max_tokens, seed, system),
+                lambda: _call_provider_hedged(model_config, prompt, temperature, max_tokens, seed, system)
+            )
+
+        if cache_key and result:
+            response_cache.set(cache_key, result)
+
+        return result
+
+    except Exception as e:
+        current_app.logger.error(f"LLM execution error: {str(e)}")
+        raise
+
+def stream_prompt(
+    prompt: str,
+    model_id: Optional[str] = None,
+    temperature: float = 0.7,
+    max_tokens: int = 2000,
+    system: Optional[Sequence[str]] = None,
+    input_tokens: Optional[int] = None,
+    prefix=None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Execute a prompt and stream the response as it is generated.
+
+    The model is resolved before the stream starts, so configuration errors are
+    raised to the caller instead of surfacing in the middle of a response.
+
+    Args:
+        prompt: The prompt text to send to the LLM
+        model_id: Optional model ID to use (if not provided, will use default)
+        temperature: Temperature parameter for generation
+        max_tokens: Maximum tokens to generate
+        system: Optional static instructions sent before the prompt (see execute_prompt)
+        input_tokens: Input tokens already counted for this request, to skip counting again
+        prefix: Compiled prefix the system segments come from (see token_budget.plan)
+
+    Returns:
+        Iterator of events: {'type': 'delta', 'content': ...} for every chunk, then a single
+        {'type': 'done', 'content', 'usage', 'latency_ms', 'ttft_ms', 'model_id', 'input_tokens'}
+
+    Raises:
+        ContextWindowExceeded: If the prompt cannot fit in the model's context window
+    """
+    try:
+        model_config = _select_model(model_id)
+        budget = plan_budget(model_config, prompt, max_tokens, system, input_tokens, prefix)
+        events = _stream_provider(model_config, prompt, temperature, budget.max_tokens, system=system)
+        return _with_input_tokens(events, budget.input_tokens)
+
     except Exception as e:
         current_app.logger.error(f"LLM execution error: {str(e)}")
         raise
 
-def _execute_openai(model_name: str, prompt: str, temperature: float, max_tokens: int) -> str:
+def plan_tokens(
+    prompt: str,
+    model_id: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    system: Optional[Sequence[str]] = None
+) -> TokenBudget:
+    """
+    Count a prompt's input tokens for the model it would execute on and fit
+    max_tokens to the model's context window, without calling the provider.
+
+    Pass the result's max_tokens and input_tokens on to execute_prompt.
+
+    Raises:
+        ContextWindowExceeded: If the prompt cannot fit in the model's context window
+    """
+    return plan_budget(_select_model(model_id), prompt, max_tokens, system)
+
+def run_prompt(
+    prompt: str,
+    model_id: Optional[str] = None,
+    temperature: float = 0.7,
+    max_tokens: int = 2000
+) -> Dict[str, Any]:
+    """
+    Execute a prompt and return the full response with token usage and timing.
+
+    The request is streamed internally so that time-to-first-token can be measured.
+
+    Returns:
+        Dict with 'content', 'usage', 'latency_ms', 'ttft_ms' and 'model_id'
+    """
+    result = None
+    for event in stream_prompt(prompt, model_id, temperature, max_tokens):
+        result = event
+
+    return {key: value for key, value in result.items() if key != 'type'}
+
+def _with_input_tokens(events: Iterator[Dict[str, Any]], input_tokens: int) -> Iterator[Dict[str, Any]]:
+    """Add the pre-flight input token count to the stream's done event"""
+    try:
+        for event in events:
+            if event['type'] == 'done':
+                event['input_tokens'] = input_tokens
+            yield event
+    finally:
+        # 调用方提前关闭时同时关闭上游流
+        events.close()
+
+def record_call_outcome(model_id: int, started: float, error: Optional[BaseException] = None,
+                        usage: Optional[Dict[str, int]] = None, first_token_at: Optional[float] = None,
+                        finished: Optional[float] = None) -> None:
+    """
+    Report a provider call to the circuit breaker and the usage records.
+
+    finished is the call's end on the monotonic clock, for callers that report
+    it later from another thread (defaults to now).
+
+    Only transient errors (timeouts, connection errors, 429, 5xx) count as
+    failures for the breaker; other errors say nothing about the provider's health.
+    """
+    latency_ms = ((finished or time.monotonic()) - started) * 1000
+    ttft_ms = (first_token_at - started) * 1000 if first_token_at else None
+    if usage:
+        record_usage(usage)
+    usage_recorder.record(
+        model_id, latency_ms, usage,
+        ttft_ms=ttft_ms,
+        status='ok' if error is None else 'timeout' if is_timeout_error(error) else 'error'
+    )
+
+    if error is not None and not is_retryable(error):
+        return
+
+    circuit_breaker.record(model_id, error is None, latency_ms, ttft_ms)
+
+def _select_model(model_id: Optional[str] = None):
+    """
+    Get the model to execute with, routing around models whose circuit is open.
+
+    Raises:
+        CircuitOpenError: If the model's circuit is open and no fallback is healthy
+    """
+    model_config = _resolve_model_config(model_id)
+    if circuit_breaker.allow(model_config.id):
+        return model_config
+
+    # 沿备用模型链查找可用模型，跳过同样熔断的模型
+    tried = {model_config.id}
+    candidate = model_config
+    while candidate.fallback_model_id and candidate.fallback_model_id not in tried:
+        candidate = model_cache.get(candidate.fallback_model_id)
+        if not candidate:
+            break
+        tried.add(candidate.id)
+
+        if circuit_breaker.allow(candidate.id):
+            current_app.logger.warning(
+                f"Circuit open for model {model_config.id}, routing to fallback model {candidate.id}"
+            )
+            circuit_breaker.record_fallback(model_config.id, candidate.id)
+            return candidate
+
+    reason = circuit_breaker.health(model_config.id)['reason']
+    raise CircuitOpenError(
+        f"Model {model_config.name} is temporarily unavailable ({reason}) and no healthy fallback model is configured"
+    )
+
+def _resolve_model_config(model_id: Optional[str] = None):
+    """
+    Get the model configuration to execute with, falling back to the default model.
+
+    Served from the in-process model cache, so no database query is made unless
+    the shared config version has changed.
+    """
+    return model_cache.resolve(model_id)
+
+def _acquire_rate_limit(model_config, prompt: str, max_tokens: int, system: Optional[Sequence[str]] = None):
+    """Wait for the model's rate limit; returns the lease to release after the call"""
+    limits = limits_for(model_config)
+    if not rate_limiter.enabled(limits):
+        return None
+
+    tokens = rate_limiter.estimate_tokens(_request_text(prompt, system), max_tokens) if limits.tpm else 0
+    return rate_limiter.acquire(limits, tokens)
+
+def _call_provider(model_config, prompt: str, temperature: float, max_tokens: int, seed: Optional[int] = None,
+                   system: Optional[Sequence[str]] = None) -> str:
+    """Execute a prompt with the model's provider"""
+    api_type = model_config.api_type.lower()
+    if api_type in ('openai', 'azure'):
+        return _execute_openai(model_config, prompt, temperature, max_tokens, seed, system)
+    elif api_type == 'anthropic':
+        return _execute_anthropic(model_config, prompt, temperature, max_tokens, system)
+    else:
+        raise ValueError(f"Unsupported provider: {model_config.api_type}")
+
+def _call_provider_hedged(model_config, prompt: str, temperature: float, max_tokens: int, seed: Optional[int] = None,
+                          system: Optional[Sequence[str]] = None) -> str:
+    """Execute a prompt, hedging it with a second request if it runs slower than the model usually does"""
+    delays = request_hedger.delays_for(model_config.id)
+    if delays is None:
+        return _call_provider(model_config, prompt, temperature, max_tokens, seed, system)
+
+    attempt = _hedge_attempt(current_app._get_current_object(), prompt, temperature, max_tokens, seed, system)
+    result = request_hedger.run(attempt, model_config, _hedge_target(model_config), delays)
+    return result['content']
+
+def _hedge_attempt(app, prompt: str, temperature: float, max_tokens: int, seed: Optional[int],
+                   system: Optional[Sequence[str]] = None):
+    """
+    Build the function that runs one side of a hedged request.
+
+    Attempts stream internally so the losing one can be stopped by closing its
+    connection once it sees the cancel event, rather than running to completion.
+    """
+    def attempt(model_config, cancelled, first_token) -> Dict[str, Any]:
+        with app.app_context():
+            if cancelled.is_set():
+                raise HedgeCancelled()
+
+            events = _stream_provider(model_config, prompt, temperature, max_tokens, seed, system)
+            received = 0
+            try:
+                for event in events:
+                    if cancelled.is_set():
+                        raise HedgeCancelled(rate_limiter.estimate_tokens(_request_text(prompt, system)) + received)
+                    if event['type'] == 'done':
+                        return event
+                    received += 1
+                    first_token.set()
+            finally:
+                events.close()
+
+    return attempt
+
+def _hedge_target(model_config):
+    """Get the model to send a hedged request to"""
+    if request_hedger.settings.target == 'fallback' and model_config.fallback_model_id:
+        fallback = model_cache.get(model_config.fallback_model_id)
+        if fallback and circuit_breaker.allow(fallback.id):
+            return fallback
+    return model_config
+
+def _stream_provider(model_config, prompt: str, temperature: float, max_tokens: int,
+                     seed: Optional[int] = None, system: Optional[Sequence[str]] = None) -> Iterator[Dict[str, Any]]:
+    """Stream a prompt execution with the model's provider"""
+    api_type = model_config.api_type.lower()
+    if api_type in ('openai', 'azure'):
+        return _stream_openai(model_config, prompt, temperature, max_tokens, seed, system)
+    elif api_type == 'anthropic':
+        return _stream_anthropic(model_config, prompt, temperature, max_tokens, system)
+    else:
+        raise ValueError(f"Unsupported provider: {model_config.api_type}")
+
+def _request_text(prompt: str, system: Optional[Sequence[str]] = None) -> str:
+    """All the text a request sends, for token estimates"""
+    return "\n\n".join([*system, prompt]) if system else prompt
+
+def _openai_messages(prompt: str, system: Optional[Sequence[str]] = None):
+    """
+    Build chat messages with the static instructions first.
+
+    OpenAI-compatible providers cache the longest previously seen prefix
+    automatically, so the system message must be byte-identical across requests.
+    """
+    messages = [{"role": "system", "content": "\n\n".join(system)}] if system else []
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+def _anthropic_system(system: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """Build the Anthropic system parameter, marking each segment as a prompt cache breakpoint"""
+    if not system:
+        return {}
+
+    blocks = [{"type": "text", "text": segment} for segment in system]
+    # Anthropic最多允许4个缓存断点，保留最靠后的（覆盖的前缀最长）
+    for block in blocks[-4:]:
+        block["cache_control"] = {"type": "ephemeral"}
+    return {"system": blocks}
+
+def openai_usage(usage) -> Dict[str, int]:
+    """Token usage of an OpenAI-compatible response, including prompt tokens served from cache"""
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return {
+        'prompt_tokens': usage.prompt_tokens,
+        'completion_tokens': usage.completion_tokens,
+        'total_tokens': usage.total_tokens,
+        'cached_tokens': (getattr(details, 'cached_tokens', None) or 0) if details else 0
+    }
+
+def anthropic_usage(usage) -> Dict[str, int]:
+    """Token usage of an Anthropic response; input_tokens excludes tokens read from or written to the cache"""
+    cached_tokens = getattr(usage, 'cache_read_input_tokens', None) or 0
+    cache_write_tokens = getattr(usage, 'cache_creation_input_tokens', None) or 0
+    prompt_tokens = usage.input_tokens + cached_tokens + cache_write_tokens
+    return {
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': usage.output_tokens,
+        'total_tokens': prompt_tokens + usage.output_tokens,
+        'cached_tokens': cached_tokens,
+        'cache_write_tokens': cache_write_tokens
+    }
+
+def record_usage(usage: Dict[str, int]) -> None:
+    """Add a call's token usage to this process's totals"""
+    if not usage:
+        return
+
+    with _usage_lock:
+        _usage_totals['requests'] += 1
+        for key in ('prompt_tokens', 'cached_tokens', 'cache_write_tokens', 'completion_tokens'):
+            _usage_totals[key] += usage.get(key) or 0
+
+def usage_stats() -> Dict[str, Any]:
+    """Get token usage totals and the share of prompt tokens served from the provider's prefix cache"""
+    with _usage_lock:
+        totals = dict(_usage_totals)
+    totals['cached_ratio'] = round(totals['cached_tokens'] / totals['prompt_tokens'], 3) if totals['prompt_tokens'] else 0.0
+    return totals
+
+def _openai_headers(client, model_name: str) -> Dict[str, str]:
+    """Extra request headers for OpenAI-compatible providers"""
+    # 检查是否是使用OpenRouter
+    if "openrouter.ai" in str(client.base_url):
+        current_app.logger.info(f"Using OpenRouter with model: {model_name}")
+        return {"HTTP-Referer": "https://promptgenerator.app", "X-Title": "Prompt Generator"}
+    return {}
+
+def _execute_openai(model_config, prompt: str, temperature: float, max_tokens: int, seed: Optional[int] = None,
+                    system: Optional[Sequence[str]] = None) -> str:
     """Execute prompt using OpenAI API"""
-    client = _get_openai_client()
-    
+    client = get_client(model_config)
+    model_name = model_config.model_id
+    lease = _acquire_rate_limit(model_config, prompt, max_tokens, system)
+    used_tokens = None
+    started = time.monotonic()
+
     try:
+        timeouts = timeouts_for(model_config)
+        deadline = call_deadline(timeouts)
+
         # OpenRouter格式的请求
-        messages = [{"role": "user", "content": prompt}]
-        headers = {}
-        
-        # 检查是否是使用OpenRouter
-        if hasattr(client, 'base_url') and client.base_url and isinstance(client.base_url, str) and "openrouter.ai" in client.base_url:
-            current_app.logger.info(f"Using OpenRouter with model: {model_name}")
-            headers = {"HTTP-Referer": "https://promptgenerator.app", "X-Title": "Prompt Generator"}
-            
+        messages = _openai_messages(prompt, system)
+        headers = _openai_headers(client, model_name)
+        extra_params = {'seed': seed} if seed is not None else {}
+
         # 增加超时设置和重试逻辑
-        response = client.chat.completions.create(
+        response = retry_policy.call(lambda: client.chat.completions.create(
             model=model_name,
             messages=messages,
             temperature=temperature,
             max_tokens=max_tokens,
-            timeout=60,  # 设置60秒超时
-            extra_headers=headers
-        )
-        
+            timeout=http_timeout(timeouts, deadline),
+            extra_headers=headers,
+            **extra_params
+        ), deadline)
+        usage = openai_usage(response.usage) if response.usage else {}
+        used_tokens = usage.get('total_tokens')
+        record_call_outcome(model_config.id, started, usage=usage)
+
         if not response.choices or len(response.choices) == 0:
             raise ValueError("No response generated from the model")
-            
+
         return response.choices[0].message.content
     except Exception as e:
         current_app.logger.error(f"OpenAI API error: {str(e)}")
-        raise ValueError(f"OpenAI API error: {str(e)}")
+        record_call_outcome(model_config.id, started, e)
+        raise ValueError(f"OpenAI API error: {str(e)}") from e
+    finally:
+        rate_limiter.release(lease, used_tokens)
 
-def _execute_anthropic(model_name: str, prompt: str, temperature: float, max_tokens: int) -> str:
+def _execute_anthropic(model_config, prompt: str, temperature: float, max_tokens: int,
+                       system: Optional[Sequence[str]] = None) -> str:
     """Execute prompt using Anthropic API"""
-    client = _get_anthropic_client()
-    
+    client = get_client(model_config)
+    lease = _acquire_rate_limit(model_config, prompt, max_tokens, system)
+    used_tokens = None
+    started = time.monotonic()
+
     try:
-        response = client.messages.create(
-            model=model_name,
+        timeouts = timeouts_for(model_config)
+        deadline = call_deadline(timeouts)
+        response = retry_policy.call(lambda: client.messages.create(
+            model=model_config.model_id,
             messages=[{"role": "user", "content": prompt}],
             temperature=temperature,
-            max_tokens=max_tokens
-        )
+            max_tokens=max_tokens,
+            timeout=http_timeout(timeouts, deadline),
+            **_anthropic_system(system)
+        ), deadline)
+        usage = anthropic_usage(response.usage)
+        used_tokens = usage['total_tokens']
+        record_call_outcome(model_config.id, started, usage=usage)
         return response.content[0].text
     except Exception as e:
         current_app.logger.error(f"Anthropic API error: {str(e)}")
-        raise ValueError(f"Anthropic API error: {str(e)}")
-
-def _get_openai_client():
-    """Get an authenticated OpenAI client"""
-    # We'll use direct config approach since the import isn't working
-    api_key = None
-    base_url = None
-    
-    # 1. Try environment variable
-    api_key = os.environ.get('OPENAI_API_KEY')
-    base_url = os.environ.get('OPENAI_BASE_URL')
-    
-    # 2. If not in environment, try database
-    if not api_key:
-        from ..models.model_config import ModelConfig
-        model_config = ModelConfig.query.filter_by(api_type='openai', is_default=True).first()
-        if not model_config:
-            model_config = ModelConfig.query.filter_by(api_type='openai').first()
-            
-        if model_config and model_config.api_key:
-            api_key = model_config.api_key
-            base_url = model_config.base_url
-    
-    if not api_key:
-        raise ValueError("No OpenAI API key found in environment or database")
-    
-    client_kwargs = {
-        'api_key': api_key,
-        'timeout': 60.0,  # 设置60秒连接超时
-        'max_retries': 2  # 最多重试2次
+        record_call_outcome(model_config.id, started, e)
+        raise ValueError(f"Anthropic API error: {str(e)}") from e
+    finally:
+        rate_limiter.release(lease, used_tokens)
+
+def _stream_openai(model_config, prompt: str, temperature: float, max_tokens: int,
+                   seed: Optional[int] = None, system: Optional[Sequence[str]] = None) -> Iterator[Dict[str, Any]]:
+    """Stream prompt execution using OpenAI API"""
+    client = get_client(model_config)
+    model_name = model_config.model_id
+    lease = _acquire_rate_limit(model_config, prompt, max_tokens, system)
+    started = time.monotonic()
+    first_token_at = None
+    chunks = []
+    usage = {}
+    stream = None
+    extra_params = {'seed': seed} if seed is not None else {}
+
+    try:
+        timeouts = timeouts_for(model_config)
+        deadline = call_deadline(timeouts)
+        stream = retry_policy.call(lambda: client.chat.completions.create(
+            model=model_name,
+            messages=_openai_messages(prompt, system),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=http_timeout(timeouts, deadline, stream=True),
+            extra_headers=_openai_headers(client, model_name),
+            stream=True,
+            # 最后一个chunk携带token用量
+            stream_options={"include_usage": True},
+            **extra_params
+        ), deadline)
+
+        for chunk in stream:
+            deadline.check()
+            if chunk.usage:
+                usage = openai_usage(chunk.usage)
+
+            if not chunk.choices:
+                continue
+
+            content = chunk.choices[0].delta.content
+            if content:
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                chunks.append(content)
+                yield {'type': 'delta', 'content': content}
+    except Exception as e:
+        current_app.logger.error(f"OpenAI API error: {str(e)}")
+        record_call_outcome(model_config.id, started, e)
+        raise ValueError(f"OpenAI API error: {str(e)}") from e
+    finally:
+        # 客户端断开时关闭上游连接，不再继续消耗生成
+        if stream is not None:
+            stream.close()
+        rate_limiter.release(lease, usage.get('total_tokens'))
+
+    record_call_outcome(model_config.id, started, usage=usage, first_token_at=first_token_at)
+    yield _done_event(model_config, chunks, usage, started, first_token_at)
+
+def _stream_anthropic(model_config, prompt: str, temperature: float, max_tokens: int,
+                      system: Optional[Sequence[str]] = None) -> Iterator[Dict[str, Any]]:
+    """Stream prompt execution using Anthropic API"""
+    client = get_client(model_config)
+    lease = _acquire_rate_limit(model_config, prompt, max_tokens, system)
+    started = time.monotonic()
+    first_token_at = None
+    chunks = []
+    usage = {}
+
+    try:
+        timeouts = timeouts_for(model_config)
+        deadline = call_deadline(timeouts)
+        # 进入上下文时才发出请求，重试需包含这一步
+        stream = retry_policy.call(lambda: client.messages.stream(
+            model=model_config.model_id,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=http_timeout(timeouts, deadline, stream=True),
+            **_anthropic_system(system)
+        ).__enter__(), deadline)
+        with stream:
+            for content in stream.text_stream:
+                deadline.check()
+                if not content:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                chunks.append(content)
+                yield {'type': 'delta', 'content': content}
+
+            usage = anthropic_usage(stream.get_final_message().usage)
+    except Exception as e:
+        current_app.logger.error(f"Anthropic API error: {str(e)}")
+        record_call_outcome(model_config.id, started, e)
+        raise ValueError(f"Anthropic API error: {str(e)}") from e
+    finally:
+        rate_limiter.release(lease, usage.get('total_tokens'))
+
+    record_call_outcome(model_config.id, started, usage=usage, first_token_at=first_token_at)
+    yield _done_event(model_config, chunks, usage, started, first_token_at)
+
+def _done_event(model_config, chunks, usage, started, first_token_at) -> Dict[str, Any]:
+    """Build the final stream event with the full content, token usage and timing"""
+    finished = time.monotonic()
+    return {
+        'type': 'done',
+        'content': "".join(chunks),
+        'usage': usage,
+        'latency_ms': round((finished - started) * 1000, 1),
+        'ttft_ms': round((first_token_at - started) * 1000, 1) if first_token_at else None,
+        'model_id': model_config.id
     }
-    
-    # 如果提供了自定义base_url，添加到客户端配置
-    # 确保base_url是字符串，不是其他类型
-    if base_url and isinstance(base_url, str):
-        client_kwargs['base_url'] = base_url
-        
-    # Configure the client with timeout settings
-    current_app.logger.info(f"Creating OpenAI client with base_url: {base_url} (type: {type(base_url).__name__})")
-    return openai.OpenAI(**client_kwargs)
-
-def _get_anthropic_client():
-    """Get an authenticated Anthropic client"""
-    # We'll use direct config approach since the import isn't working
-    api_key = None
-    
-    # 1. Try environment variable
-    api_key = os.environ.get('ANTHROPIC_API_KEY')
-    
-    # 2. If not in environment, try database
-    if not api_key:
-        from ..models.model_config import ModelConfig
-        model_config = ModelConfig.query.filter_by(api_type='anthropic').first()
-        if model_config and model_config.api_key:
-            api_key = model_config.api_key
-    
-    if not api_key:
-        raise ValueError("No Anthropic API key found in environment or database")
-    
-    # Configure the client with timeout settings
-    return anthropic.Anthropic(
-        api_key=api_key,
-        timeout=60.0  # 设置60秒连接超时
-    ) 
\ No newline at end of file
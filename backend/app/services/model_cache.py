@@ -0,0 +1,125 @@
+"""
+Model Cache Module
+
+This module keeps an in-process snapshot of the active model configurations
+and the default model, so resolving the model for a LLM call does not query
+the database.
+
+Snapshots are plain copies of the ModelConfig rows, safe to share between
+threads and to use outside the session that loaded them. Model changes bump a
+version row in the config_version table; each worker reads that row at most
+once per check interval and reloads its snapshot when the version has moved,
+so changes made through one worker reach the others within the interval.
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+from ..config.config import config
+from ..models.model_config import ModelConfig
+from .config_version_service import bump_version, read_version
+
+MODELS_VERSION = 'models'
+
+class _Snapshot:
+    """The active models and default model id as of one config version"""
+
+    def __init__(self, version: int, models: Dict[int, SimpleNamespace], default_id: Optional[int]):
+        self.version = version
+        self.models = models
+        self.default_id = default_id
+
+class ModelCache:
+    """Versioned cache of active model configurations"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._snapshot: Optional[_Snapshot] = None
+        self._checked_at = 0.0
+        self._stats = {
+            'hits': 0,
+            'version_checks': 0,
+            'loads': 0,
+            'invalidations': 0,
+        }
+
+    def resolve(self, model_id=None) -> SimpleNamespace:
+        """
+        Get the model to execute with, falling back to the default model
+        (or the first active model when none is marked default).
+
+        Raises:
+            ValueError: If the model does not exist or no models are available
+        """
+        snapshot = self._current()
+        if not model_id:
+            model_id = snapshot.default_id
+            if model_id is None:
+                raise ValueError("No models available")
+
+        model = snapshot.models.get(int(model_id))
+        if model is None:
+            raise ValueError(f"Model with ID {model_id} not found")
+        return model
+
+    def get(self, model_id) -> Optional[SimpleNamespace]:
+        """Get an active model by ID, or None"""
+        if not model_id:
+            return None
+        return self._current().models.get(int(model_id))
+
+    def invalidate(self) -> None:
+        """
+        Drop this worker's snapshot and bump the shared version so other
+        workers reload theirs. Call after the model change has been committed.
+        """
+        bump_version(MODELS_VERSION)
+
+        with self._lock:
+            self._snapshot = None
+            self._stats['invalidations'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Get model cache counters for this worker process"""
+        with self._lock:
+            snapshot = self._snapshot
+            return {
+                'enabled': self.settings.enabled,
+                **self._stats,
+                'version': snapshot.version if snapshot else None,
+                'models': len(snapshot.models) if snapshot else 0
+            }
+
+    def _current(self) -> _Snapshot:
+        """Get the snapshot, checking the shared version once per interval (needs app context)"""
+        now = time.monotonic()
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and self.settings.enabled and now - self._checked_at < self.settings.check_interval:
+                self._stats['hits'] += 1
+                return snapshot
+
+            # 持锁检查与加载，避免多个线程同时查询数据库
+            version = read_version(MODELS_VERSION)
+            self._stats['version_checks'] += 1
+            self._checked_at = now
+            if snapshot is None or snapshot.version != version or not self.settings.enabled:
+                snapshot = self._snapshot = _load(version)
+                self._stats['loads'] += 1
+            return snapshot
+
+def _load(version: int) -> _Snapshot:
+    """Copy the active model rows into a snapshot"""
+    columns = [column.name for column in ModelConfig.__table__.columns]
+    rows = ModelConfig.query.filter_by(status='active').order_by(ModelConfig.id).all()
+    models = {row.id: SimpleNamespace(**{name: getattr(row, name) for name in columns}) for row in rows}
+
+    default = next((model for model in models.values() if model.is_default), None)
+    if default is None and models:
+        default = next(iter(models.values()))
+    return _Snapshot(version, models, default.id if default else None)
+
+model_cache = ModelCache(config.model_cache)
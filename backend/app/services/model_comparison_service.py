@@ -0,0 +1,77 @@
+"""
+Model Comparison Service Module
+
+This module runs one prompt against several models side by side. All model
+calls are dispatched in parallel, so the wall-clock time of a comparison is
+that of the slowest model rather than the sum of all of them.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from .llm_service import run_prompt
+from .model_cache import model_cache
+from .usage_service import current_usage_scope, usage_scope
+
+def compare_models(
+    app,
+    prompt: str,
+    model_ids: List[int],
+    temperature: float = 0.7,
+    max_tokens: int = 2000
+) -> Dict[str, Any]:
+    """
+    Execute a prompt on several models in parallel.
+
+    Args:
+        app: The Flask application, used to give each worker thread an app context
+        prompt: The prompt text to send to every model
+        model_ids: IDs of the models to compare
+        temperature: Temperature parameter for generation
+        max_tokens: Maximum tokens to generate
+
+    Returns:
+        Dict with 'results' (one entry per model, in the requested order) and 'wall_time_ms'
+
+    Raises:
+        ValueError: If no models are given or any model is not found
+    """
+    if not model_ids:
+        raise ValueError("At least one model_id is required")
+
+    model_ids = list(dict.fromkeys(int(model_id) for model_id in model_ids))
+    models = {model_id: model_cache.get(model_id) for model_id in model_ids}
+    missing = [model_id for model_id in model_ids if models[model_id] is None]
+    if missing:
+        raise ValueError(f"Models not found: {', '.join(str(model_id) for model_id in missing)}")
+
+    scope = current_usage_scope()
+
+    def run(model_id):
+        with app.app_context(), usage_scope(*scope):
+            return run_prompt(prompt, model_id, temperature, max_tokens)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=len(model_ids), thread_name_prefix='compare') as executor:
+        futures = [(model_id, executor.submit(run, model_id)) for model_id in model_ids]
+
+        results = []
+        for model_id, future in futures:
+            entry = {'model_id': model_id, 'model_name': models[model_id].name}
+            try:
+                response = future.result()
+                entry.update({
+                    'output': response['content'],
+                    'latency_ms': response['latency_ms'],
+                    'ttft_ms': response['ttft_ms'],
+                    'usage': response['usage']
+                })
+            except Exception as e:
+                entry['error'] = str(e)
+            results.append(entry)
+
+    return {
+        'results': results,
+        'wall_time_ms': round((time.monotonic() - started) * 1000, 1)
+    }
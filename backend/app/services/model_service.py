@@ -1,10 +1,15 @@
 from ..models import db
 from ..models.model_config import ModelConfig
 from ..config.config import Config
+from .llm_client_registry import invalidate_model
+from .model_cache import model_cache
 
 # 实例化Config类
 config = Config()
 
+# update_model中未传入的可选字段保持不变，传入None时清除
+UNSET = object()
+
 def get_models():
     """Get all active model configurations"""
     return ModelConfig.query.filter_by(status='active').all()
@@ -26,28 +31,34 @@ def get_default_model():
 def _create_default_from_config():
     """Create a default model entry from the config file"""
     try:
-        default_llm = config.llm.get('default') 
+        default_llm = config.llm.get('default')
         if default_llm:
             model = ModelConfig(
                 name="Default Model",
-                model_id=default_llm.get('model', 'gpt-3.5-turbo'),
-                base_url=default_llm.get('base_url', 'https://api.openai.com/v1'),
-                api_key=default_llm.get('api_key', ''),
-                api_type=default_llm.get('api_type', 'openai'),
-                api_version=default_llm.get('api_version', ''),
+                model_id=default_llm.model or 'gpt-3.5-turbo',
+                base_url=default_llm.base_url or 'https://api.openai.com/v1',
+                api_key=default_llm.api_key or '',
+                api_type=default_llm.api_type or 'openai',
+                api_version=default_llm.api_version or '',
                 is_default=True
             )
             
             db.session.add(model)
             db.session.commit()
+            model_cache.invalidate()
             return model
     except Exception as e:
         print(f"Error creating default model: {e}")
     
     return None
 
-def create_model(name, model_id, base_url, api_key, api_type='openai', api_version='', is_default=False):
+def create_model(name, model_id, base_url, api_key, api_type='openai', api_version='', is_default=False,
+                 max_connections=None, max_concurrency=None, rpm_limit=None, tpm_limit=None,
+                 fallback_model_id=None, connect_timeout=None, first_token_timeout=None, total_timeout=None,
+                 context_window=None):
     """Create a new model configuration"""
+    _check_fallback(fallback_model_id)
+    
     # If this model is set as default, unset any existing default
     if is_default:
         _unset_current_default()
@@ -59,16 +70,30 @@ def create_model(name, model_id, base_url, api_key, api_type='openai', api_versi
         api_key=api_key,
         api_type=api_type,
         api_version=api_version,
-        is_default=is_default
+        is_default=is_default,
+        max_connections=max_connections,
+        max_concurrency=max_concurrency,
+        rpm_limit=rpm_limit,
+        tpm_limit=tpm_limit,
+        fallback_model_id=fallback_model_id,
+        connect_timeout=connect_timeout,
+        first_token_timeout=first_token_timeout,
+        total_timeout=total_timeout,
+        context_window=context_window
     )
     
     db.session.add(model)
     db.session.commit()
     
+    model_cache.invalidate()
+    
     return model
 
-def update_model(model_id, name=None, model_id_new=None, base_url=None, api_key=None, api_type=None, api_version=None, is_default=None):
-    """Update a model configuration"""
+def update_model(model_id, name=None, model_id_new=None, base_url=None, api_key=None, api_type=None, api_version=None, is_default=None,
+                 max_connections=UNSET, max_concurrency=UNSET, rpm_limit=UNSET, tpm_limit=UNSET,
+                 fallback_model_id=UNSET, connect_timeout=UNSET, first_token_timeout=UNSET, total_timeout=UNSET,
+                 context_window=UNSET):
+    """Update a model configuration; the limits, fallback, timeouts and context window are cleared by passing None"""
     model = get_model(model_id)
     
     if not model:
@@ -92,6 +117,34 @@ def update_model(model_id, name=None, model_id_new=None, base_url=None, api_key=
     if api_version:
         model.api_version = api_version
     
+    if max_connections is not UNSET:
+        model.max_connections = max_connections
+    
+    if max_concurrency is not UNSET:
+        model.max_concurrency = max_concurrency
+    
+    if rpm_limit is not UNSET:
+        model.rpm_limit = rpm_limit
+    
+    if tpm_limit is not UNSET:
+        model.tpm_limit = tpm_limit
+    
+    if fallback_model_id is not UNSET:
+        _check_fallback(fallback_model_id, model.id)
+        model.fallback_model_id = fallback_model_id
+    
+    if connect_timeout is not UNSET:
+        model.connect_timeout = connect_timeout
+    
+    if first_token_timeout is not UNSET:
+        model.first_token_timeout = first_token_timeout
+    
+    if total_timeout is not UNSET:
+        model.total_timeout = total_timeout
+    
+    if context_window is not UNSET:
+        model.context_window = context_window
+    
     if is_default is not None:
         if is_default and not model.is_default:
             _unset_current_default()
@@ -102,6 +155,10 @@ def update_model(model_id, name=None, model_id_new=None, base_url=None, api_key=
     
     db.session.commit()
     
+    # 连接参数可能已变化，下次调用时重建该模型的客户端
+    invalidate_model(model.id)
+    model_cache.invalidate()
+    
     return model
 
 def delete_model(model_id):
@@ -118,6 +175,9 @@ def delete_model(model_id):
     model.status = 'deleted'
     db.session.commit()
     
+    invalidate_model(model.id)
+    model_cache.invalidate()
+    
     return True
 
 def set_default_model(model_id):
@@ -132,8 +192,40 @@ def set_default_model(model_id):
     model.is_default = True
     db.session.commit()
     
+    model_cache.invalidate()
+    
+    return True
+
+def unset_default_model(model_id):
+    """Clear the default flag of a model, leaving no default until another is set"""
+    model = get_model(model_id)
+    
+    if not model:
+        return False
+    
+    model.is_default = False
+    db.session.commit()
+    
+    model_cache.invalidate()
+    
     return True
 
+def _check_fallback(fallback_model_id, model_id=None):
+    """Reject a fallback that is the model itself or not an active model"""
+    if fallback_model_id is None:
+        return
+    
+    try:
+        fallback_model_id = int(fallback_model_id)
+    except (TypeError, ValueError):
+        raise ValueError("fallback_model_id must be an integer")
+    
+    if fallback_model_id == model_id:
+        raise ValueError("A model cannot be its own fallback")
+    
+    if not get_model(fallback_model_id):
+        raise ValueError(f"Fallback model {fallback_model_id} not found")
+
 def _unset_current_default():
     """Unset any current default model"""
     default_models = ModelConfig.query.filter_by(is_default=True).all()
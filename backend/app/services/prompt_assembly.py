@@ -0,0 +1,166 @@
+"""
+Prompt Assembly Module
+
+This module assembles the requests that generate prompts. The static part of a
+request - the system prompt for the language and the template's format
+instructions - is compiled once per (language, template_id) together with its
+token count per encoding, so each generation only appends the user's
+description: no template query and no tokenizing of the prefix again.
+
+Updating or deleting a template bumps the shared 'templates' version row. Each
+worker reads that row at most once per check interval and drops its compiled
+prefixes when the version has moved, as the model cache does for models.
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config.config import config
+from ..llm import TokenCounter
+from ..models.prompt_template import PromptTemplate
+from ..prompt.prompt_generator import SYSTEM_PROMPT_CHINESE, SYSTEM_PROMPT_ENGLISH
+from .config_version_service import bump_version, read_version
+
+TEMPLATES_VERSION = 'templates'
+
+class CompiledPrefix:
+    """The static system message segments of a request, with their token counts"""
+
+    def __init__(self, system: Tuple[str, ...]):
+        self.system = system
+        # 编码名称 -> 系统消息的token数（含每条消息的固定开销）
+        self._tokens: Dict[str, int] = {}
+
+    def input_tokens(self, encoding, user_message: str) -> int:
+        """Count the request's input tokens as token_budget.count_input_tokens does, tokenizing only the user message"""
+        counter = TokenCounter(encoding)
+        prefix_tokens = self._tokens.get(encoding.name)
+        if prefix_tokens is None:
+            prefix_tokens = self._tokens[encoding.name] = counter.count_message_tokens(
+                [{"role": "system", "content": "\n\n".join(self.system)}]
+            )
+
+        # 两次计数各自包含一次消息列表的格式开销
+        user_tokens = counter.count_message_tokens([{"role": "user", "content": user_message}])
+        return prefix_tokens + user_tokens - TokenCounter.FORMAT_TOKENS
+
+class AssembledPrompt:
+    """A prompt generation request: the compiled prefix followed by the user's message"""
+
+    def __init__(self, prefix: CompiledPrefix, user_message: str):
+        self.prefix = prefix
+        self.user_message = user_message
+
+    @property
+    def system(self) -> List[str]:
+        return list(self.prefix.system)
+
+class PromptAssembler:
+    """Versioned cache of compiled prompt prefixes"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._prefixes: Dict[Tuple[str, Optional[int]], CompiledPrefix] = {}
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'version_checks': 0,
+            'invalidations': 0,
+        }
+
+    def assemble(self, user_description: str, template_id: Optional[int] = None,
+                 language: str = 'chinese') -> AssembledPrompt:
+        """
+        Assemble the request to generate a prompt (needs app context).
+
+        Raises:
+            ValueError: If the specified template is not found
+        """
+        prefix = self.prefix(language, template_id)
+
+        if language == 'chinese':
+            user_message = f"用户需求: {user_description}"
+        else:
+            user_message = f"User requirement: {user_description}"
+
+        return AssembledPrompt(prefix, user_message)
+
+    def prefix(self, language: str = 'chinese', template_id: Optional[int] = None) -> CompiledPrefix:
+        """
+        Get the compiled prefix for a language and template, compiling it on first use.
+
+        Raises:
+            ValueError: If the specified template is not found
+        """
+        language = 'chinese' if language == 'chinese' else 'english'
+        template_id = int(template_id) if template_id else None
+        if not self.settings.enabled:
+            return _compile(language, template_id)
+
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at >= self.settings.check_interval:
+                # 持锁检查与编译，避免多个线程同时查询数据库
+                version = read_version(TEMPLATES_VERSION)
+                self._stats['version_checks'] += 1
+                self._checked_at = now
+                if version != self._version:
+                    self._prefixes.clear()
+                    self._version = version
+
+            key = (language, template_id)
+            prefix = self._prefixes.get(key)
+            if prefix is not None:
+                self._stats['hits'] += 1
+                return prefix
+
+            prefix = self._prefixes[key] = _compile(language, template_id)
+            self._stats['misses'] += 1
+            return prefix
+
+    def invalidate(self) -> None:
+        """
+        Drop this worker's compiled prefixes and bump the shared version so
+        other workers drop theirs. Call after the template change has been committed.
+        """
+        bump_version(TEMPLATES_VERSION)
+
+        with self._lock:
+            self._prefixes.clear()
+            self._version = None
+            self._stats['invalidations'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Get prompt prefix cache counters for this worker process"""
+        with self._lock:
+            return {
+                'enabled': self.settings.enabled,
+                **self._stats,
+                'version': self._version,
+                'prefixes': len(self._prefixes)
+            }
+
+def _compile(language: str, template_id: Optional[int]) -> CompiledPrefix:
+    """Build the static system segments: the system prompt, then the template if any"""
+    # Select the appropriate system prompt based on language
+    system = [SYSTEM_PROMPT_CHINESE if language == 'chinese' else SYSTEM_PROMPT_ENGLISH]
+
+    # If template_id is provided, include the template content in the prefix
+    if template_id:
+        template = PromptTemplate.query.get(template_id)
+        if not template or template.status != 'active':
+            raise ValueError(f"Template with ID {template_id} not found")
+
+        if template.content:
+            if language == 'chinese':
+                system.append(f"请根据以下格式为我创建一个提示词:\n\n{template.content}")
+            else:
+                system.append(f"Please create a prompt for me based on the following format:\n\n{template.content}")
+
+    return CompiledPrefix(tuple(system))
+
+prompt_assembler = PromptAssembler(config.prompt_assembly)
@@ -4,14 +4,22 @@ Prompt Generator Service Module
 This module provides services for generating prompts using large language models.
 It uses the system prompt from prompt_generator.py as a base and can incorporate
 templates from the database to guide the prompt format.
+
+The static system prompt and the template are sent first, as the system message,
+and the user's description last. Requests for the same language and template
+therefore share a byte-identical prefix that providers can serve from their
+prompt cache; the prefix is compiled once by prompt_assembly.
+
+Descriptions that nearly repeat an earlier one can be answered from the
+semantic cache instead of generating again.
 """
 
-from typing import Dict, Optional
+from typing import Any, Dict, Iterator, Optional
 from flask import current_app
 
-from ..models.prompt_template import PromptTemplate
-from ..prompt.prompt_generator import SYSTEM_PROMPT_CHINESE, SYSTEM_PROMPT_ENGLISH
-from ..services.llm_service import execute_prompt
+from ..services.llm_service import execute_prompt, stream_prompt
+from .prompt_assembly import prompt_assembler
+from .semantic_cache import semantic_cache
 
 def generate_prompt_with_llm(
     user_description: str,
@@ -36,12 +44,10 @@ def generate_prompt_with_llm(
         Exception: If the LLM service fails
     """
     try:
-        final_prompt = _build_prompt(user_description, template_id, language)
-        
         # Generate prompt using LLM service
         generated_prompt = execute_prompt(
-            prompt=final_prompt,
-            temperature=temperature
+            temperature=temperature,
+            **_build_prompt(user_description, template_id, language)
         )
         
         # 确保得到的结果不为空
@@ -54,13 +60,115 @@ def generate_prompt_with_llm(
         # 直接抛出异常，不再使用mock
         raise
 
+def generate_prompt_cached(
+    user_description: str,
+    template_id: Optional[int] = None,
+    temperature: float = 0.7,
+    language: str = 'chinese',
+    regenerate: bool = False
+) -> Dict[str, Any]:
+    """
+    Generate a prompt, or return the generation of a near-duplicate earlier description.
+    
+    Args:
+        user_description: User's description for what kind of prompt they want
+        template_id: Optional ID of a template to use as the output format
+        temperature: Temperature setting for LLM generation
+        language: Language for the prompt generation ('chinese' or 'english')
+        regenerate: Skip the cache lookup and cache the new generation
+        
+    Returns:
+        Dict[str, Any]: 'generated_prompt' and 'cached'; cached results also carry
+        'similarity' and the 'cached_description' they were generated for
+    
+    Raises:
+        ValueError: If the specified template is not found
+        Exception: If the LLM service fails
+    """
+    if not regenerate:
+        hit = semantic_cache.lookup(user_description, template_id, language)
+        if hit:
+            return {**hit, 'cached': True}
+    
+    generated_prompt = generate_prompt_with_llm(user_description, template_id, temperature, language)
+    semantic_cache.store(user_description, generated_prompt, template_id, language)
+    
+    return {'generated_prompt': generated_prompt, 'cached': False}
+
+def stream_prompt_with_llm(
+    user_description: str,
+    template_id: Optional[int] = None,
+    temperature: float = 0.7,
+    language: str = 'chinese',
+    regenerate: bool = False
+) -> Iterator[Dict[str, Any]]:
+    """
+    Generate a prompt and stream it back as it is produced.
+    
+    Args:
+        user_description: User's description for what kind of prompt they want
+        template_id: Optional ID of a template to use as the output format
+        temperature: Temperature setting for LLM generation
+        language: Language for the prompt generation ('chinese' or 'english')
+        regenerate: Skip the semantic cache lookup and cache the new generation
+        
+    Returns:
+        Iterator of stream events from llm_service.stream_prompt; a cached result is
+        one delta with the whole prompt, then a done event with 'cached', 'similarity'
+        and 'cached_description'
+    
+    Raises:
+        ValueError: If the specified template is not found (raised before streaming starts)
+    """
+    if not regenerate:
+        hit = semantic_cache.lookup(user_description, template_id, language)
+        if hit:
+            return _cached_stream(hit)
+    
+    events = stream_prompt(
+        temperature=temperature,
+        **_build_prompt(user_description, template_id, language)
+    )
+    return _cache_stream(events, user_description, template_id, language)
+
+def _cached_stream(hit: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Stream events for a semantic cache hit"""
+    yield {'type': 'delta', 'content': hit['generated_prompt']}
+    yield {
+        'type': 'done',
+        'content': hit['generated_prompt'],
+        'usage': None,
+        'latency_ms': 0,
+        'ttft_ms': 0,
+        'model_id': None,
+        'cached': True,
+        'similarity': hit['similarity'],
+        'cached_description': hit['cached_description']
+    }
+
+def _cache_stream(events, user_description, template_id, language) -> Iterator[Dict[str, Any]]:
+    """Pass stream events through, caching the generation once it completes"""
+    try:
+        for event in events:
+            if event['type'] == 'done':
+                if event['content'].strip():
+                    semantic_cache.store(user_description, event['content'], template_id, language)
+                event = {**event, 'cached': False}
+            yield event
+    finally:
+        events.close()
+
 def _build_prompt(
     user_description: str,
     template_id: Optional[int] = None,
     language: str = 'chinese'
-) -> str:
+) -> Dict[str, Any]:
     """
-    Build the complete prompt to send to the LLM.
+    Build the request to send to the LLM.
+    
+    The static prefix comes compiled from the prompt assembler and is passed
+    along, so its cached token count is reused for whichever model the request
+    is routed to and only the user's description is new work per request.
     
     Args:
         user_description: User's description for what kind of prompt they want
@@ -68,35 +176,17 @@ def _build_prompt(
         language: Language for the prompt generation ('chinese' or 'english')
         
     Returns:
-        str: The full prompt to send to the LLM
+        Dict[str, Any]: The 'prompt' (user message), 'system' segments (static system
+        prompt, then the template if any) and their compiled 'prefix' to execute with
         
     Raises:
         ValueError: If the specified template is not found
     """
-    # Select the appropriate system prompt based on language
-    system_prompt = SYSTEM_PROMPT_CHINESE if language == 'chinese' else SYSTEM_PROMPT_ENGLISH
+    assembled = prompt_assembler.assemble(user_description, template_id, language)
     
-    # If template_id is provided, get the template content to include in the prompt
-    template_content = None
-    if template_id:
-        template = PromptTemplate.query.get(template_id)
-        if not template:
-            raise ValueError(f"Template with ID {template_id} not found")
-        template_content = template.content
-    
-    # Create the full prompt with system and user content
-    final_prompt = system_prompt + "\n\n"
-    
-    # If template content is available, include it in the prompt
-    if template_content:
-        if language == 'chinese':
-            final_prompt += f"请根据以下格式为我创建一个提示词:\n\n{template_content}\n\n用户需求: {user_description}"
-        else:
-            final_prompt += f"Please create a prompt for me based on the following format:\n\n{template_content}\n\nUser requirement: {user_description}"
-    else:
-        if language == 'chinese':
-            final_prompt += f"用户需求: {user_description}"
-        else:
-            final_prompt += f"User requirement: {user_description}"
-            
-    return final_prompt 
\ No newline at end of file
+    # 输入token数在执行时按选定的模型计算，前缀的计数来自编译缓存
+    return {
+        'prompt': assembled.user_message,
+        'system': assembled.system,
+        'prefix': assembled.prefix
+    }
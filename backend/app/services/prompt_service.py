@@ -4,26 +4,30 @@ from ..models.prompt_version import PromptVersion
 
 def create_prompt(name, content, source='user'):
     """Create a new prompt with an initial version"""
-    # Create the prompt
-    prompt = Prompt(
-        name=name,
-        source=source
-    )
+    return create_prompts([(name, content)], source)[0]
+
+def create_prompts(items, source='user', commit=True):
+    """Create several prompts, each with an initial version, in one transaction"""
+    # Create the prompts
+    prompts = [Prompt(name=name, source=source) for name, _ in items]
     
-    db.session.add(prompt)
-    db.session.flush()  # Generate ID for prompt before creating version
+    db.session.add_all(prompts)
+    db.session.flush()  # Generate IDs for prompts before creating versions
     
-    # Create the first version
-    version = PromptVersion(
-        prompt_id=prompt.id,
-        version=1,
-        content=content
-    )
+    # Create the first versions
+    db.session.add_all([
+        PromptVersion(
+            prompt_id=prompt.id,
+            version=1,
+            content=content
+        )
+        for prompt, (_, content) in zip(prompts, items)
+    ])
     
-    db.session.add(version)
-    db.session.commit()
+    if commit:
+        db.session.commit()
     
-    return prompt
+    return prompts
 
 def update_prompt(prompt_id, content, name=None):
     """Update a prompt by creating a new version"""
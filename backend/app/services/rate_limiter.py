@@ -0,0 +1,335 @@
+"""
+Rate Limiter Module
+
+This module keeps calls to each model within its provider limits: requests per
+minute, tokens per minute and concurrent requests, as configured on the
+ModelConfig row (rpm_limit, tpm_limit, max_concurrency).
+
+Requests and tokens are token buckets that refill continuously. Bucket state,
+in-flight leases and the wait queue are kept in the workspace database, so the
+budget holds across worker processes. When the budget is exhausted callers wait in a FIFO queue per model instead of
+failing; leases and queue entries left behind by a dead process are removed.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from ..config.config import config
+from .request_deadline import current_deadline
+from .tokenizer_registry import get_encoding
+from .workspace_db import get_connection, process_alive
+
+LIMITER_DB = 'rate_limiter.db'
+
+LIMITER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    model_id INTEGER PRIMARY KEY,
+    requests REAL NOT NULL,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS waiters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model_id INTEGER NOT NULL,
+    pid INTEGER NOT NULL,
+    tokens INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_waiters_model ON waiters (model_id, id);
+CREATE TABLE IF NOT EXISTS leases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model_id INTEGER NOT NULL,
+    pid INTEGER NOT NULL,
+    tokens INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_leases_model ON leases (model_id);
+"""
+
+# Limits of one model; None means unlimited
+ModelLimits = namedtuple('ModelLimits', ['model_id', 'rpm', 'tpm', 'concurrency'])
+
+# A granted request; release it when the provider call finishes
+Lease = namedtuple('Lease', ['id', 'limits', 'tokens'])
+
+class RateLimitTimeout(Exception):
+    """Raised when a request waited longer than max_wait_seconds for its turn"""
+
+def limits_for(model_config) -> Optional[ModelLimits]:
+    """Get the rate limits of a ModelConfig row, or None when it has none"""
+    limits = ModelLimits(
+        model_id=model_config.id,
+        rpm=getattr(model_config, 'rpm_limit', None),
+        tpm=getattr(model_config, 'tpm_limit', None),
+        concurrency=getattr(model_config, 'max_concurrency', None)
+    )
+    if not (limits.rpm or limits.tpm or limits.concurrency):
+        return None
+    return limits
+
+class RateLimiter:
+    """Token buckets, concurrency leases and a fair wait queue shared by all workers on the host"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._tokenizer = None
+        self._tokenizer_lock = threading.Lock()
+        self._last_stale_check = 0.0
+
+    def estimate_tokens(self, prompt: str, max_tokens: int = 0) -> int:
+        """Estimate the tokens a request counts against tokens-per-minute (prompt plus max_tokens)"""
+        return self._count_text(prompt) + (max_tokens or 0)
+
+    @contextmanager
+    def limit(self, limits: Optional[ModelLimits], tokens: int = 0):
+        """Hold a lease for the duration of the block; yields the lease (None when unlimited)"""
+        lease = self.acquire(limits, tokens)
+        try:
+            yield lease
+        finally:
+            self.release(lease)
+
+    def acquire(self, limits: Optional[ModelLimits], tokens: int = 0) -> Optional[Lease]:
+        """
+        Wait for this request's turn and take its share of the budget.
+
+        Args:
+            limits: The model's limits (see limits_for); None skips limiting
+            tokens: Estimated tokens of the request
+
+        Returns:
+            Lease: Pass to release() when the request finishes
+
+        Raises:
+            RateLimitTimeout: If the request waited longer than max_wait_seconds
+        """
+        if not self.enabled(limits):
+            return None
+
+        waiter_id = self._enqueue(limits, tokens)
+        deadline = self._wait_deadline()
+        try:
+            while True:
+                lease, wait = self._try_acquire(limits, waiter_id, tokens)
+                if lease:
+                    return lease
+                self._check_deadline(limits, deadline)
+                time.sleep(wait)
+        except BaseException:
+            self._dequeue(waiter_id)
+            raise
+
+    async def acquire_async(self, limits: Optional[ModelLimits], tokens: int = 0) -> Optional[Lease]:
+        """Like acquire(), but waits without blocking the event loop"""
+        if not self.enabled(limits):
+            return None
+
+        # SQLite事务可能等待其他worker的写锁，在线程中执行以免阻塞事件循环
+        waiter_id = await asyncio.to_thread(self._enqueue, limits, tokens)
+        deadline = self._wait_deadline()
+        try:
+            while True:
+                lease, wait = await asyncio.to_thread(self._try_acquire, limits, waiter_id, tokens)
+                if lease:
+                    return lease
+                self._check_deadline(limits, deadline)
+                await asyncio.sleep(wait)
+        except BaseException:
+            # 取消时也要离开队列，否则会阻塞排在后面的请求
+            await asyncio.shield(asyncio.to_thread(self._dequeue, waiter_id))
+            raise
+
+    def release(self, lease: Optional[Lease], actual_tokens: Optional[int] = None) -> None:
+        """
+        Release a lease, freeing its concurrency slot.
+
+        When the actual token usage is known, the difference from the estimate
+        is returned to (or taken from) the tokens-per-minute bucket.
+        """
+        if lease is None:
+            return
+
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DELETE FROM leases WHERE id = ?', (lease.id,))
+            if lease.limits.tpm and actual_tokens is not None:
+                connection.execute(
+                    'UPDATE buckets SET tokens = MIN(tokens + ?, ?) WHERE model_id = ?',
+                    (lease.tokens - min(actual_tokens, lease.limits.tpm), lease.limits.tpm, lease.limits.model_id)
+                )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    async def release_async(self, lease: Optional[Lease], actual_tokens: Optional[int] = None) -> None:
+        """Like release(), but without blocking the event loop"""
+        if lease is None:
+            return
+
+        # 即使调用方被取消，也要完成释放
+        await asyncio.shield(asyncio.to_thread(self.release, lease, actual_tokens))
+
+    def enabled(self, limits: Optional[ModelLimits]) -> bool:
+        """Check whether requests with these limits go through the limiter"""
+        return bool(self.settings.enabled and limits)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the current budget, in-flight and waiting requests per model"""
+        connection = self._connection()
+        models = {}
+
+        for model_id, requests, tokens in connection.execute('SELECT model_id, requests, tokens FROM buckets'):
+            models[model_id] = {
+                'requests_available': round(requests, 2),
+                'tokens_available': round(tokens),
+                'in_flight': 0,
+                'waiting': 0
+            }
+        for model_id, count in connection.execute('SELECT model_id, COUNT(*) FROM leases GROUP BY model_id'):
+            models.setdefault(model_id, {})['in_flight'] = count
+        for model_id, count in connection.execute('SELECT model_id, COUNT(*) FROM waiters GROUP BY model_id'):
+            models.setdefault(model_id, {})['waiting'] = count
+
+        return {
+            'enabled': self.settings.enabled,
+            'models': {str(model_id): values for model_id, values in models.items()}
+        }
+
+    def _connection(self):
+        return get_connection(LIMITER_DB, LIMITER_SCHEMA)
+
+    def _enqueue(self, limits: ModelLimits, tokens: int) -> int:
+        """Join the end of the model's wait queue"""
+        cursor = self._connection().execute(
+            'INSERT INTO waiters (model_id, pid, tokens, created_at) VALUES (?, ?, ?, ?)',
+            (limits.model_id, os.getpid(), tokens, time.time())
+        )
+        return cursor.lastrowid
+
+    def _dequeue(self, waiter_id: int) -> None:
+        self._connection().execute('DELETE FROM waiters WHERE id = ?', (waiter_id,))
+
+    def _try_acquire(self, limits: ModelLimits, waiter_id: int, tokens: int):
+        """
+        Grant a lease if this waiter is first in line and the budget allows it.
+
+        Returns:
+            (Lease, None) when granted, otherwise (None, seconds to wait before trying again)
+        """
+        connection = self._connection()
+        poll_interval = self.settings.poll_interval
+
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            self._remove_stale(connection)
+
+            head = connection.execute(
+                'SELECT id FROM waiters WHERE model_id = ? ORDER BY id LIMIT 1', (limits.model_id,)
+            ).fetchone()
+            if head is None or head[0] != waiter_id:
+                # 严格按排队顺序放行，保证多个worker之间的公平
+                connection.execute('COMMIT')
+                return None, poll_interval
+
+            requests, bucket_tokens = self._refill(connection, limits, now)
+            # 超过桶容量的请求按满桶计算，否则永远无法放行
+            cost = min(tokens, limits.tpm) if limits.tpm else 0
+
+            wait = 0.0
+            if limits.rpm and requests < 1:
+                wait = max(wait, (1 - requests) * 60.0 / limits.rpm)
+            if limits.tpm and bucket_tokens < cost:
+                wait = max(wait, (cost - bucket_tokens) * 60.0 / limits.tpm)
+            if limits.concurrency:
+                in_flight = connection.execute(
+                    'SELECT COUNT(*) FROM leases WHERE model_id = ?', (limits.model_id,)
+                ).fetchone()[0]
+                if in_flight >= limits.concurrency:
+                    wait = max(wait, poll_interval)
+
+            if wait > 0:
+                connection.execute('COMMIT')
+                return None, min(max(wait, poll_interval), 1.0)
+
+            connection.execute(
+                'UPDATE buckets SET requests = ?, tokens = ?, updated_at = ? WHERE model_id = ?',
+                (requests - 1 if limits.rpm else requests, bucket_tokens - cost, now, limits.model_id)
+            )
+            lease_id = connection.execute(
+                'INSERT INTO leases (model_id, pid, tokens, created_at) VALUES (?, ?, ?, ?)',
+                (limits.model_id, os.getpid(), cost, now)
+            ).lastrowid
+            connection.execute('DELETE FROM waiters WHERE id = ?', (waiter_id,))
+            connection.execute('COMMIT')
+            return Lease(lease_id, limits, cost), None
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def _refill(self, connection, limits: ModelLimits, now: float):
+        """Get the model's bucket levels after refilling for the time elapsed since the last update"""
+        row = connection.execute(
+            'SELECT requests, tokens, updated_at FROM buckets WHERE model_id = ?', (limits.model_id,)
+        ).fetchone()
+
+        if row is None:
+            requests, tokens = float(limits.rpm or 0), float(limits.tpm or 0)
+            connection.execute(
+                'INSERT INTO buckets (model_id, requests, tokens, updated_at) VALUES (?, ?, ?, ?)',
+                (limits.model_id, requests, tokens, now)
+            )
+            return requests, tokens
+
+        requests, tokens, updated_at = row
+        elapsed = max(now - updated_at, 0.0)
+        if limits.rpm:
+            requests = min(requests + elapsed * limits.rpm / 60.0, limits.rpm)
+        if limits.tpm:
+            tokens = min(tokens + elapsed * limits.tpm / 60.0, limits.tpm)
+
+        return requests, tokens
+
+    def _remove_stale(self, connection) -> None:
+        """Drop leases and queue entries owned by processes that no longer exist"""
+        if time.monotonic() - self._last_stale_check < self.settings.stale_check_interval:
+            return
+        self._last_stale_check = time.monotonic()
+
+        pids = {pid for (pid,) in connection.execute('SELECT pid FROM leases UNION SELECT pid FROM waiters')}
+        for pid in pids:
+            if not process_alive(pid):
+                connection.execute('DELETE FROM leases WHERE pid = ?', (pid,))
+                connection.execute('DELETE FROM waiters WHERE pid = ?', (pid,))
+
+    def _wait_deadline(self) -> float:
+        """Monotonic time to give up waiting: max_wait_seconds, cut short by the request deadline"""
+        deadline = time.monotonic() + self.settings.max_wait_seconds
+        request = current_deadline()
+        return min(deadline, request.expires_at) if request is not None else deadline
+
+    def _check_deadline(self, limits: ModelLimits, deadline: float) -> None:
+        if time.monotonic() > deadline:
+            raise RateLimitTimeout(f"Timed out waiting for the rate limit of model {limits.model_id}")
+
+    def _count_text(self, text: str) -> int:
+        """Count the tokens of a text with the shared tokenizer"""
+        if not text:
+            return 0
+
+        if self._tokenizer is None:
+            with self._tokenizer_lock:
+                if self._tokenizer is None:
+                    from ..llm import TokenCounter
+                    self._tokenizer = TokenCounter(get_encoding(config.tokenizer.default_encoding))
+
+        return self._tokenizer.count_text(text)
+
+rate_limiter = RateLimiter(config.rate_limit)
@@ -0,0 +1,303 @@
+"""
+Request Coalescer Module
+
+This module merges identical LLM requests that are in flight at the same time
+(singleflight). The first request for a key becomes the leader and calls the
+provider; identical requests that arrive while it runs wait for it and receive
+the same result instead of calling the provider again.
+
+Requests are coalesced within a process through a shared in-memory flight,
+and across processes through a row in the workspace database that followers
+poll until the leader records the result. If a leader's process dies, a follower takes over.
+
+On the event loop the flight runs as its own task that every identical request
+awaits, so a request that is cancelled (e.g. its client disconnected) leaves
+the call running for the others; it is cancelled only when no request awaits
+it any more.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from ..config.config import config
+from .request_deadline import DeadlineExceeded, current_deadline
+from .workspace_db import get_connection, process_alive
+
+COALESCER_DB = 'request_coalescer.db'
+
+COALESCER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS flights (
+    key TEXT PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    retryable INTEGER NOT NULL DEFAULT 0,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_flights_finished ON flights (finished_at);
+"""
+
+_LEAD, _WAIT, _DONE, _FAILED = 'lead', 'wait', 'done', 'failed'
+
+class CoalescedRequestError(Exception):
+    """Raised to requests that joined a flight whose leader failed in another process"""
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        # 领导者的错误是否为可重试的临时错误（如429、超时），供retry_policy.is_retryable判断
+        self.retryable = retryable
+
+class _Flight:
+    """An in-process flight that local threads wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class _AsyncFlight:
+    """An in-process flight on the event loop and the number of requests awaiting it"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class RequestCoalescer:
+    """Singleflight for identical concurrent requests, within and across worker processes"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._flights: Dict[str, _Flight] = {}
+        self._async_flights: Dict[str, _AsyncFlight] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'leaders': 0,
+            'local_joins': 0,
+            'shared_joins': 0,
+            'takeovers': 0,
+        }
+
+    @staticmethod
+    def make_key(model_config, prompt: str, temperature, max_tokens, seed=None, system=None) -> str:
+        """Hash everything that makes two requests identical"""
+        payload = {
+            'model': [model_config.id, model_config.model_id, model_config.base_url, model_config.api_type],
+            'system': list(system or []),
+            'prompt': prompt,
+            'temperature': temperature,
+            'max_tokens': max_tokens,
+            'seed': seed,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def do(self, key: str, func: Callable[[], str]) -> str:
+        """
+        Run func for this key, or wait for an identical call already in flight.
+
+        Args:
+            key: Request key (see make_key)
+            func: Performs the request and returns its text result
+
+        Returns:
+            str: The result of this call or of the flight it joined
+        """
+        if not self.settings.enabled:
+            return func()
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self._stats['local_joins'] += 1
+
+        if not leader:
+            request = current_deadline()
+            if not flight.event.wait(request.remaining() if request is not None else None):
+                raise DeadlineExceeded("Request timed out waiting for an identical request in flight")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._run_shared(key, func)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+
+    async def do_async(self, key: str, func: Callable[[], Awaitable[str]]) -> str:
+        """Like do(), for coroutines running on the event loop"""
+        if not self.settings.enabled:
+            return await func()
+
+        # 事件循环内的flight与线程中的flight分开记录，二者通过共享表协调
+        flight = self._async_flights.get(key)
+        if flight is None:
+            # 作为独立任务运行，发起请求被取消时其他等待者仍能拿到结果
+            flight = self._async_flights[key] = _AsyncFlight(
+                asyncio.get_running_loop().create_task(self._run_shared_async(key, func))
+            )
+            flight.task.add_done_callback(lambda _: self._end_async_flight(key, flight))
+        else:
+            with self._lock:
+                self._stats['local_joins'] += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                # 所有等待者都已取消，之后的相同请求发起新的flight
+                self._end_async_flight(key, flight)
+                flight.task.cancel()
+
+    def _end_async_flight(self, key: str, flight: _AsyncFlight) -> None:
+        if self._async_flights.get(key) is flight:
+            del self._async_flights[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Get coalescing counters for this worker process"""
+        with self._lock:
+            return {'enabled': self.settings.enabled, **self._stats}
+
+    def _run_shared(self, key: str, func: Callable[[], str]) -> str:
+        """Lead the flight across processes, or follow another process's leader"""
+        deadline = time.monotonic() + self.settings.max_wait_seconds
+        request = current_deadline()
+        joined = False
+        while True:
+            action, value = self._claim(key, joined)
+            joined = True
+            if action == _LEAD:
+                return self._lead(key, func)
+            if action == _DONE:
+                return value
+            if action == _FAILED:
+                raise CoalescedRequestError(*value)
+            if request is not None:
+                request.check()
+            if time.monotonic() > deadline:
+                # 等待超时，不再依赖其他进程的结果
+                return func()
+            time.sleep(self.settings.poll_interval)
+
+    async def _run_shared_async(self, key: str, func: Callable[[], Awaitable[str]]) -> str:
+        deadline = time.monotonic() + self.settings.max_wait_seconds
+        request = current_deadline()
+        joined = False
+        while True:
+            # 共享表的读写可能等待其他worker的写锁，在线程中执行以免阻塞事件循环
+            action, value = await asyncio.to_thread(self._claim, key, joined)
+            joined = True
+            if action == _LEAD:
+                try:
+                    result = await func()
+                except BaseException as e:
+                    await asyncio.shield(asyncio.to_thread(self._finish, key, None, e))
+                    raise
+                await asyncio.to_thread(self._finish, key, result, None)
+                return result
+            if action == _DONE:
+                return value
+            if action == _FAILED:
+                raise CoalescedRequestError(*value)
+            if request is not None:
+                request.check()
+            if time.monotonic() > deadline:
+                return await func()
+            await asyncio.sleep(self.settings.poll_interval)
+
+    def _lead(self, key: str, func: Callable[[], str]) -> str:
+        try:
+            result = func()
+        except BaseException as e:
+            self._finish(key, None, e)
+            raise
+        self._finish(key, result, None)
+        return result
+
+    def _claim(self, key: str, joined: bool):
+        """
+        Decide this request's role in the shared flight for its key.
+
+        A finished flight's result is only handed to requests that joined it
+        while it was running (joined=True); later requests start a new flight.
+
+        Returns:
+            (action, value): ('lead', None), ('wait', None), ('done', result) or
+            ('failed', (error message, retryable))
+        """
+        connection = self._connection()
+        now = time.time()
+
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT pid, status, result, error, retryable FROM flights WHERE key = ?', (key,)
+            ).fetchone()
+
+            takeover = False
+            if row is not None:
+                pid, status, result, error, retryable = row
+                if status == 'running':
+                    if process_alive(pid):
+                        connection.execute('COMMIT')
+                        return _WAIT, None
+                    takeover = True
+                elif joined:
+                    connection.execute('COMMIT')
+                    with self._lock:
+                        self._stats['shared_joins'] += 1
+                    return (_DONE, result) if status == 'done' else (_FAILED, (error, bool(retryable)))
+
+            connection.execute(
+                'INSERT OR REPLACE INTO flights (key, pid, status, result, error, retryable, started_at, finished_at) '
+                'VALUES (?, ?, ?, NULL, NULL, 0, ?, NULL)',
+                (key, os.getpid(), 'running', now)
+            )
+            connection.execute(
+                'DELETE FROM flights WHERE finished_at IS NOT NULL AND finished_at < ?',
+                (now - self.settings.result_ttl_seconds,)
+            )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+        with self._lock:
+            self._stats['leaders'] += 1
+            if takeover:
+                self._stats['takeovers'] += 1
+        return _LEAD, None
+
+    def _finish(self, key: str, result: Optional[str], error: Optional[BaseException]) -> None:
+        """Publish the leader's outcome to followers in other processes"""
+        from .retry_policy import is_retryable
+
+        message = (str(error) or type(error).__name__) if error is not None else None
+        # 取消也视为可重试：跟随者重新发起即可
+        retryable = error is not None and (not isinstance(error, Exception) or is_retryable(error))
+        self._connection().execute(
+            'UPDATE flights SET status = ?, result = ?, error = ?, retryable = ?, finished_at = ? '
+            'WHERE key = ? AND pid = ?',
+            ('failed' if error is not None else 'done', result, message, int(retryable), time.time(), key, os.getpid())
+        )
+
+    def _connection(self):
+        return get_connection(COALESCER_DB, COALESCER_SCHEMA)
+
+request_coalescer = RequestCoalescer(config.coalescing)
@@ -0,0 +1,120 @@
+"""
+Request Deadline Module
+
+This module bounds how long a LLM call, and the request around it, may run.
+
+Each model has three timeouts (falling back to [llm_client] in config.toml):
+connect (establishing the connection), first token (waiting for the first
+chunk of a stream, and for each chunk after it) and total (one provider call
+from start to finish).
+
+On top of that, a request-level deadline is opened around each execution and
+stored in a context variable, so every provider call made for the request,
+including SDK retries, hedged duplicates and fallback models, shares what is
+left of one budget instead of each starting a fresh timeout.
+"""
+
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+import anthropic
+import httpx
+import openai
+
+from ..config.config import config
+
+ModelTimeouts = namedtuple('ModelTimeouts', ['connect', 'first_token', 'total'])
+
+_current: ContextVar[Optional["Deadline"]] = ContextVar('request_deadline', default=None)
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of time"""
+
+class Deadline:
+    """A point in (monotonic) time by which a request must finish"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (negative once it has passed)"""
+        return self.expires_at - time.monotonic()
+
+    def check(self) -> None:
+        """Raise DeadlineExceeded if the deadline has passed"""
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(f"Request timed out after {self.seconds:g}s")
+
+def timeouts_for(model_config=None) -> ModelTimeouts:
+    """Get a model's timeouts, falling back to the [llm_client] defaults (all defaults without a model)"""
+    settings = config.llm_client
+    return ModelTimeouts(
+        connect=getattr(model_config, 'connect_timeout', None) or settings.connect_timeout,
+        first_token=getattr(model_config, 'first_token_timeout', None) or settings.timeout,
+        total=getattr(model_config, 'total_timeout', None) or settings.total_timeout,
+    )
+
+def current_deadline() -> Optional[Deadline]:
+    """Get the deadline of the request being handled, if one is open"""
+    return _current.get()
+
+@contextmanager
+def request_deadline(seconds: Optional[float] = None):
+    """
+    Open a request-level deadline for the block.
+
+    A deadline that is already open and ends sooner is kept, so nested
+    scopes (e.g. a job running inside a route) never extend the outer budget.
+    """
+    seconds = seconds or config.llm_client.request_timeout
+    outer = _current.get()
+    if outer is not None and outer.remaining() <= seconds:
+        yield outer
+        return
+
+    deadline = Deadline(seconds)
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+def call_deadline(timeouts: ModelTimeouts) -> Deadline:
+    """
+    Start the deadline of one provider call: the model's total timeout, cut
+    short by the request deadline.
+
+    Raises:
+        DeadlineExceeded: If the request deadline has already passed
+    """
+    seconds = timeouts.total
+    outer = _current.get()
+    if outer is not None:
+        outer.check()
+        seconds = min(seconds, outer.remaining())
+    return Deadline(seconds)
+
+def http_timeout(timeouts: ModelTimeouts, deadline: Deadline, stream: bool = False) -> httpx.Timeout:
+    """
+    Build the httpx timeout for a provider call.
+
+    The read timeout bounds the wait for the first chunk of a stream (and the
+    gap between chunks); without streaming the first byte is the whole
+    response, so it is bounded by the call deadline instead.
+    """
+    remaining = max(deadline.remaining(), 0.001)
+    read = min(timeouts.first_token, remaining) if stream else remaining
+    return httpx.Timeout(remaining, connect=min(timeouts.connect, remaining), read=read)
+
+def is_timeout_error(error: BaseException) -> bool:
+    """Check whether an error, or any error it wraps, is a provider or deadline timeout"""
+    timeout_types = (DeadlineExceeded, openai.APITimeoutError, anthropic.APITimeoutError)
+    while error is not None:
+        if isinstance(error, timeout_types):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
@@ -0,0 +1,212 @@
+"""
+Request Hedger Module
+
+This module cuts tail latency by hedging slow LLM requests. The primary request
+is sent as usual; if no token has arrived by the model's recent time-to-first-
+token percentile, or it has not completed by its recent latency percentile
+(both learned from the circuit breaker's window), a duplicate request is sent
+to the same or a secondary model. Whichever finishes first wins and the other
+is cancelled.
+
+Hedging costs extra provider calls, so the share of hedged requests and the
+tokens spent on cancelled requests are both capped over a rolling window and
+reported in the stats.
+"""
+
+import contextvars
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Callable, Dict, Optional
+
+from ..config.config import config
+from .circuit_breaker import circuit_breaker
+
+# 等待首个token与等待完成的对冲时间（秒），None表示样本不足、不按该条件对冲
+HedgeDelays = namedtuple('HedgeDelays', ['first_token', 'completion'])
+
+class HedgeCancelled(Exception):
+    """Raised inside an attempt that lost the race and stopped early"""
+
+    def __init__(self, tokens: int = 0):
+        super().__init__("Request cancelled by a faster hedged request")
+        self.tokens = tokens
+
+class RequestHedger:
+    """Hedged execution with a rolling budget on hedge rate and wasted tokens"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._lock = threading.Lock()
+        # (时间, 是否对冲, 有效token, 浪费token)
+        self._window = deque()
+        self._stats = {
+            'requests': 0,
+            'hedged': 0,
+            'hedge_wins': 0,
+            'primary_wins': 0,
+            'budget_denied': 0,
+            'used_tokens': 0,
+            'wasted_tokens': 0,
+        }
+
+    def delays_for(self, model_id: int) -> Optional[HedgeDelays]:
+        """Get how long to wait for a model's primary request before hedging, in seconds (None = don't hedge)"""
+        if not self.settings.enabled:
+            return None
+
+        percentile, min_samples = self.settings.percentile, self.settings.min_samples
+        ttft_ms = circuit_breaker.ttft_percentile(model_id, percentile, min_samples)
+        latency_ms = circuit_breaker.latency_percentile(model_id, percentile, min_samples)
+        if ttft_ms is None and latency_ms is None:
+            return None
+        return HedgeDelays(
+            first_token=max(ttft_ms, self.settings.min_delay_ms) / 1000 if ttft_ms is not None else None,
+            completion=max(latency_ms, self.settings.min_delay_ms) / 1000 if latency_ms is not None else None
+        )
+
+    def run(self, attempt: Callable[[Any, threading.Event, threading.Event], Dict[str, Any]], primary, secondary,
+            delays: HedgeDelays) -> Dict[str, Any]:
+        """
+        Run the primary attempt and hedge it with the secondary if it is slow.
+
+        Args:
+            attempt: Runs a request against a model config; must set the second
+                event when the first token arrives, stop and raise HedgeCancelled
+                soon after the first event is set, and return a dict with 'usage'
+                when it completes
+            primary: Model config of the primary request
+            secondary: Model config to send the hedged request to
+            delays: Seconds to wait for the primary's first token and completion
+                before hedging (see delays_for)
+
+        Returns:
+            Dict[str, Any]: The result of whichever attempt completed first
+        """
+        primary_cancel = threading.Event()
+        primary_future = _start(attempt, primary, primary_cancel)
+
+        if not _is_slow(primary_future, delays) or not self._reserve_hedge():
+            result = primary_future.result()
+            self._record(_total_tokens(result), 0, hedged=False)
+            return result
+
+        hedge_cancel = threading.Event()
+        hedge_future = _start(attempt, secondary, hedge_cancel)
+        cancels = {primary_future: primary_cancel, hedge_future: hedge_cancel}
+        pending = set(cancels)
+        first_error = None
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    first_error = first_error or future.exception()
+                    continue
+
+                result = future.result()
+                loser = hedge_future if future is primary_future else primary_future
+                cancels[loser].set()
+                with self._lock:
+                    self._stats['hedge_wins' if future is hedge_future else 'primary_wins'] += 1
+                # 失败者在后台结束后再计入浪费的token，不阻塞本次返回
+                loser.add_done_callback(lambda f: self._record(0, _wasted_tokens(f)))
+                self._record(_total_tokens(result), 0, hedged=True)
+                return result
+
+        # 主请求与备份请求都失败时返回主请求的错误
+        primary_future.result()
+        raise first_error
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hedging counters for this worker process"""
+        with self._lock:
+            self._trim(time.monotonic())
+            requests = sum(1 for entry in self._window if entry[1] is not None)
+            hedged = sum(1 for entry in self._window if entry[1])
+            used = sum(entry[2] for entry in self._window)
+            wasted = sum(entry[3] for entry in self._window)
+            return {
+                'enabled': self.settings.enabled,
+                **self._stats,
+                'window_seconds': self.settings.window_seconds,
+                'hedge_rate': round(hedged / requests, 3) if requests else 0.0,
+                'overhead_ratio': round(wasted / used, 3) if used else 0.0
+            }
+
+    def _reserve_hedge(self) -> bool:
+        """Check the hedge budget and count a hedge against it"""
+        with self._lock:
+            self._trim(time.monotonic())
+            requests = sum(1 for entry in self._window if entry[1] is not None) + 1
+            hedged = sum(1 for entry in self._window if entry[1]) + 1
+            used = sum(entry[2] for entry in self._window)
+            wasted = sum(entry[3] for entry in self._window)
+
+            if hedged > self.settings.max_hedge_rate * requests or (
+                    used and wasted > self.settings.max_overhead_ratio * used):
+                self._stats['budget_denied'] += 1
+                return False
+
+            self._stats['hedged'] += 1
+            return True
+
+    def _record(self, used_tokens: int, wasted_tokens: int, hedged: Optional[bool] = None) -> None:
+        """Add a completed request (hedged True/False) or a loser's wasted tokens (hedged None) to the window"""
+        now = time.monotonic()
+        with self._lock:
+            self._window.append((now, hedged, used_tokens, wasted_tokens))
+            if hedged is not None:
+                self._stats['requests'] += 1
+            self._stats['used_tokens'] += used_tokens
+            self._stats['wasted_tokens'] += wasted_tokens
+            self._trim(now)
+
+    def _trim(self, now: float) -> None:
+        while self._window and now - self._window[0][0] > self.settings.window_seconds:
+            self._window.popleft()
+
+def _start(attempt, model_config, cancelled: threading.Event) -> Future:
+    """Run an attempt in its own thread; a pool could queue the primary behind other requests"""
+    future = Future()
+    future.set_running_or_notify_cancel()
+    future.first_token = threading.Event()
+    # 完成也算收到首个token，等待首个token时不必再单独等待完成
+    future.add_done_callback(lambda f: f.first_token.set())
+    # 线程继承调用方的上下文变量（如请求截止时间）
+    context = contextvars.copy_context()
+
+    def run():
+        try:
+            future.set_result(attempt(model_config, cancelled, future.first_token))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=context.run, args=(run,), name='request-hedge', daemon=True).start()
+    return future
+
+def _is_slow(future: Future, delays: HedgeDelays) -> bool:
+    """Wait for an attempt until a hedge trigger fires; False if it completed first"""
+    started = time.monotonic()
+    if delays.first_token is not None and not future.first_token.wait(delays.first_token):
+        # 超过首token阈值仍未收到任何token
+        return True
+    if delays.completion is None:
+        # 只有首token样本时，收到首个token后不再对冲
+        return False
+
+    done, _ = wait([future], timeout=max(delays.completion - (time.monotonic() - started), 0))
+    return not done
+
+def _total_tokens(result: Dict[str, Any]) -> int:
+    return (result.get('usage') or {}).get('total_tokens') or 0
+
+def _wasted_tokens(future: Future) -> int:
+    """Tokens spent by the losing attempt, whether it was cancelled or finished anyway"""
+    error = future.exception()
+    if error is None:
+        return _total_tokens(future.result())
+    return error.tokens if isinstance(error, HedgeCancelled) else 0
+
+request_hedger = RequestHedger(config.hedging)
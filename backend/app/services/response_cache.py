@@ -0,0 +1,177 @@
+"""
+Response Cache Module
+
+This module caches LLM responses for repeated executions of the same prompt.
+It has two tiers:
+
+- an in-memory LRU per worker process, for the fastest hits
+- a table in the workspace database, shared across processes
+
+Entries expire after a TTL and both tiers are bounded in size. Only deterministic
+requests (temperature 0 or an explicit seed) are cached unless the caller or the
+configuration opts in.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from flask import current_app
+
+from ..config.config import config
+from .workspace_db import get_connection
+
+CACHE_DB = 'response_cache.db'
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access);
+"""
+
+# 每写入多少次检查一次磁盘层容量并清理过期数据
+_EVICTION_INTERVAL = 100
+
+class ResponseCache:
+    """Two-tier (memory LRU + shared SQLite) cache of LLM responses"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+        }
+
+    def should_use(self, temperature: Optional[float], seed: Optional[int], cache: Optional[bool]) -> bool:
+        """Decide whether a request reads and writes the cache"""
+        if cache is not None:
+            return cache
+        if not self.settings.enabled:
+            return False
+        return temperature == 0 or seed is not None or self.settings.cache_nondeterministic
+
+    @staticmethod
+    def make_key(model_config, messages, temperature, max_tokens, seed) -> str:
+        """Hash everything that determines the response"""
+        payload = {
+            'model': [model_config.id, model_config.model_id, model_config.base_url, model_config.api_type],
+            'messages': messages,
+            'temperature': temperature,
+            'max_tokens': max_tokens,
+            'seed': seed,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Look a response up in memory, then on disk"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return value
+                del self._memory[key]
+
+        try:
+            connection = self._connection()
+            row = connection.execute(
+                'SELECT value, expires_at FROM responses WHERE key = ? AND expires_at > ?',
+                (key, now)
+            ).fetchone()
+            if row is not None:
+                connection.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+        except Exception as e:
+            current_app.logger.warning(f"Response cache read failed: {str(e)}")
+            row = None
+
+        with self._lock:
+            if row is None:
+                self._stats['misses'] += 1
+                return None
+
+            value = json.loads(row[0])
+            self._remember(key, value, row[1])
+            self._stats['disk_hits'] += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a response in both tiers"""
+        now = time.time()
+        expires_at = now + self.settings.ttl_seconds
+
+        with self._lock:
+            self._remember(key, value, expires_at)
+            self._stats['stores'] += 1
+            self._writes += 1
+            evict = self._writes % _EVICTION_INTERVAL == 0
+
+        try:
+            connection = self._connection()
+            connection.execute(
+                'INSERT OR REPLACE INTO responses (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value, ensure_ascii=False), expires_at, now)
+            )
+            if evict:
+                self._evict_disk(connection, now)
+        except Exception as e:
+            current_app.logger.warning(f"Response cache write failed: {str(e)}")
+
+    def clear(self) -> None:
+        """Remove every cached response from both tiers"""
+        with self._lock:
+            self._memory.clear()
+        self._connection().execute('DELETE FROM responses')
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this worker process"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _remember(self, key, value, expires_at):
+        """Put an entry in the memory tier, evicting the least recently used (caller holds the lock)"""
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.settings.memory_max_entries:
+            self._memory.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _evict_disk(self, connection, now):
+        """Drop expired entries and trim the disk tier to its size bound"""
+        connection.execute('DELETE FROM responses WHERE expires_at <= ?', (now,))
+
+        overflow = connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0] - self.settings.disk_max_entries
+        if overflow > 0:
+            connection.execute(
+                'DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)',
+                (overflow,)
+            )
+            with self._lock:
+                self._stats['evictions'] += overflow
+
+    @staticmethod
+    def _connection():
+        return get_connection(CACHE_DB, CACHE_SCHEMA)
+
+response_cache = ResponseCache(config.response_cache)
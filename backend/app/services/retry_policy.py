@@ -0,0 +1,241 @@
+"""
+Retry Policy Module
+
+This module decides whether and when a failed LLM call is retried, for the
+sync provider calls in llm_service and the async LLM class alike.
+
+Only errors that another attempt can fix are retried: timeouts, connection
+errors, 429 and 5xx responses. Authentication failures, bad requests, empty
+responses and token limit errors fail at once. A provider's Retry-After header
+sets the wait before the next attempt; otherwise the wait backs off
+exponentially with jitter. Every retry must fit in the request deadline.
+
+Retries also draw on a per-process budget: within budget_window seconds there
+may be at most budget_ratio retries per call plus budget_min_retries. During an
+outage most calls fail, so without a budget every caller would retry and
+multiply the load on a provider that is already struggling.
+"""
+
+import asyncio
+import email.utils
+import functools
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import anthropic
+import openai
+
+from ..config.config import config
+from .circuit_breaker import CircuitOpenError
+from .rate_limiter import RateLimitTimeout
+from .request_coalescer import CoalescedRequestError
+from .request_deadline import DeadlineExceeded, current_deadline
+
+def is_retryable(error: BaseException) -> bool:
+    """Check whether a provider error, or any error it wraps, is transient and worth retrying"""
+    transient_types = (
+        openai.APITimeoutError, openai.APIConnectionError,
+        anthropic.APITimeoutError, anthropic.APIConnectionError,
+        RateLimitTimeout, CircuitOpenError, DeadlineExceeded,
+    )
+    status_types = (openai.APIStatusError, anthropic.APIStatusError)
+
+    while error is not None:
+        if isinstance(error, transient_types):
+            return True
+        if isinstance(error, status_types) and (error.status_code in (408, 409, 429) or error.status_code >= 500):
+            return True
+        # 其他进程中领导者的错误只以消息传递，按其记录的可重试标记判断
+        if isinstance(error, CoalescedRequestError) and error.retryable:
+            return True
+        error = error.__cause__ or error.__context__
+
+    return False
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Get the wait in seconds a provider asked for in its Retry-After headers, if any"""
+    while error is not None:
+        response = getattr(error, 'response', None)
+        headers = getattr(response, 'headers', None)
+        if headers is not None:
+            # OpenAI的非标准头，单位为毫秒
+            value = headers.get('retry-after-ms')
+            if value:
+                try:
+                    return max(float(value) / 1000, 0.0)
+                except ValueError:
+                    pass
+
+            value = headers.get('retry-after')
+            if value:
+                try:
+                    return max(float(value), 0.0)
+                except ValueError:
+                    pass
+                # 也可能是HTTP日期
+                try:
+                    return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+                except (TypeError, ValueError):
+                    pass
+        error = error.__cause__ or error.__context__
+
+    return None
+
+class RetryPolicy:
+    """Retries transient LLM call failures within the deadline and a per-process retry budget"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._lock = threading.Lock()
+        # 统计窗口内的调用与重试时间
+        self._calls: deque = deque()
+        self._retries: deque = deque()
+        self._stats = {
+            'calls': 0,
+            'retries': 0,
+            'succeeded_after_retry': 0,
+            'retry_after_honored': 0,
+            'not_retryable': 0,
+            'attempts_exhausted': 0,
+            'deadline_exhausted': 0,
+            'retry_after_too_long': 0,
+            'budget_exhausted': 0,
+        }
+
+    def call(self, func: Callable[[], Any], deadline=None) -> Any:
+        """
+        Make a call, retrying transient errors.
+
+        Args:
+            func: The call to make
+            deadline: Optional deadline every retry must fit in
+
+        Returns:
+            The result of the first successful attempt
+
+        Raises:
+            Exception: The last error once the call is not retried any more
+        """
+        self._start()
+        attempt = 0
+        while True:
+            try:
+                result = func()
+            except Exception as e:
+                delay = self.next_delay(attempt, e, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+
+            self._finish(attempt)
+            return result
+
+    async def call_async(self, func: Callable[[], Awaitable[Any]], deadline=None) -> Any:
+        """Like call(), for a coroutine function; waits without blocking the event loop"""
+        self._start()
+        attempt = 0
+        while True:
+            try:
+                result = await func()
+            except Exception as e:
+                delay = self.next_delay(attempt, e, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+
+            self._finish(attempt)
+            return result
+
+    def retrying(self, func):
+        """Decorate a coroutine function so its calls are retried within the request deadline"""
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await self.call_async(lambda: func(*args, **kwargs), current_deadline())
+        return wrapper
+
+    def next_delay(self, attempt: int, error: BaseException, deadline=None) -> Optional[float]:
+        """
+        Decide whether to retry after a failed attempt.
+
+        Args:
+            attempt: Number of retries already made
+            error: The error of the failed attempt
+            deadline: Optional deadline the retry must fit in
+
+        Returns:
+            Seconds to wait before the next attempt, or None to give up
+        """
+        settings = self.settings
+        if not is_retryable(error):
+            return self._give_up('not_retryable')
+        if attempt >= settings.max_retries:
+            return self._give_up('attempts_exhausted')
+
+        delay = retry_after(error)
+        honored = delay is not None
+        if honored:
+            if delay > settings.max_retry_after:
+                return self._give_up('retry_after_too_long')
+        else:
+            # 指数退避加随机抖动
+            delay = min(settings.base_delay * 2 ** attempt, settings.max_delay) * random.uniform(0.5, 1.0)
+
+        if deadline is not None and deadline.remaining() <= delay:
+            return self._give_up('deadline_exhausted')
+
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            allowed = len(self._calls) * settings.budget_ratio + settings.budget_min_retries
+            if len(self._retries) >= allowed:
+                self._stats['budget_exhausted'] += 1
+                return None
+
+            self._retries.append(now)
+            self._stats['retries'] += 1
+            if honored:
+                self._stats['retry_after_honored'] += 1
+        return delay
+
+    def stats(self) -> Dict[str, Any]:
+        """Get retry counters for this worker process"""
+        with self._lock:
+            self._expire(time.monotonic())
+            allowed = len(self._calls) * self.settings.budget_ratio + self.settings.budget_min_retries
+            return {
+                **self._stats,
+                'budget_remaining': max(int(allowed) - len(self._retries), 0),
+            }
+
+    def _start(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            self._calls.append(now)
+            self._stats['calls'] += 1
+
+    def _finish(self, attempt: int) -> None:
+        if attempt:
+            with self._lock:
+                self._stats['succeeded_after_retry'] += 1
+
+    def _give_up(self, reason: str) -> None:
+        with self._lock:
+            self._stats[reason] += 1
+        return None
+
+    def _expire(self, now: float) -> None:
+        """Drop calls and retries older than the budget window (caller holds the lock)"""
+        cutoff = now - self.settings.budget_window
+        for times in (self._calls, self._retries):
+            while times and times[0] < cutoff:
+                times.popleft()
+
+retry_policy = RetryPolicy(config.retry)
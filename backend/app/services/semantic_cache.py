@@ -0,0 +1,319 @@
+"""
+Semantic Cache Module
+
+This module returns an earlier generated prompt when a new description nearly
+repeats an earlier one with the same compiled prefix (system prompt, language
+and template content). Descriptions are compared by the cosine similarity of
+hashed character n-gram vectors; each worker keeps the vectors in NumPy
+matrices and answers a lookup with one matrix-vector product.
+"""
+
+import hashlib
+import math
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Any, Dict, Optional
+
+import numpy as np
+from flask import current_app
+
+from ..config.config import config
+from .prompt_assembly import prompt_assembler
+from .workspace_db import get_connection
+
+CACHE_DB = 'semantic_cache.db'
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    partition TEXT NOT NULL,
+    description TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    generated_prompt TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_hit REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_last_hit ON entries (last_hit);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# 每写入多少次检查一次条目数上限
+_EVICTION_INTERVAL = 100
+
+class _Partition:
+    """The vectors of one prefix, in a matrix grown by doubling"""
+
+    def __init__(self, dimensions: int):
+        self.size = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, dimensions), dtype=np.float32)
+
+    def extend(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        size = self.size + len(ids)
+        if size > len(self.ids):
+            capacity = max(size, 2 * len(self.ids), 64)
+            grown_ids = np.empty(capacity, dtype=np.int64)
+            grown_vectors = np.empty((capacity, self.vectors.shape[1]), dtype=np.float32)
+            grown_ids[:self.size] = self.ids[:self.size]
+            grown_vectors[:self.size] = self.vectors[:self.size]
+            self.ids, self.vectors = grown_ids, grown_vectors
+
+        self.ids[self.size:size] = ids
+        self.vectors[self.size:size] = vectors
+        self.size = size
+
+class SemanticCache:
+    """Near-duplicate cache of generated prompts, keyed by description similarity"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._lock = threading.Lock()
+        # 分区键 -> 该前缀下条目的向量
+        self._partitions: Dict[str, _Partition] = {}
+        self._last_id = 0
+        self._generation: Optional[int] = None
+        self._checked_at = 0.0
+        self._writes = 0
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'reloads': 0,
+        }
+
+    def embed(self, text: str) -> Optional[np.ndarray]:
+        """Embed a text as a normalized hashed character n-gram vector (None if it has no n-grams)"""
+        settings = self.settings
+        text = ' '.join(text.lower().split())
+        grams = Counter(
+            text[start:start + n]
+            for n in range(settings.ngram_min, settings.ngram_max + 1)
+            for start in range(len(text) - n + 1)
+        )
+        if not grams:
+            return None
+
+        hashes = np.fromiter((zlib.crc32(gram.encode('utf-8')) for gram in grams), dtype=np.uint32, count=len(grams))
+        # 高位决定符号，抵消哈希冲突带来的偏差
+        signs = np.where(hashes & 0x80000000, 1.0, -1.0)
+        weights = np.fromiter((1.0 + math.log(count) for count in grams.values()), dtype=np.float64, count=len(grams))
+
+        vector = np.zeros(settings.dimensions, dtype=np.float64)
+        np.add.at(vector, hashes % settings.dimensions, signs * weights)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        return (vector / norm).astype(np.float32)
+
+    def lookup(self, description: str, template_id: Optional[int] = None,
+               language: str = 'chinese') -> Optional[Dict[str, Any]]:
+        """
+        Find the generation of a near-duplicate earlier description (needs app context).
+
+        Returns:
+            Dict with 'generated_prompt', 'similarity' and 'cached_description', or None
+
+        Raises:
+            ValueError: If the specified template is not found
+        """
+        if not self.settings.enabled:
+            return None
+
+        partition_key = self._partition_key(template_id, language)
+        vector = self.embed(description)
+        if vector is None:
+            return None
+
+        try:
+            self._refresh()
+        except Exception as e:
+            current_app.logger.warning(f"Semantic cache refresh failed: {str(e)}")
+
+        with self._lock:
+            partition = self._partitions.get(partition_key)
+            # 取视图后在锁外计算，并发追加只写入视图之外的位置
+            ids = partition.ids[:partition.size] if partition else None
+            vectors = partition.vectors[:partition.size] if partition else None
+
+        match = None
+        if ids is not None and len(ids):
+            similarities = vectors @ vector
+            # 相似度相同时取最新的条目（重新生成的结果排在后面）
+            best = len(similarities) - 1 - int(np.argmax(similarities[::-1]))
+            if similarities[best] >= self.settings.threshold:
+                match = int(ids[best]), float(similarities[best])
+
+        row = None
+        if match:
+            try:
+                connection = self._connection()
+                row = connection.execute(
+                    'SELECT description, generated_prompt FROM entries WHERE id = ?', (match[0],)
+                ).fetchone()
+                if row is not None:
+                    connection.execute('UPDATE entries SET last_hit = ? WHERE id = ?', (time.time(), match[0]))
+            except Exception as e:
+                current_app.logger.warning(f"Semantic cache read failed: {str(e)}")
+
+        with self._lock:
+            if row is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+
+        return {
+            'generated_prompt': row[1],
+            'similarity': round(match[1], 4),
+            'cached_description': row[0]
+        }
+
+    def store(self, description: str, generated_prompt: str, template_id: Optional[int] = None,
+              language: str = 'chinese') -> None:
+        """Cache a generated prompt for its description (needs app context)"""
+        if not self.settings.enabled:
+            return
+
+        vector = self.embed(description)
+        if vector is None:
+            return
+
+        now = time.time()
+        try:
+            connection = self._connection()
+            connection.execute(
+                'INSERT INTO entries (partition, description, vector, generated_prompt, created_at, last_hit) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (self._partition_key(template_id, language), description, vector.tobytes(), generated_prompt, now, now)
+            )
+
+            with self._lock:
+                self._stats['stores'] += 1
+                self._writes += 1
+                evict = self._writes % _EVICTION_INTERVAL == 0
+                # 下次查询时加载新条目
+                self._checked_at = 0.0
+
+            if evict:
+                self._evict(connection)
+        except Exception as e:
+            current_app.logger.warning(f"Semantic cache write failed: {str(e)}")
+
+    def clear(self) -> None:
+        """Remove every cached generation"""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DELETE FROM entries')
+            self._bump_generation(connection)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+        with self._lock:
+            self._checked_at = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Get semantic cache counters for this worker process"""
+        with self._lock:
+            stats = {
+                'enabled': self.settings.enabled,
+                **self._stats,
+                'entries': sum(partition.size for partition in self._partitions.values()),
+                'partitions': len(self._partitions)
+            }
+
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _partition_key(self, template_id: Optional[int], language: str) -> str:
+        """Hash the compiled prefix together with the embedding settings"""
+        settings = self.settings
+        prefix = prompt_assembler.prefix(language, template_id)
+        key = '\0'.join([*prefix.system, f"{settings.dimensions}:{settings.ngram_min}:{settings.ngram_max}"])
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _refresh(self) -> None:
+        """Load entries added by any worker since the last check, or all of them after a deletion"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < self.settings.check_interval:
+                return
+
+            # 持锁加载，避免多个线程重复读取同一批条目
+            connection = self._connection()
+            row = connection.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+            generation = row[0] if row else 0
+            if generation != self._generation:
+                self._partitions = {}
+                self._last_id = 0
+                self._generation = generation
+                self._stats['reloads'] += 1
+
+            rows = connection.execute(
+                'SELECT id, partition, vector FROM entries WHERE id > ? ORDER BY id', (self._last_id,)
+            ).fetchall()
+            self._checked_at = now
+            if not rows:
+                return
+
+            self._last_id = rows[-1][0]
+            width = self.settings.dimensions * 4
+            grouped: Dict[str, list] = {}
+            for entry_id, partition_key, blob in rows:
+                # 维度配置变化前写入的向量属于其他分区，不再加载
+                if len(blob) == width:
+                    grouped.setdefault(partition_key, []).append((entry_id, blob))
+
+            for partition_key, entries in grouped.items():
+                partition = self._partitions.get(partition_key)
+                if partition is None:
+                    partition = self._partitions[partition_key] = _Partition(self.settings.dimensions)
+                vectors = np.frombuffer(b''.join(blob for _, blob in entries), dtype=np.float32)
+                partition.extend(
+                    np.fromiter((entry_id for entry_id, _ in entries), dtype=np.int64, count=len(entries)),
+                    vectors.reshape(len(entries), self.settings.dimensions)
+                )
+
+    def _evict(self, connection) -> None:
+        """Trim the entries to 90% of max_entries once they exceed it, dropping those hit least recently"""
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            count = connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+            # 一次多删一些，删除会让各worker重新加载全部向量
+            overflow = count - int(self.settings.max_entries * 0.9) if count > self.settings.max_entries else 0
+            if overflow > 0:
+                connection.execute(
+                    'DELETE FROM entries WHERE id IN (SELECT id FROM entries ORDER BY last_hit LIMIT ?)',
+                    (overflow,)
+                )
+                # 删除后各worker需要重新加载
+                self._bump_generation(connection)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+        if overflow > 0:
+            with self._lock:
+                self._stats['evictions'] += overflow
+
+    @staticmethod
+    def _bump_generation(connection) -> None:
+        connection.execute(
+            "INSERT INTO meta (key, value) VALUES ('generation', 1) "
+            "ON CONFLICT (key) DO UPDATE SET value = value + 1"
+        )
+
+    @staticmethod
+    def _connection():
+        return get_connection(CACHE_DB, CACHE_SCHEMA)
+
+semantic_cache = SemanticCache(config.semantic_cache)
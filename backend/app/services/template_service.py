@@ -1,17 +1,139 @@
-from jinja2 import Template, Environment, meta
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Any, Dict, List
+
+from jinja2 import FileSystemBytecodeCache, meta
+from jinja2.sandbox import SandboxedEnvironment
+from ..config.config import config
 from ..models.prompt_template import PromptTemplate
 from ..models import db
 
+# 已编译的模板及其引用的变量
+CompiledTemplate = namedtuple('CompiledTemplate', ['template', 'variables'])
+
+_lock = threading.Lock()
+_environment = None
+# 内容哈希 -> CompiledTemplate，按最近使用排序
+_compiled: "OrderedDict[str, CompiledTemplate]" = OrderedDict()
+_stats = {
+    'hits': 0,
+    'misses': 0,
+}
+
 def render_template(template_content, variables):
     """Render a template with the provided variables"""
-    template = Template(template_content)
-    return template.render(**variables)
+    return compile_template(template_content).template.render(**variables)
 
 def get_template_variables(template_content):
     """Extract variables from a template"""
-    env = Environment()
-    ast = env.parse(template_content)
-    return meta.find_undeclared_variables(ast)
+    return set(compile_template(template_content).variables)
+
+def compile_template(template_content: str) -> CompiledTemplate:
+    """
+    Get a template compiled in the shared sandboxed environment, with its variables.
+
+    Compiled templates are cached by content hash, so editing a template simply
+    compiles the new content; the bytecode cache lets other workers (and the
+    next start) load the compiled code instead of compiling it again.
+    """
+    key = hashlib.sha1(template_content.encode('utf-8')).hexdigest()
+    with _lock:
+        compiled = _compiled.get(key)
+        if compiled is not None:
+            _compiled.move_to_end(key)
+            _stats['hits'] += 1
+            return compiled
+
+    environment = _get_environment()
+    ast = environment.parse(template_content)
+    variables = frozenset(meta.find_undeclared_variables(ast))
+
+    bytecode_cache = environment.bytecode_cache
+    bucket = bytecode_cache.get_bucket(environment, key, None, template_content) if bytecode_cache else None
+    code = bucket.code if bucket else None
+    if code is None:
+        code = environment.compile(ast, key)
+        if bucket:
+            bucket.code = code
+            bytecode_cache.set_bucket(bucket)
+
+    template = environment.template_class.from_code(environment, code, environment.make_globals(None))
+    compiled = CompiledTemplate(template, variables)
+
+    with _lock:
+        _compiled[key] = compiled
+        _stats['misses'] += 1
+        while len(_compiled) > config.templates.cache_size:
+            _compiled.popitem(last=False)
+    return compiled
+
+def render_many(template_content: str, variable_sets: List[Dict[str, Any]], allow_missing: bool = False) -> List[Dict[str, Any]]:
+    """
+    Render one template with many variable sets.
+
+    Args:
+        template_content: The template to render
+        variable_sets: The variable sets to render it with
+        allow_missing: Render variable sets that lack some of the template's variables
+            (they render as empty) instead of reporting them
+
+    Returns:
+        List[Dict[str, Any]]: Per variable set, in order, {'index', 'prompt'} or {'index', 'error'}
+            (with 'missing' listing the absent variables when that is the reason)
+
+    Raises:
+        ValueError: If the template cannot be compiled or there are too many variable sets
+    """
+    if len(variable_sets) > config.templates.max_render_items:
+        raise ValueError(f"At most {config.templates.max_render_items} variable sets can be rendered per request")
+
+    try:
+        compiled = compile_template(template_content)
+    except Exception as e:
+        raise ValueError(f"Invalid template: {str(e)}") from e
+
+    results = []
+    for index, variables in enumerate(variable_sets):
+        if not isinstance(variables, dict):
+            results.append({'index': index, 'error': 'Variables must be an object'})
+            continue
+
+        missing = compiled.variables.difference(variables)
+        if missing and not allow_missing:
+            results.append({
+                'index': index,
+                'error': f"Missing variables: {', '.join(sorted(missing))}",
+                'missing': sorted(missing)
+            })
+            continue
+
+        try:
+            results.append({'index': index, 'prompt': compiled.template.render(**variables)})
+        except Exception as e:
+            results.append({'index': index, 'error': str(e)})
+
+    return results
+
+def template_cache_stats() -> Dict[str, Any]:
+    """Get compiled template cache counters for this worker process"""
+    with _lock:
+        return {**_stats, 'size': len(_compiled)}
+
+def _get_environment() -> SandboxedEnvironment:
+    """Create the shared sandboxed environment on first use"""
+    global _environment
+    if _environment is None:
+        with _lock:
+            if _environment is None:
+                bytecode_cache = None
+                if config.templates.bytecode_cache:
+                    directory = config.workspace_root / 'jinja_bytecode'
+                    directory.mkdir(parents=True, exist_ok=True)
+                    bytecode_cache = FileSystemBytecodeCache(str(directory))
+                # 模板由用户编写，沙箱禁止访问不安全的属性与方法
+                _environment = SandboxedEnvironment(bytecode_cache=bytecode_cache)
+    return _environment
 
 def get_default_templates():
     """Get the list of default templates for prompt generation"""
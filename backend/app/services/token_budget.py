@@ -0,0 +1,73 @@
+"""
+Token Budget Module
+
+This module counts a request's input tokens before it is sent and fits it to
+the model's context window (ModelConfig.context_window).
+
+A prompt that leaves less than [token_budget] min_output_tokens of the window
+for the response can never succeed, so it is rejected locally instead of after
+a round-trip to the provider. Otherwise max_tokens is clamped to what is left
+of the window, so the provider does not reject a request that would fit with a
+shorter response. A request without max_tokens gets [token_budget]
+default_max_tokens, also clamped, rather than the provider's default.
+"""
+
+from collections import namedtuple
+from typing import Optional, Sequence
+
+from ..config.config import config
+from ..exceptions import ContextWindowExceeded
+from .tokenizer_registry import encoding_for_model
+
+TokenBudget = namedtuple('TokenBudget', ['input_tokens', 'max_tokens', 'context_window'])
+
+def count_input_tokens(model_config, prompt: str, system: Optional[Sequence[str]] = None) -> int:
+    """Count the tokens of a request's messages with the model's tokenizer"""
+    from ..llm import TokenCounter
+
+    # 与实际发送的消息结构一致：静态指令合并为一条系统消息
+    messages = [{"role": "system", "content": "\n\n".join(system)}] if system else []
+    messages.append({"role": "user", "content": prompt})
+    return TokenCounter(encoding_for_model(model_config.model_id)).count_message_tokens(messages)
+
+def plan(model_config, prompt: str, max_tokens: Optional[int] = None, system: Optional[Sequence[str]] = None,
+         input_tokens: Optional[int] = None, prefix=None) -> TokenBudget:
+    """
+    Count the request's input tokens and fit max_tokens to the model's context window.
+
+    Args:
+        model_config: Model the request will be sent to
+        prompt: The prompt text
+        max_tokens: Requested maximum tokens to generate (None = default_max_tokens for models
+            with a context window, otherwise the provider default)
+        system: Optional static instructions sent before the prompt
+        input_tokens: Input tokens already counted for this request, to skip counting again
+        prefix: The prompt_assembly.CompiledPrefix the system segments come from, whose
+            cached token count is reused so only the prompt is tokenized
+
+    Returns:
+        TokenBudget: The input token count, the clamped max_tokens and the context window (None if unknown)
+
+    Raises:
+        ContextWindowExceeded: If the prompt leaves too little of the window for a response
+    """
+    if input_tokens is None and prefix is not None:
+        input_tokens = prefix.input_tokens(encoding_for_model(model_config.model_id), prompt)
+    elif input_tokens is None:
+        input_tokens = count_input_tokens(model_config, prompt, system)
+
+    context_window = getattr(model_config, 'context_window', None)
+    if not config.token_budget.enabled or not context_window:
+        return TokenBudget(input_tokens, max_tokens, context_window)
+
+    remaining = context_window - input_tokens
+    if remaining < config.token_budget.min_output_tokens:
+        raise ContextWindowExceeded(
+            f"Prompt is {input_tokens} tokens, which leaves {max(remaining, 0)} of the {context_window}-token "
+            f"context window of model {model_config.name} for the response"
+        )
+
+    if not max_tokens:
+        max_tokens = config.token_budget.default_max_tokens
+    max_tokens = min(max_tokens, remaining)
+    return TokenBudget(input_tokens, max_tokens, context_window)
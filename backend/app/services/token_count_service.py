@@ -0,0 +1,185 @@
+"""
+Token Count Service Module
+
+This module counts tokens for many texts or message lists in one call, for the
+live token counts shown next to prompts, templates and prompt versions.
+
+Texts that have not been counted before are encoded together with the
+tokenizer's batch encoding across a thread pool (tiktoken releases the GIL
+while encoding). Counts are memoized per encoding by content hash, so
+recounting an unchanged catalog only hashes its texts.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from ..config.config import config
+from ..llm import TokenCounter
+from ..models.prompt import Prompt
+from ..models.prompt_template import PromptTemplate
+from ..models.prompt_version import PromptVersion
+from .tokenizer_registry import encoding_for_model
+
+class _PrecountedTokenCounter(TokenCounter):
+    """TokenCounter that looks text counts up instead of encoding them"""
+
+    def __init__(self, counts: Dict[str, int]):
+        super().__init__(None)
+        self.counts = counts
+
+    def count_text(self, text: str) -> int:
+        return self.counts[text] if text else 0
+
+class TokenCountCache:
+    """Memoized, batched token counting keyed by encoding and content hash"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._lock = threading.Lock()
+        # (编码名称, 内容哈希) -> token数，按最近使用排序
+        self._counts: "OrderedDict[tuple, int]" = OrderedDict()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+        }
+
+    def count_texts(self, encoding, texts: Sequence[str]) -> List[int]:
+        """Count the tokens of each text, encoding the uncounted ones in one batch"""
+        keys = [(encoding.name, hashlib.sha1(text.encode('utf-8')).digest()) for text in texts]
+
+        counts: Dict[tuple, int] = {}
+        missing: Dict[tuple, str] = {}
+        with self._lock:
+            for key, text in zip(keys, texts):
+                if key in counts or key in missing:
+                    continue
+                count = self._counts.get(key)
+                if count is None:
+                    missing[key] = text
+                else:
+                    self._counts.move_to_end(key)
+                    counts[key] = count
+            self._stats['hits'] += len(counts)
+            self._stats['misses'] += len(missing)
+
+        if missing:
+            # 文本较少时直接编码，避免线程池的开销
+            if len(missing) < self.settings.batch_threshold:
+                encoded = [encoding.encode_ordinary(text) for text in missing.values()]
+            else:
+                encoded = encoding.encode_ordinary_batch(list(missing.values()), num_threads=self.settings.num_threads)
+            counted = {key: len(tokens) for key, tokens in zip(missing, encoded)}
+            counts.update(counted)
+
+            with self._lock:
+                self._counts.update(counted)
+                while len(self._counts) > self.settings.cache_size:
+                    self._counts.popitem(last=False)
+
+        return [counts[key] for key in keys]
+
+    def count_messages(self, encoding, message_lists: Sequence[List[dict]]) -> List[int]:
+        """Count the tokens of each message list, as TokenCounter.count_message_tokens does"""
+        texts = list(dict.fromkeys(
+            text for messages in message_lists for message in messages for text in _message_texts(message) if text
+        ))
+        counter = _PrecountedTokenCounter(dict(zip(texts, self.count_texts(encoding, texts))))
+        return [counter.count_message_tokens(messages) for messages in message_lists]
+
+    def stats(self) -> Dict[str, Any]:
+        """Get token count cache counters for this worker process"""
+        with self._lock:
+            return {**self._stats, 'size': len(self._counts)}
+
+def count_tokens(
+    model_config,
+    texts: Optional[Sequence[str]] = None,
+    messages: Optional[Sequence[List[dict]]] = None,
+    prompt_id: Optional[int] = None,
+    template_ids: Union[Sequence[int], str, None] = None
+) -> Dict[str, Any]:
+    """
+    Count tokens with a model's tokenizer.
+
+    Args:
+        model_config: Model whose tokenizer to count with
+        texts: Texts to count
+        messages: Message lists to count, including per-message overhead
+        prompt_id: Prompt whose versions to count
+        template_ids: Templates to count, or "all" for every active template
+
+    Returns:
+        Dict[str, Any]: 'model_id' and 'encoding', plus 'texts', 'messages',
+        'prompt_versions' and 'templates' for the inputs that were given
+
+    Raises:
+        ValueError: If too many items are given or the prompt is not found
+    """
+    encoding = encoding_for_model(model_config.model_id)
+    result: Dict[str, Any] = {'model_id': model_config.id, 'encoding': encoding.name}
+
+    items = len(texts or []) + len(messages or [])
+    if items > token_counter.settings.max_items:
+        raise ValueError(f"At most {token_counter.settings.max_items} texts and message lists can be counted per request")
+
+    if texts is not None:
+        if not all(isinstance(text, str) for text in texts):
+            raise ValueError("texts must be a list of strings")
+        result['texts'] = token_counter.count_texts(encoding, texts)
+
+    if messages is not None:
+        if not all(
+            isinstance(message_list, list) and all(isinstance(message, dict) for message in message_list)
+            for message_list in messages
+        ):
+            raise ValueError("messages must be a list of message lists, each message an object")
+        result['messages'] = token_counter.count_messages(encoding, messages)
+
+    if prompt_id is not None:
+        if not Prompt.query.get(prompt_id):
+            raise ValueError(f"Prompt with ID {prompt_id} not found")
+        versions = PromptVersion.query.filter_by(prompt_id=prompt_id).order_by(PromptVersion.version.desc()).all()
+        counts = token_counter.count_texts(encoding, [version.content for version in versions])
+        result['prompt_versions'] = [
+            {'id': version.id, 'version': version.version, 'tokens': count}
+            for version, count in zip(versions, counts)
+        ]
+
+    if template_ids is not None:
+        if template_ids != 'all' and not isinstance(template_ids, list):
+            raise ValueError('template_ids must be a list of template IDs or "all"')
+        query = PromptTemplate.query.filter_by(status='active')
+        if template_ids != 'all':
+            query = query.filter(PromptTemplate.id.in_([int(template_id) for template_id in template_ids]))
+        templates = query.order_by(PromptTemplate.id).all()
+        counts = token_counter.count_texts(encoding, [template.content for template in templates])
+        result['templates'] = [
+            {'id': template.id, 'name': template.name, 'tokens': count}
+            for template, count in zip(templates, counts)
+        ]
+
+    return result
+
+def _message_texts(message: dict) -> List[str]:
+    """All strings TokenCounter.count_message_tokens counts for a message"""
+    texts = [message.get("role", ""), message.get("name", ""), message.get("tool_call_id", "")]
+
+    content = message.get("content")
+    if isinstance(content, str):
+        texts.append(content)
+    elif isinstance(content, list):
+        for item in content:
+            if isinstance(item, str):
+                texts.append(item)
+            elif isinstance(item, dict) and "text" in item:
+                texts.append(item["text"])
+
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function") or {}
+        texts.extend([function.get("name", ""), function.get("arguments", "")])
+
+    return [text for text in texts if isinstance(text, str)]
+
+token_counter = TokenCountCache(config.token_count)
@@ -0,0 +1,169 @@
+"""
+Tokenizer Registry Module
+
+This module loads each tiktoken encoding once per process and shares it with
+every LLM instance, TokenCounter and the rate limiter.
+
+tiktoken downloads its BPE files on first use, which stalls the first request
+and fails in air-gapped deployments. Encodings are therefore only read from a
+local cache directory ([tokenizer] cache_dir, bundled into the image by
+scripts/download_tiktoken.py), never downloaded at runtime, and preloaded
+when each process creates the app.
+
+Models are mapped to encodings by the [tokenizer.model_encodings] patterns
+first (for non-OpenAI models such as DeepSeek via OpenRouter), then by
+tiktoken's own model table, then the default encoding. If an encoding cannot
+be loaded at all, token counts fall back to an estimate of 4 bytes per token.
+"""
+
+import fnmatch
+import hashlib
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import tiktoken
+from tiktoken.model import encoding_name_for_model
+
+from ..config.config import config
+from ..logger import logger
+
+_lock = threading.Lock()
+
+# 编码名称 -> 编码实例（加载失败时为估算编码）
+_encodings: Dict[str, object] = {}
+
+_BLOB_URL = 'https://openaipublic.blob.core.windows.net/'
+
+# 编码名称 -> tiktoken读取的BPE文件及其sha256（与tiktoken_ext.openai_public一致）
+_BPE_FILES = {
+    'gpt2': (
+        ('gpt-2/encodings/main/vocab.bpe', '1ce1664773c50f3e0cc8842619a93edc4624525b728b188a9e0be33b7726adc5'),
+        ('gpt-2/encodings/main/encoder.json', '196139668be63f3b5d6574427317ae82f612a97c5d1cdaf36ed2256dbf636783'),
+    ),
+    'r50k_base': (('encodings/r50k_base.tiktoken', '306cd27f03c1a714eca7108e03d66b7dc042abe8c258b44c199a7ed9838dd930'),),
+    'p50k_base': (('encodings/p50k_base.tiktoken', '94b5ca7dff4d00767bc256fdd1b27e5b17361d7b8a5f968547f9f23eb70d2069'),),
+    'p50k_edit': (('encodings/p50k_base.tiktoken', '94b5ca7dff4d00767bc256fdd1b27e5b17361d7b8a5f968547f9f23eb70d2069'),),
+    'cl100k_base': (('encodings/cl100k_base.tiktoken', '223921b76ee99bde995b7ff738513eef100fb51d18c93597a113bcffe865b2a7'),),
+    'o200k_base': (('encodings/o200k_base.tiktoken', '446a9538cb6c348e3516120d7c08b09f57c36495e2acfffe59a5bf8b0cfb1a2d'),),
+    'o200k_harmony': (('encodings/o200k_base.tiktoken', '446a9538cb6c348e3516120d7c08b09f57c36495e2acfffe59a5bf8b0cfb1a2d'),),
+}
+
+class ApproximateEncoding:
+    """Stand-in for an encoding that could not be loaded; estimates 4 bytes per token"""
+
+    BYTES_PER_TOKEN = 4
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def encode(self, text: str, **kwargs) -> List[int]:
+        return [0] * math.ceil(len(text.encode('utf-8')) / self.BYTES_PER_TOKEN)
+
+    def encode_ordinary(self, text: str) -> List[int]:
+        return self.encode(text)
+
+    def encode_ordinary_batch(self, texts: List[str], num_threads: int = 8) -> List[List[int]]:
+        return [self.encode(text) for text in texts]
+
+def cache_dir() -> Path:
+    """Get the directory tiktoken reads its BPE files from"""
+    if os.environ.get('TIKTOKEN_CACHE_DIR'):
+        return Path(os.environ['TIKTOKEN_CACHE_DIR'])
+    if config.tokenizer.cache_dir:
+        return Path(config.tokenizer.cache_dir)
+    return config.root_path.parent / 'tiktoken_cache'
+
+def get_encoding(name: str):
+    """Get an encoding by name, loading it from the local cache on first use"""
+    encoding = _encodings.get(name)
+    if encoding is not None:
+        return encoding
+
+    with _lock:
+        encoding = _encodings.get(name)
+        if encoding is None:
+            encoding = _encodings[name] = _load(name)
+        return encoding
+
+def encoding_name(model: str) -> str:
+    """Get the encoding name for a model"""
+    settings = config.tokenizer
+    for pattern, name in settings.model_encodings.items():
+        if fnmatch.fnmatchcase(model or '', pattern):
+            return name
+
+    try:
+        return encoding_name_for_model(model)
+    except KeyError:
+        return settings.default_encoding
+
+def encoding_for_model(model: str):
+    """Get the shared encoding for a model"""
+    return get_encoding(encoding_name(model))
+
+def preload(models: Iterable[str] = ()) -> None:
+    """Load the configured encodings and those of the given models"""
+    names = list(config.tokenizer.preload)
+    names.extend(encoding_name(model) for model in models if model)
+    for name in dict.fromkeys(names):
+        get_encoding(name)
+
+def stats() -> Dict[str, object]:
+    """Get the loaded encodings for this worker process"""
+    with _lock:
+        return {
+            'cache_dir': str(cache_dir()),
+            'encodings': {
+                name: 'approximate' if isinstance(encoding, ApproximateEncoding) else 'loaded'
+                for name, encoding in _encodings.items()
+            }
+        }
+
+def _load(name: str):
+    directory = cache_dir()
+    # tiktoken从该环境变量指定的目录读取已下载的文件
+    if not os.environ.get('TIKTOKEN_CACHE_DIR'):
+        os.environ['TIKTOKEN_CACHE_DIR'] = str(directory)
+
+    # 文件缺失或内容不符时tiktoken会联网下载（没有超时），先确认文件都在本地
+    missing = _missing_files(name, directory)
+    if missing:
+        logger.error(
+            f"tiktoken encoding {name} is not in the cache dir {directory} (missing {', '.join(missing)}). "
+            f"Falling back to estimated token counts; run scripts/download_tiktoken.py to bundle it"
+        )
+        return ApproximateEncoding(name)
+
+    try:
+        encoding = tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.error(
+            f"Failed to load tiktoken encoding {name} (cache dir {directory}): {e}. "
+            f"Falling back to estimated token counts"
+        )
+        return ApproximateEncoding(name)
+
+    logger.info(f"Loaded tiktoken encoding {name}")
+    return encoding
+
+def _missing_files(name: str, directory: Path) -> List[str]:
+    """The BPE files of an encoding that are not cached with the expected content"""
+    files = _BPE_FILES.get(name)
+    if files is None:
+        return [f"the files of unknown encoding {name}"]
+
+    missing = []
+    for path, expected_hash in files:
+        url = _BLOB_URL + path
+        # tiktoken按URL的sha1命名缓存文件
+        cached = directory / hashlib.sha1(url.encode()).hexdigest()
+        try:
+            if hashlib.sha256(cached.read_bytes()).hexdigest() == expected_hash:
+                continue
+        except OSError:
+            pass
+        missing.append(url)
+    return missing
@@ -0,0 +1,267 @@
+"""
+Usage Service Module
+
+This module records every LLM call in the llm_usage table and aggregates the
+records by model, prompt, route and time bucket, to find which prompts and
+models drive cost and latency.
+
+Recording stays off the request path: a call only appends a row to an
+in-memory queue, and a writer thread in each process inserts the queued rows
+in batches. The route and prompt a call belongs to come from the usage scope
+opened around it (see usage_scope), or from the Flask request being handled.
+"""
+
+import atexit
+import os
+import queue
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from flask import has_request_context, request
+from sqlalchemy import case, func
+
+from ..config.config import config
+from ..models import db
+from ..models.llm_usage import LLMUsage
+
+UsageScope = namedtuple('UsageScope', ['route', 'prompt_id'])
+
+_scope: ContextVar[Optional[UsageScope]] = ContextVar('usage_scope', default=None)
+
+GROUP_BY_FIELDS = ('model', 'prompt', 'route', 'status', 'time')
+
+TIME_BUCKETS = ('minute', 'hour', 'day')
+
+@contextmanager
+def usage_scope(route: Optional[str] = None, prompt_id: Optional[int] = None):
+    """Attribute the LLM calls made in the block to a route and prompt (route defaults to the current request's)"""
+    token = _scope.set(UsageScope(route or _request_route(), prompt_id))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+def current_usage_scope() -> UsageScope:
+    """Get the usage scope of the current context, to carry it into worker threads"""
+    return _scope.get() or UsageScope(_request_route(), None)
+
+class UsageRecorder:
+    """Queues usage rows and writes them in batches from a background thread"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._app = None
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue(maxsize=settings.max_queue)
+        self._writer_pid = None
+        self._stats = {
+            'recorded': 0,
+            'written': 0,
+            'dropped': 0,
+            'write_errors': 0,
+        }
+
+    def init_app(self, app) -> None:
+        """Remember the app the writer thread writes through and flush the queue at exit"""
+        self._app = app
+        atexit.register(self.flush)
+
+    def record(self, model_id: Optional[int], latency_ms: float, usage: Optional[Dict[str, int]] = None,
+               ttft_ms: Optional[float] = None, status: str = 'ok') -> None:
+        """Queue the usage row of one provider call"""
+        if not self.settings.enabled or self._app is None:
+            return
+
+        self._ensure_writer()
+        scope = current_usage_scope()
+        usage = usage or {}
+        row = {
+            'model_id': model_id,
+            'route': scope.route,
+            'prompt_id': scope.prompt_id,
+            'prompt_tokens': usage.get('prompt_tokens') or 0,
+            'completion_tokens': usage.get('completion_tokens') or 0,
+            'cached_tokens': usage.get('cached_tokens') or 0,
+            'latency_ms': round(latency_ms, 1),
+            'ttft_ms': round(ttft_ms, 1) if ttft_ms is not None else None,
+            'status': status,
+            'created_time': datetime.utcnow(),
+        }
+
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            # 数据库写入跟不上时丢弃，不阻塞请求
+            with self._lock:
+                self._stats['dropped'] += 1
+            return
+
+        with self._lock:
+            self._stats['recorded'] += 1
+
+    def flush(self) -> None:
+        """Write every queued row now"""
+        while self._write_batch(self._drain(timeout=None)):
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Get usage recording counters for this worker process"""
+        with self._lock:
+            return {'enabled': self.settings.enabled, **self._stats, 'queued': self._queue.qsize()}
+
+    def _ensure_writer(self) -> None:
+        """Start this process's writer thread once (also after fork)"""
+        if self._writer_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._writer_pid == os.getpid():
+                return
+            if self._writer_pid is not None:
+                # fork后父进程队列中的行由父进程写入
+                self._queue = queue.Queue(maxsize=self.settings.max_queue)
+            self._writer_pid = os.getpid()
+            threading.Thread(target=self._writer_loop, name='usage-writer', daemon=True).start()
+
+    def _writer_loop(self) -> None:
+        while True:
+            rows = self._drain(timeout=self.settings.flush_interval)
+            if rows:
+                self._write_batch(rows)
+
+    def _drain(self, timeout: Optional[float]) -> List[Dict[str, Any]]:
+        """Take up to batch_size queued rows, waiting up to timeout for the first (None = don't wait)"""
+        rows = []
+        try:
+            rows.append(self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait())
+            while len(rows) < self.settings.batch_size:
+                rows.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return rows
+
+    def _write_batch(self, rows: List[Dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+
+        try:
+            with self._app.app_context():
+                db.session.execute(LLMUsage.__table__.insert(), rows)
+                db.session.commit()
+        except Exception as e:
+            self._app.logger.error(f"Failed to write {len(rows)} usage rows: {str(e)}")
+            with self._lock:
+                self._stats['write_errors'] += 1
+            return 0
+
+        with self._lock:
+            self._stats['written'] += len(rows)
+        return len(rows)
+
+def aggregate_usage(
+    group_by: List[str],
+    bucket: str = 'hour',
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    model_id: Optional[int] = None,
+    prompt_id: Optional[int] = None,
+    route: Optional[str] = None,
+    order_by: str = 'total_tokens',
+    limit: int = 100
+) -> List[Dict[str, Any]]:
+    """
+    Aggregate recorded usage.
+
+    Args:
+        group_by: Any of 'model', 'prompt', 'route', 'status' and 'time'
+        bucket: Time bucket when grouping by time: 'minute', 'hour' or 'day'
+        since, until: Optional time range (UTC)
+        model_id, prompt_id, route: Optional filters
+        order_by: Sort key, descending: 'total_tokens', 'requests', 'avg_latency_ms' or 'time'
+        limit: Maximum number of groups to return
+
+    Returns:
+        List of groups with request and error counts, token totals and latency figures
+
+    Raises:
+        ValueError: If a grouping, bucket or sort key is not supported
+    """
+    unknown = [field for field in group_by if field not in GROUP_BY_FIELDS]
+    if unknown:
+        raise ValueError(f"Unsupported group_by: {', '.join(unknown)} (supported: {', '.join(GROUP_BY_FIELDS)})")
+    if bucket not in TIME_BUCKETS:
+        raise ValueError(f"Unsupported bucket: {bucket} (supported: {', '.join(TIME_BUCKETS)})")
+
+    columns = {
+        'model': LLMUsage.model_id.label('model_id'),
+        'prompt': LLMUsage.prompt_id.label('prompt_id'),
+        'route': LLMUsage.route.label('route'),
+        'status': LLMUsage.status.label('status'),
+        'time': _time_bucket(bucket).label('time'),
+    }
+    keys = [columns[field] for field in group_by]
+
+    total_tokens = func.sum(LLMUsage.prompt_tokens + LLMUsage.completion_tokens)
+    metrics = {
+        'requests': func.count(LLMUsage.id),
+        'errors': func.sum(case((LLMUsage.status != 'ok', 1), else_=0)),
+        'prompt_tokens': func.sum(LLMUsage.prompt_tokens),
+        'completion_tokens': func.sum(LLMUsage.completion_tokens),
+        'cached_tokens': func.sum(LLMUsage.cached_tokens),
+        'total_tokens': total_tokens,
+        'avg_latency_ms': func.avg(LLMUsage.latency_ms),
+        'max_latency_ms': func.max(LLMUsage.latency_ms),
+        'avg_ttft_ms': func.avg(LLMUsage.ttft_ms),
+    }
+    if order_by not in metrics and not (order_by == 'time' and 'time' in group_by):
+        raise ValueError(f"Unsupported order_by: {order_by}")
+
+    query = db.session.query(*keys, *(metric.label(name) for name, metric in metrics.items()))
+    if since:
+        query = query.filter(LLMUsage.created_time >= since)
+    if until:
+        query = query.filter(LLMUsage.created_time < until)
+    if model_id is not None:
+        query = query.filter(LLMUsage.model_id == model_id)
+    if prompt_id is not None:
+        query = query.filter(LLMUsage.prompt_id == prompt_id)
+    if route:
+        query = query.filter(LLMUsage.route == route)
+
+    if keys:
+        query = query.group_by(*keys)
+    sort = columns['time'] if order_by == 'time' else metrics[order_by]
+    rows = query.order_by(sort.desc()).limit(limit).all()
+
+    groups = []
+    for row in rows:
+        group = dict(row._mapping)
+        for name in ('avg_latency_ms', 'max_latency_ms', 'avg_ttft_ms'):
+            if group[name] is not None:
+                group[name] = round(float(group[name]), 1)
+        for name in ('errors', 'prompt_tokens', 'completion_tokens', 'cached_tokens', 'total_tokens'):
+            group[name] = int(group[name] or 0)
+        groups.append(group)
+    return groups
+
+def _time_bucket(bucket: str):
+    """SQL expression formatting created_time as its bucket's label, the same on every database"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        formats = {'minute': 'YYYY-MM-DD"T"HH24:MI', 'hour': 'YYYY-MM-DD"T"HH24":00"', 'day': 'YYYY-MM-DD'}
+        return func.to_char(LLMUsage.created_time, formats[bucket])
+    formats = {'minute': '%Y-%m-%dT%H:%M', 'hour': '%Y-%m-%dT%H:00', 'day': '%Y-%m-%d'}
+    if dialect == 'mysql':
+        return func.date_format(LLMUsage.created_time, formats[bucket].replace('%M', '%i'))
+    return func.strftime(formats[bucket], LLMUsage.created_time)
+
+def _request_route() -> Optional[str]:
+    if has_request_context() and request.url_rule is not None:
+        return request.url_rule.rule
+    return None
+
+usage_recorder = UsageRecorder(config.usage)
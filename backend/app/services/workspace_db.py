@@ -0,0 +1,58 @@
+"""
+Workspace Database Module
+
+Small SQLite files under Config.workspace_root hold state that every worker
+process on the host must share (caches, counters, queues) but that does not
+belong in the main application database.
+"""
+
+import os
+import sqlite3
+import threading
+
+from ..config.config import config
+
+_local = threading.local()
+
+def get_connection(name: str, schema: str = '') -> sqlite3.Connection:
+    """
+    Get this thread's connection to a workspace SQLite file, creating the file on first use.
+
+    `schema` is a script of idempotent statements (CREATE TABLE IF NOT EXISTS ...)
+    run once when the connection is opened.
+
+    Connections are per thread and per process, so they are never shared across
+    a gunicorn fork. They run in autocommit mode; use BEGIN IMMEDIATE for
+    read-modify-write sections that must be atomic across workers.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None or _local.pid != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+
+    connection = connections.get(name)
+    if connection is None:
+        path = config.workspace_root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        connection = sqlite3.connect(str(path), timeout=30, isolation_level=None)
+        # WAL允许多个worker并发读，写入互不阻塞读取
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        if schema:
+            connection.executescript(schema)
+        connections[name] = connection
+
+    return connection
+
+def process_alive(pid: int) -> bool:
+    """Check whether a process with this pid is running on this host"""
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,8 @@
+#!/usr/bin/env python
+import uvicorn
+from app.asgi import create_asgi_app
+
+app = create_asgi_app()
+
+if __name__ == '__main__':
+    uvicorn.run(app, host='0.0.0.0', port=5001)
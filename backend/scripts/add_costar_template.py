@@ -12,7 +12,7 @@ from app.models.prompt_template import PromptTemplate
 
 def add_costar_template():
     """Add the CO-STAR framework template to the database."""
-    app = create_app()
+    app = create_app(start_workers=False)
     
     with app.app_context():
         # Check if template already exists
@@ -19,7 +19,7 @@ TEMPLATE_FILES = [
 
 def add_templates():
     """Add the predefined templates to the database."""
-    app = create_app()
+    app = create_app(start_workers=False)
     
     with app.app_context():
         templates_dir = os.path.join(app.root_path, 'templates')
@@ -0,0 +1,404 @@
+#!/usr/bin/env python
+"""
+End-to-end load test for the API.
+
+Drives /api/execute (plain and streaming), /api/generate-prompt and the
+prompt CRUD routes of a running server at a fixed concurrency, then reports
+p50/p95/p99 latency, time-to-first-token for streams, requests/sec and the
+memory (RSS) of every server worker process.
+
+Run it against scripts/stub_llm_server.py to measure the service itself
+without a paid provider:
+
+    python scripts/stub_llm_server.py --port 8900 &
+    python scripts/benchmark.py --stub-url http://127.0.0.1:8900/v1 --concurrency 32 --duration 30
+
+Save a report with --output and compare a later run against it with
+--baseline; the script exits with status 1 when p95 latency or throughput
+regressed by more than --max-regression.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+import uuid
+
+import httpx
+
+SCENARIOS = ('execute', 'execute-stream', 'generate', 'crud')
+
+class Recorder:
+    """Latency samples and errors per operation"""
+
+    def __init__(self):
+        self.samples = {}
+        self.ttft = {}
+        self.errors = {}
+        self.started = None
+        self.finished = None
+
+    def add(self, name, seconds, ttft=None, error=None):
+        if error:
+            errors = self.errors.setdefault(name, {})
+            errors[error] = errors.get(error, 0) + 1
+            return
+        self.samples.setdefault(name, []).append(seconds * 1000)
+        if ttft is not None:
+            self.ttft.setdefault(name, []).append(ttft * 1000)
+
+    def report(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        names = sorted(set(self.samples) | set(self.errors))
+        result = {}
+        for name in names:
+            samples = sorted(self.samples.get(name, []))
+            errors = sum(self.errors.get(name, {}).values())
+            entry = {
+                'requests': len(samples) + errors,
+                'errors': errors,
+                'error_kinds': self.errors.get(name, {}),
+                'rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+                'p50_ms': _percentile(samples, 0.50),
+                'p95_ms': _percentile(samples, 0.95),
+                'p99_ms': _percentile(samples, 0.99),
+                'max_ms': round(samples[-1], 1) if samples else None,
+            }
+            if name in self.ttft:
+                ttft = sorted(self.ttft[name])
+                entry.update({
+                    'ttft_p50_ms': _percentile(ttft, 0.50),
+                    'ttft_p95_ms': _percentile(ttft, 0.95),
+                    'ttft_p99_ms': _percentile(ttft, 0.99),
+                })
+            result[name] = entry
+        return result
+
+class MemorySampler:
+    """Samples the resident memory of the server's worker processes from /proc"""
+
+    def __init__(self, pids, pattern):
+        self.pids = pids
+        self.pattern = re.compile(pattern) if pattern else None
+        self.peak = {}
+        self.last = {}
+        self.commands = {}
+
+    def find_pids(self):
+        if self.pids:
+            return self.pids
+        if not self.pattern or not os.path.isdir('/proc'):
+            return []
+
+        pids = []
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit() or int(entry) == os.getpid():
+                continue
+            try:
+                with open(f'/proc/{entry}/cmdline', 'rb') as file:
+                    command = file.read().replace(b'\0', b' ').decode('utf-8', 'replace').strip()
+            except OSError:
+                continue
+            if command and self.pattern.search(command) and 'benchmark.py' not in command:
+                pids.append(int(entry))
+                self.commands[int(entry)] = command[:80]
+        return pids
+
+    def sample(self):
+        for pid in self.find_pids():
+            rss = _rss_mb(pid)
+            if rss is None:
+                continue
+            self.last[pid] = rss
+            self.peak[pid] = max(self.peak.get(pid, 0.0), rss)
+
+    async def run(self, stop_event, interval=0.5):
+        while not stop_event.is_set():
+            self.sample()
+            try:
+                await asyncio.wait_for(stop_event.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+        self.sample()
+
+    def report(self):
+        return {
+            str(pid): {'command': self.commands.get(pid, ''), 'rss_mb': self.last[pid], 'peak_rss_mb': self.peak[pid]}
+            for pid in sorted(self.last)
+        }
+
+def _rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+def _percentile(sorted_values, percentile):
+    if not sorted_values:
+        return None
+    index = min(int(percentile * len(sorted_values)), len(sorted_values) - 1)
+    return round(sorted_values[index], 1)
+
+def _unique_text(prefix, options):
+    """Request text; unique per request unless --repeat-prompts, so caches and coalescing stay out of the way"""
+    if options.repeat_prompts:
+        return prefix
+    return f"{prefix} #{uuid.uuid4().hex[:8]}"
+
+async def _timed(recorder, name, coroutine):
+    started = time.monotonic()
+    try:
+        response = await coroutine
+        if response.status_code >= 400:
+            recorder.add(name, 0, error=f'HTTP {response.status_code}')
+            return None
+        recorder.add(name, time.monotonic() - started)
+        return response
+    except httpx.HTTPError as e:
+        recorder.add(name, 0, error=type(e).__name__)
+        return None
+
+async def run_execute(client, recorder, options):
+    await _timed(recorder, 'execute', client.post('/api/execute', json={
+        'prompt': _unique_text('Write a haiku about load testing', options),
+        'model_id': options.model_id,
+        'max_tokens': options.max_tokens,
+        'temperature': 0.7,
+        'cache': False,
+    }))
+
+async def run_execute_stream(client, recorder, options):
+    started = time.monotonic()
+    first_chunk = None
+    try:
+        async with client.stream('POST', '/api/execute', json={
+            'prompt': _unique_text('Write a haiku about streaming', options),
+            'model_id': options.model_id,
+            'max_tokens': options.max_tokens,
+            'temperature': 0.7,
+            'stream': True,
+        }) as response:
+            if response.status_code >= 400:
+                recorder.add('execute-stream', 0, error=f'HTTP {response.status_code}')
+                return
+            failed = False
+            async for line in response.aiter_lines():
+                if first_chunk is None and line.startswith('data:'):
+                    first_chunk = time.monotonic()
+                if line.startswith('event: error'):
+                    failed = True
+            if failed:
+                recorder.add('execute-stream', 0, error='stream error event')
+                return
+        recorder.add('execute-stream', time.monotonic() - started,
+                     ttft=(first_chunk - started) if first_chunk else None)
+    except httpx.HTTPError as e:
+        recorder.add('execute-stream', 0, error=type(e).__name__)
+
+async def run_generate(client, recorder, options):
+    await _timed(recorder, 'generate', client.post('/api/generate-prompt', json={
+        'user_description': _unique_text('A prompt that reviews pull requests for performance problems', options),
+        'language': options.language,
+        'temperature': 0.7,
+    }))
+
+async def run_crud(client, recorder, options):
+    response = await _timed(recorder, 'crud:create', client.post('/api/prompts', json={
+        'name': f'benchmark {uuid.uuid4().hex[:8]}',
+        'content': 'Benchmark prompt content',
+    }))
+    if response is None:
+        return
+    prompt_id = response.json()['id']
+
+    await _timed(recorder, 'crud:get', client.get(f'/api/prompts/{prompt_id}'))
+    await _timed(recorder, 'crud:update', client.put(f'/api/prompts/{prompt_id}', json={
+        'content': 'Benchmark prompt content, updated',
+    }))
+    await _timed(recorder, 'crud:list-templates', client.get('/api/templates'))
+    await _timed(recorder, 'crud:delete', client.delete(f'/api/prompts/{prompt_id}'))
+
+RUNNERS = {
+    'execute': run_execute,
+    'execute-stream': run_execute_stream,
+    'generate': run_generate,
+    'crud': run_crud,
+}
+
+async def run_scenario(client, scenario, options):
+    """Run one scenario at the configured concurrency and return its report"""
+    runner = RUNNERS[scenario]
+
+    # 预热：建立连接、加载模型客户端，不计入统计
+    warmup = Recorder()
+    await asyncio.gather(*(runner(client, warmup, options) for _ in range(options.warmup)))
+
+    recorder = Recorder()
+    recorder.started = time.monotonic()
+    deadline = recorder.started + options.duration if options.duration else None
+    remaining = [options.requests] if not deadline else None
+
+    async def worker():
+        while True:
+            if deadline and time.monotonic() >= deadline:
+                return
+            if remaining is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            await runner(client, recorder, options)
+
+    await asyncio.gather(*(worker() for _ in range(options.concurrency)))
+    recorder.finished = time.monotonic()
+    return recorder.report()
+
+async def setup_stub_model(client, options):
+    """Register the stub server as a model and make it the default; returns state for cleanup"""
+    previous_default = None
+    response = await client.get('/api/models/default')
+    if response.status_code == 200:
+        previous_default = response.json()['id']
+
+    response = await client.post('/api/models', json={
+        'name': f'benchmark-stub-{uuid.uuid4().hex[:6]}',
+        'model_id': 'stub-model',
+        'base_url': options.stub_url,
+        'api_key': 'benchmark-key',
+        'api_type': options.stub_api_type,
+        'is_default': True,
+    })
+    response.raise_for_status()
+    options.model_id = response.json()['id']
+    return previous_default
+
+async def cleanup_stub_model(client, options, previous_default):
+    """Restore the previous default model and delete the stub model"""
+    if previous_default:
+        await client.post(f'/api/models/{previous_default}/default')
+    else:
+        # 默认模型不能删除，先取消存根模型的默认标记
+        await client.delete(f'/api/models/{options.model_id}/default')
+    response = await client.delete(f'/api/models/{options.model_id}')
+    if response.status_code != 200:
+        print(f"Failed to delete stub model {options.model_id}: {response.text}", file=sys.stderr)
+
+def compare_to_baseline(report, baseline, max_regression):
+    """Print regressions against a previous report; returns True if any exceeded the limit"""
+    regressed = False
+    for name, current in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+
+        checks = []
+        if previous.get('p95_ms') and current.get('p95_ms'):
+            change = current['p95_ms'] / previous['p95_ms'] - 1
+            checks.append(('p95', change, change > max_regression))
+        if previous.get('rps') and current.get('rps') is not None:
+            change = current['rps'] / previous['rps'] - 1
+            checks.append(('rps', change, -change > max_regression))
+
+        for metric, change, failed in checks:
+            marker = 'REGRESSION' if failed else 'ok'
+            print(f"  {name:<22} {metric:<4} {change:+.1%}  {marker}")
+            regressed = regressed or failed
+    return regressed
+
+def print_report(report):
+    print(f"\n{'operation':<22} {'reqs':>6} {'errs':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'ttft p95':>9}")
+    for name, entry in report['results'].items():
+        print(f"{name:<22} {entry['requests']:>6} {entry['errors']:>5} {entry['rps']:>8} "
+              f"{_ms(entry['p50_ms']):>8} {_ms(entry['p95_ms']):>8} {_ms(entry['p99_ms']):>8} "
+              f"{_ms(entry.get('ttft_p95_ms')):>9}")
+        for kind, count in entry['error_kinds'].items():
+            print(f"{'':<22}   {count} x {kind}")
+
+    if report['memory']:
+        print(f"\n{'pid':<8} {'rss MB':>8} {'peak MB':>8}  command")
+        for pid, entry in report['memory'].items():
+            print(f"{pid:<8} {entry['rss_mb']:>8} {entry['peak_rss_mb']:>8}  {entry['command']}")
+
+def _ms(value):
+    return '-' if value is None else f"{value:.0f}ms"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load test the prompt generator API')
+    parser.add_argument('--base-url', default='http://127.0.0.1:5001', help='Server under test')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"Comma-separated: {', '.join(SCENARIOS)}")
+    parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight per scenario')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds per scenario (0 to use --requests)')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario when --duration is 0')
+    parser.add_argument('--warmup', type=int, default=4, help='Unrecorded requests before each scenario')
+    parser.add_argument('--timeout', type=float, default=120.0, help='Per-request timeout in seconds')
+    parser.add_argument('--model-id', type=int, help='Model to execute with (default: the default model)')
+    parser.add_argument('--stub-url', help='Register this stub provider as a temporary default model, e.g. http://127.0.0.1:8900/v1')
+    parser.add_argument('--stub-api-type', default='openai', choices=['openai', 'anthropic'])
+    parser.add_argument('--max-tokens', type=int, default=128)
+    parser.add_argument('--language', default='english', choices=['chinese', 'english'])
+    parser.add_argument('--repeat-prompts', action='store_true', help='Send identical prompts (exercises caching and coalescing)')
+    parser.add_argument('--server-pid', type=int, nargs='*', default=[], help='Server worker pids to sample memory from')
+    parser.add_argument('--server-match', default=r'gunicorn|uvicorn|run\.py|asgi\.py',
+                        help='Regex on process command lines used to find server workers when --server-pid is not given')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--baseline', help='Compare against a JSON report from an earlier run')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='Allowed p95/rps regression against --baseline')
+    return parser.parse_args()
+
+async def main(options):
+    scenarios = [scenario.strip() for scenario in options.scenarios.split(',') if scenario.strip()]
+    unknown = [scenario for scenario in scenarios if scenario not in RUNNERS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)}")
+
+    limits = httpx.Limits(max_connections=options.concurrency * 2, max_keepalive_connections=options.concurrency)
+    async with httpx.AsyncClient(base_url=options.base_url, timeout=options.timeout, limits=limits) as client:
+        previous_default = None
+        if options.stub_url:
+            previous_default = await setup_stub_model(client, options)
+
+        memory = MemorySampler(options.server_pid, options.server_match)
+        stop_sampling = asyncio.Event()
+        sampler = asyncio.create_task(memory.run(stop_sampling))
+
+        results = {}
+        try:
+            for scenario in scenarios:
+                print(f"Running {scenario} (concurrency {options.concurrency})...", flush=True)
+                results.update(await run_scenario(client, scenario, options))
+        finally:
+            stop_sampling.set()
+            await sampler
+            if options.stub_url:
+                await cleanup_stub_model(client, options, previous_default)
+
+    report = {
+        'base_url': options.base_url,
+        'concurrency': options.concurrency,
+        'duration': options.duration,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+        'memory': memory.report(),
+    }
+    print_report(report)
+
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"\nReport written to {options.output}")
+
+    if options.baseline:
+        with open(options.baseline) as file:
+            baseline = json.load(file)
+        print(f"\nCompared to {options.baseline}:")
+        if compare_to_baseline(report, baseline, options.max_regression):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
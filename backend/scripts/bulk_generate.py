@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Generate prompts for every row of a CSV or JSONL file through a running server.
+
+Each row needs a user_description and may set id, template_id, language and
+name (the name of the saved prompt). Rows are generated concurrently by
+/api/generate-prompt/bulk and their results are appended to the output file
+as NDJSON as they finish:
+
+    python scripts/bulk_generate.py use_cases.csv --output results.jsonl --save-prompt
+
+The run id is printed when the run starts. If the run is interrupted, run the
+same command again with --run-id to generate only the rows that have not
+succeeded yet:
+
+    python scripts/bulk_generate.py use_cases.csv --output results.jsonl --save-prompt --run-id <run id>
+"""
+import argparse
+import json
+import os
+import sys
+
+import httpx
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('file', help='CSV or JSONL file of rows to generate')
+    parser.add_argument('--base-url', default='http://127.0.0.1:5001', help='Server to generate with')
+    parser.add_argument('--output', help='NDJSON file to append results to (default: stdout)')
+    parser.add_argument('--run-id', help='Resume this run, skipping the rows that already succeeded')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='File format (default: from the file extension)')
+    parser.add_argument('--temperature', type=float, default=0.7)
+    parser.add_argument('--max-concurrency', type=int, help="Rows in flight at once (capped by the model's limit)")
+    parser.add_argument('--save-prompt', action='store_true', help='Save each generated prompt')
+    parser.add_argument('--prompt-name', default='Generated Prompt', help='Name of saved prompts for rows without a name')
+    parser.add_argument('--timeout', type=float, default=600.0, help='Seconds to wait for the next result')
+    return parser.parse_args()
+
+def main(options) -> int:
+    form = {
+        'temperature': str(options.temperature),
+        'save_prompt': 'true' if options.save_prompt else 'false',
+        'prompt_name': options.prompt_name,
+    }
+    if options.run_id:
+        form['run_id'] = options.run_id
+    if options.format:
+        form['format'] = options.format
+    if options.max_concurrency:
+        form['max_concurrency'] = str(options.max_concurrency)
+
+    output = open(options.output, 'a', encoding='utf-8') if options.output else sys.stdout
+    summary = None
+    try:
+        with open(options.file, 'rb') as upload, httpx.Client(base_url=options.base_url, timeout=options.timeout) as client:
+            files = {'file': (os.path.basename(options.file), upload)}
+            with client.stream('POST', '/api/generate-prompt/bulk', data=form, files=files) as response:
+                if response.status_code != 200:
+                    response.read()
+                    print(f"Request failed ({response.status_code}): {response.text}", file=sys.stderr)
+                    return 1
+
+                run_id = response.headers.get('X-Run-Id')
+                print(f"Run {run_id} (resume with --run-id {run_id})", file=sys.stderr, flush=True)
+
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    item = json.loads(line)
+                    if item.get('done'):
+                        summary = item
+                    elif 'saved' in item:
+                        print(f"Saved {len(item['saved'])} rows", file=sys.stderr, flush=True)
+                    else:
+                        output.write(line + '\n')
+                        output.flush()
+                        if 'error' in item:
+                            print(f"Row {item['row_id']} failed: {item['error']}", file=sys.stderr, flush=True)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    if summary is None:
+        print("The run ended before it finished; run again with --run-id to resume", file=sys.stderr)
+        return 1
+
+    print(f"{summary['succeeded']} succeeded, {summary['failed']} failed, {summary['skipped']} skipped "
+          f"(already done), {summary['prompts_saved']} prompts saved", file=sys.stderr)
+    return 1 if summary['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""
+Download the tiktoken BPE files into the local tokenizer cache.
+
+Run it where the internet is reachable (e.g. while building the image) so
+air-gapped deployments never download at runtime:
+
+    python scripts/download_tiktoken.py
+    python scripts/download_tiktoken.py --cache-dir /opt/tiktoken --encoding p50k_base
+
+By default it fetches the encodings preloaded by [tokenizer] in config.toml,
+the default encoding and every encoding named in [tokenizer.model_encodings].
+"""
+import argparse
+import os
+import sys
+
+# Add the parent directory to path so we can import the app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.config.config import config
+from app.services.tokenizer_registry import cache_dir
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cache-dir', default=None,
+                        help='Directory to write the BPE files to (default: the [tokenizer] cache dir)')
+    parser.add_argument('--encoding', action='append', default=[],
+                        help='Additional encoding to download (repeatable)')
+    return parser.parse_args()
+
+def main(options) -> int:
+    directory = options.cache_dir or str(cache_dir())
+    os.makedirs(directory, exist_ok=True)
+    # tiktoken把下载的文件写入该目录，运行时从同一目录读取
+    os.environ['TIKTOKEN_CACHE_DIR'] = directory
+
+    import tiktoken
+
+    settings = config.tokenizer
+    names = [*settings.preload, settings.default_encoding, *settings.model_encodings.values(), *options.encoding]
+
+    failed = 0
+    for name in dict.fromkeys(names):
+        try:
+            tiktoken.get_encoding(name)
+            print(f"{name}: ok")
+        except Exception as e:
+            print(f"{name}: failed ({e})")
+            failed += 1
+
+    print(f"Tokenizer cache: {directory}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
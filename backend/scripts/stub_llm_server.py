@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+"""
+Offline stand-in for the LLM providers, for load tests and local development.
+
+Speaks enough of the OpenAI chat completions API (POST /v1/chat/completions)
+and the Anthropic messages API (POST /v1/messages) for the official SDKs,
+including streaming. Latency, time-to-first-token, token rate and errors are
+configurable, so the service can be benchmarked without paying a provider.
+System prompts are treated as cached after their first request, and the usage
+reports them as cached tokens the way each provider does.
+
+Point a model at it with base_url http://127.0.0.1:8900/v1 (api_type openai)
+or http://127.0.0.1:8900 (api_type anthropic), and any api_key.
+
+Usage:
+    python scripts/stub_llm_server.py --port 8900 --ttft 0.3 --tokens-per-second 80 --error-rate 0.01
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "the prompt describes a role with clear goals constraints and examples so the model "
+    "can follow a structured workflow and produce consistent output for every request"
+).split()
+
+class StubState:
+    """Request counters shared by all handler threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'streams': 0, 'errors': 0, 'in_flight': 0, 'max_in_flight': 0,
+                       'cached_tokens': 0}
+        self.prefixes = set()
+
+    def begin(self, stream):
+        with self.lock:
+            self.counts['requests'] += 1
+            self.counts['streams'] += int(bool(stream))
+            self.counts['in_flight'] += 1
+            self.counts['max_in_flight'] = max(self.counts['max_in_flight'], self.counts['in_flight'])
+
+    def end(self, error=False):
+        with self.lock:
+            self.counts['in_flight'] -= 1
+            self.counts['errors'] += int(error)
+
+    def cached_tokens(self, prefix) -> int:
+        """Tokens of a system prompt that an earlier request already sent (0 on first sight)"""
+        if not prefix:
+            return 0
+        with self.lock:
+            if prefix not in self.prefixes:
+                self.prefixes.add(prefix)
+                return 0
+            tokens = len(prefix.split())
+            self.counts['cached_tokens'] += tokens
+            return tokens
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    options = None
+    state = None
+
+    def log_message(self, format, *args):
+        if self.options.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        if self.path.rstrip('/') in ('/v1/models', '/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'stub-model', 'object': 'model', 'owned_by': 'stub'}]})
+        elif self.path.rstrip('/') == '/stats':
+            self._send_json(200, self.state.snapshot())
+        else:
+            self._send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._send_json(400, {'error': {'message': 'Invalid JSON body'}})
+            return
+
+        path = self.path.rstrip('/')
+        if path.endswith('/chat/completions'):
+            provider = 'openai'
+        elif path.endswith('/messages'):
+            provider = 'anthropic'
+        else:
+            self._send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+            return
+
+        stream = bool(body.get('stream'))
+        self.state.begin(stream)
+        failed = False
+        try:
+            failed = self._inject_error(provider)
+            if failed:
+                return
+
+            words = self._completion_words(body)
+            prompt_tokens = _count_prompt_tokens(body)
+            cached_tokens = self.state.cached_tokens(_system_text(body))
+            if provider == 'openai':
+                self._openai(body, words, prompt_tokens, cached_tokens, stream)
+            else:
+                self._anthropic(body, words, prompt_tokens, cached_tokens, stream)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端中途断开或取消了请求
+            failed = True
+        finally:
+            self.state.end(failed)
+
+    def _inject_error(self, provider) -> bool:
+        """Fail or hang this request according to the error options; returns True if it did"""
+        options = self.options
+        if options.hang_rate and random.random() < options.hang_rate:
+            time.sleep(options.hang_seconds)
+
+        if not options.error_rate or random.random() >= options.error_rate:
+            return False
+
+        time.sleep(self._latency())
+        status = random.choice(options.error_status)
+        message = f'Injected stub error ({status})'
+        if provider == 'openai':
+            payload = {'error': {'message': message, 'type': 'server_error', 'code': None}}
+        else:
+            payload = {'type': 'error', 'error': {'type': 'api_error', 'message': message}}
+
+        headers = {'Retry-After': str(options.retry_after)} if status == 429 else {}
+        self._send_json(status, payload, headers)
+        return True
+
+    def _completion_words(self, body):
+        max_tokens = body.get('max_tokens') or body.get('max_completion_tokens') or self.options.output_tokens
+        count = max(1, min(self.options.output_tokens, int(max_tokens)))
+        return [random.choice(WORDS) for _ in range(count)]
+
+    def _latency(self) -> float:
+        jitter = random.uniform(-self.options.jitter, self.options.jitter) if self.options.jitter else 0.0
+        return max(0.0, self.options.ttft + jitter)
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.options.tokens_per_second if self.options.tokens_per_second else 0.0
+
+    def _openai(self, body, words, prompt_tokens, cached_tokens, stream):
+        model = body.get('model', 'stub-model')
+        completion_id = f'chatcmpl-{uuid.uuid4().hex[:24]}'
+        created = int(time.time())
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': len(words),
+            'total_tokens': prompt_tokens + len(words),
+            'prompt_tokens_details': {'cached_tokens': cached_tokens}
+        }
+
+        time.sleep(self._latency())
+        if not stream:
+            time.sleep(self._token_delay() * len(words))
+            self._send_json(200, {
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': created,
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': ' '.join(words)},
+                    'finish_reason': 'stop'
+                }],
+                'usage': usage
+            })
+            return
+
+        self._start_stream()
+        for index, word in enumerate(words):
+            self._send_sse({
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'delta': {'content': word if index == 0 else ' ' + word}, 'finish_reason': None}]
+            })
+            time.sleep(self._token_delay())
+
+        self._send_sse({
+            'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]
+        })
+        if (body.get('stream_options') or {}).get('include_usage'):
+            self._send_sse({
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                'choices': [], 'usage': usage
+            })
+        self._send_chunk(b'data: [DONE]\n\n')
+        self._end_stream()
+
+    def _anthropic(self, body, words, prompt_tokens, cached_tokens, stream):
+        model = body.get('model', 'stub-model')
+        message_id = f'msg_{uuid.uuid4().hex[:24]}'
+        # Anthropic只缓存带cache_control的内容，input_tokens不含缓存读写的部分
+        cacheable = _has_cache_control(body.get('system'))
+        cache_read = cached_tokens if cacheable else 0
+        cache_write = len(_system_text(body).split()) if cacheable and not cached_tokens else 0
+        usage = {
+            'input_tokens': prompt_tokens - cache_read - cache_write,
+            'output_tokens': len(words),
+            'cache_read_input_tokens': cache_read,
+            'cache_creation_input_tokens': cache_write
+        }
+
+        time.sleep(self._latency())
+        if not stream:
+            time.sleep(self._token_delay() * len(words))
+            self._send_json(200, {
+                'id': message_id,
+                'type': 'message',
+                'role': 'assistant',
+                'model': model,
+                'content': [{'type': 'text', 'text': ' '.join(words)}],
+                'stop_reason': 'end_turn',
+                'stop_sequence': None,
+                'usage': usage
+            })
+            return
+
+        self._start_stream()
+        self._send_sse({
+            'type': 'message_start',
+            'message': {
+                'id': message_id, 'type': 'message', 'role': 'assistant', 'model': model, 'content': [],
+                'stop_reason': None, 'stop_sequence': None,
+                'usage': {**usage, 'output_tokens': 1}
+            }
+        }, event='message_start')
+        self._send_sse({
+            'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}
+        }, event='content_block_start')
+        for index, word in enumerate(words):
+            self._send_sse({
+                'type': 'content_block_delta', 'index': 0,
+                'delta': {'type': 'text_delta', 'text': word if index == 0 else ' ' + word}
+            }, event='content_block_delta')
+            time.sleep(self._token_delay())
+        self._send_sse({'type': 'content_block_stop', 'index': 0}, event='content_block_stop')
+        self._send_sse({
+            'type': 'message_delta',
+            'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+            'usage': {'output_tokens': len(words)}
+        }, event='message_delta')
+        self._send_sse({'type': 'message_stop'}, event='message_stop')
+        self._end_stream()
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_stream(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def _send_sse(self, payload, event=None):
+        data = f"event: {event}\n" if event else ''
+        data += f"data: {json.dumps(payload)}\n\n"
+        self._send_chunk(data.encode('utf-8'))
+
+    def _send_chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+def _count_prompt_tokens(body) -> int:
+    """Rough prompt size (words) for the usage numbers"""
+    texts = [_content_text(body.get('system'))]
+    texts.extend(_content_text(message.get('content')) for message in body.get('messages', []))
+    return max(1, sum(len(text.split()) for text in texts))
+
+def _system_text(body) -> str:
+    """The system prompt of a request: Anthropic's system field or OpenAI's system messages"""
+    if body.get('system'):
+        return _content_text(body['system'])
+    return ' '.join(_content_text(message.get('content')) for message in body.get('messages', [])
+                    if message.get('role') == 'system')
+
+def _has_cache_control(content) -> bool:
+    return isinstance(content, list) and any(isinstance(part, dict) and part.get('cache_control') for part in content)
+
+def _content_text(content) -> str:
+    """Text of a message content, given as a string or a list of content blocks"""
+    if isinstance(content, list):
+        return ' '.join(part.get('text', '') for part in content if isinstance(part, dict))
+    return str(content or '')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Stub OpenAI/Anthropic server for load testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--ttft', type=float, default=0.2, help='Seconds before the first token (or the whole response)')
+    parser.add_argument('--jitter', type=float, default=0.05, help='Random +/- seconds added to --ttft')
+    parser.add_argument('--tokens-per-second', type=float, default=100.0, help='Output rate after the first token (0 = instant)')
+    parser.add_argument('--output-tokens', type=int, default=60, help='Tokens per completion (capped by max_tokens)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail')
+    parser.add_argument('--error-status', type=int, nargs='+', default=[500], help='Status codes for injected errors')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with injected 429s')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='Fraction of requests that stall before answering')
+    parser.add_argument('--hang-seconds', type=float, default=30.0, help='How long stalled requests stall')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible runs')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    return parser.parse_args()
+
+def main():
+    options = parse_args()
+    if options.seed is not None:
+        random.seed(options.seed)
+
+    StubHandler.options = options
+    StubHandler.state = StubState()
+
+    server = ThreadingHTTPServer((options.host, options.port), StubHandler)
+    server.daemon_threads = True
+    print(f"Stub LLM server on http://{options.host}:{options.port} "
+          f"(ttft {options.ttft}s, {options.tokens_per_second} tok/s, error rate {options.error_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
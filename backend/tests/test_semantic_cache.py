@@ -0,0 +1,39 @@
+import pytest
+
+from app.config.config import SemanticCacheSettings
+from app.services.semantic_cache import SemanticCache
+
+# 默认设置下的缓存，不读取config.toml
+cache = SemanticCache(SemanticCacheSettings({}))
+
+def similarity(first: str, second: str) -> float:
+    return float(cache.embed(first) @ cache.embed(second))
+
+@pytest.mark.parametrize('first, second', [
+    ("Write a customer service assistant prompt for a bank",
+     "Write a customer service assistant prompt for an airline"),
+    ("A customer support chatbot for a bank that answers questions about accounts and cards",
+     "A customer support chatbot for an airline that answers questions about accounts and cards"),
+    ("Translate technical documents from English into French",
+     "Translate technical documents from French into English"),
+    ("Translate the user's text from English into French, keeping the tone",
+     "Translate the user's text from French into English, keeping the tone"),
+    ("Summarize news articles in three bullet points",
+     "Summarize news articles in five bullet points"),
+    ("写一个帮助用户把英文翻译成中文的提示词",
+     "写一个帮助用户把中文翻译成英文的提示词"),
+])
+def test_near_misses_stay_below_the_default_threshold(first, second):
+    assert similarity(first, second) < cache.settings.threshold
+
+@pytest.mark.parametrize('first, second', [
+    ("Write a customer service assistant prompt for a bank",
+     "write a customer  service assistant prompt for a Bank"),
+    ("Write a customer service assistant prompt for a bank",
+     "Write a customer service assistant prompt for a bank."),
+])
+def test_trivial_variants_reach_the_default_threshold(first, second):
+    assert similarity(first, second) >= cache.settings.threshold
+
+def test_disabled_by_default():
+    assert not cache.settings.enabled